@@ -1,5 +1,13 @@
 from .utils import *
+from .node_store import *
+from .dom_diff import *
+from .dom_extraction import *
+from .selector_index import *
+from .observation_budget import *
 from .build_tree import *
 from .active_elements import *
 from .actions import *
+from .browser_pool import *
+from .domain_throttle import *
+from .page_settle import *
 from .async_env import *
@@ -1,21 +1,25 @@
-from .utils import ElementNode, ConditionTagNameList, TypeList
-import re
+from array import array
+
+from .utils import ElementNode, TagNameSet, ConditionTagNameSet, TypeSet, \
+    LabelCodeDict, TagLabelDict, InputTypeLabelDict, RoleLabelDict, DisableableLabelSet
 
 
 class ActiveElements:
     @staticmethod
     def is_visiable(element: ElementNode, only_child_check=True):
-        style = element["attributes"].get('style')
+        return ActiveElements.attributes_visible(element["attributes"], only_child_check)
+
+    @staticmethod
+    def attributes_visible(attributes, only_child_check=True) -> bool:
+        style = attributes.get('style')
         if style and ('display: none' in style or 'opacity: 0' in style):
             return False
-        aria_hidden = element["attributes"].get('aria-hidden')
-        if aria_hidden == 'true':
+        if attributes.get('aria-hidden') == 'true':
             return False
         if only_child_check:
-            visibility = element["attributes"].get('style')
-            if visibility and ('visibility: hidden' in visibility or 'visibility: collapse' in visibility):
+            if style and ('visibility: hidden' in style or 'visibility: collapse' in style):
                 return False
-            rect = element["attributes"].get('rect')
+            rect = attributes.get('rect')
             if rect and (rect['width'] == 0 or rect['height'] == 0):
                 return False
         return True
@@ -25,73 +29,31 @@ class ActiveElements:
         if element is None:
             return False
         tag = ActiveElements.get_element_tagName(element)
-        if tag == 'input' and element["attributes"].get('type') == 'hidden':
-            return False
-        if tag in ['select', 'option'] and element["attributes"].get('disabled'):
+        return ActiveElements.label_interactive(tag, element["attributes"])
+
+    @staticmethod
+    def label_interactive(label: str, attributes) -> bool:
+        if label == 'input' and attributes.get('type') == 'hidden':
             return False
-        if tag in ['input', 'textarea', 'button', 'a'] and element["attributes"].get('disabled'):
+        if label in DisableableLabelSet and attributes.get('disabled'):
             return False
         return True
 
     @staticmethod
     def get_element_tagName(element: ElementNode) -> str:
-        tag_name = element["tagName"].lower()
+        return ActiveElements.tag_label(element["tagName"].lower(), element["attributes"])
+
+    @staticmethod
+    def tag_label(tag_name: str, attributes) -> str:
+        """Observation label of a lower-case tag, from the tag, input type and role tables"""
         if tag_name == 'input':
-            input_type = element["attributes"].get('type')
-            if input_type == 'checkbox':
-                return 'checkbox'
-            elif input_type == 'radio':
-                return 'radio'
-            elif input_type == 'button':
-                return 'button'
-            else:
-                return 'input'
-        elif tag_name == 'select':
-            return 'select'
-        elif tag_name == 'optgroup':
-            return 'optgroup'
-        elif tag_name == 'textarea':
-            return 'textarea'
-        elif tag_name == 'option':
-            return 'option'
-        elif tag_name == 'datalist':
-            return 'datalist'
-        # elif tag_name == 'label':
-        #     return 'label'
-        elif tag_name == 'button':
-            return 'button'
-        elif tag_name == 'a':
-            return 'link'
-        elif tag_name in ConditionTagNameList:
-            role = element["attributes"].get('role')
-            if not role:
-                return 'unknown'
-            elif role == 'button':
-                return 'button'
-            elif role == 'link':
-                return 'link'
-            elif role == 'menuitem':
-                return 'link'
-            elif role == 'textbox':
-                return 'input'
-            elif role == 'checkbox':
-                return 'checkbox'
-            elif role == 'radio':
-                return 'radio'
-            elif role == 'tab':
-                return 'link'
-            elif role == 'switch':
-                return 'switch'
-            elif role == 'option':
-                return 'option'
-            elif role == 'row':
-                return 'row'
-            elif role == 'search-box':
-                return 'search-box'
-            else:
-                return 'unknown'
-        else:
-            return 'unknown'
+            return InputTypeLabelDict.get(attributes.get('type'), 'input')
+        label = TagLabelDict.get(tag_name)
+        if label is not None:
+            return label
+        if tag_name in ConditionTagNameSet:
+            return RoleLabelDict.get(attributes.get('role'), 'unknown')
+        return 'unknown'
 
     @staticmethod
     def is_valid_element(element: ElementNode) -> bool:
@@ -99,23 +61,51 @@ class ActiveElements:
 
     @staticmethod
     def get_element_value(element: ElementNode) -> str:
-        if element["text"] and element["text"] != "":
-            return element["text"]
-        title = element['attributes'].get('title')
-        if title:
-            return title
-        placeholder = element['attributes'].get('placeholder')
-        if placeholder:
-            return placeholder
-        aria_label = element['attributes'].get('aria-label')
-        if aria_label:
-            return aria_label
-        aria_checked = element['attributes'].get('aria-checked')
-        if aria_checked:
-            return aria_checked
-        element_type = element["attributes"].get('type')
-        if element_type in TypeList:
+        return ActiveElements.node_value(element["tagName"], element["text"], element["attributes"])
+
+    @staticmethod
+    def node_value(tag_name: str, text: str, attributes) -> str:
+        if text:
+            return text
+        for name in ('title', 'placeholder', 'aria-label', 'aria-checked'):
+            value = attributes.get(name)
+            if value:
+                return value
+        element_type = attributes.get('type')
+        if element_type in TypeSet:
             return element_type
-        if element["tagName"] == "select":
+        if tag_name == "select":
             return "Select an option value"
         return ""
+
+    @staticmethod
+    def classify_store(store) -> None:
+        """Classify every node of a NodeStore in one call and cache the result
+        on it: `label_code` holds the LabelList index of each node's label and
+        `self_valid` whether the node itself, ignoring its descendants, is a
+        valid element. Tag-level decisions are made once per distinct tag."""
+        node_count = len(store)
+        label_code = array("b", bytes(node_count))
+        self_valid = bytearray(node_count)
+        tag_lower = [tag.lower() if isinstance(tag, str) else None for tag in store.tag_names]
+        tag_checked = [tag in TagNameSet for tag in store.tag_names]
+        raw_nodes = store.raw_nodes
+        tag_id = store.tag_id
+        for idx in range(node_count):
+            tag_name = tag_lower[tag_id[idx]]
+            if tag_name is None:
+                continue
+            rawNode = raw_nodes[idx]
+            label = ActiveElements.tag_label(tag_name, rawNode)
+            if label != 'unknown':
+                label_code[idx] = LabelCodeDict[label]
+            if tag_checked[tag_id[idx]] and ActiveElements.label_interactive(label, rawNode) \
+                    and ActiveElements.attributes_visible(rawNode):
+                self_valid[idx] = True
+        store.label_code = label_code
+        store.self_valid = self_valid
+
+
+__all__ = [
+    "ActiveElements"
+]
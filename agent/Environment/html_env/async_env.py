@@ -14,14 +14,45 @@ import base64
 import re
 
 from .actions import Action, ActionTypes
+from .browser_pool import BrowserPool
 from .build_tree import HTMLTree
+from .domain_throttle import DomainThrottle
+from .page_settle import PageSettler, SettleCeilingDict
+from .dom_diff import DOM_MUTATION_OBSERVER_SCRIPT
+from .dom_extraction import DOM_EXTRACTION_SCRIPT, DOM_EXTRACTION_RULES
+from .observation_budget import select_within_budget, select_in_viewport
 from .utils import stringfy_value
 import time
 
+from agent.LLM import count_tokens
 from agent.Prompt import *
 from logs import logger
 
 
+# Evaluated with page.evaluate(SCROLL_SCRIPT, "down" or "up"). Scrolls by
+# most of a viewport in one round trip.
+SCROLL_SCRIPT = r'''
+(direction) => {
+    const viewportHeight = window.innerHeight;
+    const previousScrollY = window.pageYOffset;
+    if (direction === 'down') {
+        const totalHeight = document.body.scrollHeight;
+        if (totalHeight < viewportHeight) {
+            window.scrollBy(0, 500);
+        }
+        const currentScroll = window.pageYOffset;
+        if (totalHeight - currentScroll - viewportHeight <= viewportHeight) {
+            window.scrollTo(0, document.body.scrollHeight);
+        } else {
+            window.scrollTo(0, currentScroll + viewportHeight * 0.75);
+        }
+    } else if (previousScrollY > 0) {
+        window.scrollTo(0, previousScrollY < viewportHeight ? 0 : previousScrollY - viewportHeight / 2);
+    }
+}
+'''
+
+
 class ActionExecutionError(Exception):
     """Custom action execution exception class"""
 
@@ -50,61 +81,169 @@ class AsyncHTMLEnvironment:
         save_trace_enabled: bool = False,
         sleep_after_execution: float = 0.0,
         locale: str = "en-US",
-        use_vimium_effect=True
+        use_vimium_effect=True,
+        incremental_observation: bool = False,
+        changed_elements_only: bool = False,
+        observation_backend: str = "lxml",
+        viewport_margin: int = 0,
+        browser_pool: Union[BrowserPool, None] = None,
+        domain_throttle: Union[DomainThrottle, None] = None,
+        page_settler: Union[PageSettler, None] = None,
+        adaptive_page_settle: bool = True,
+        settle_ceilings: Union[dict, None] = None
     ):
         self.use_vimium_effect = use_vimium_effect
         self.mode = mode
+        self.max_page_length = max_page_length
         self.headless = headless
         self.slow_mo = slow_mo
+        # Viewport-only observations leave out elements farther than
+        # viewport_margin pixels outside the viewport
         self.current_viewport_only = current_viewport_only
+        self.viewport_margin = viewport_margin
         self.reset_finished = False
         self.viewport_size = viewport_size
         self.save_trace_enabled = save_trace_enabled
         self.sleep_after_execution = sleep_after_execution
-        self.tree = HTMLTree()
+        # Incremental observation keeps element numbers stable across steps and
+        # skips re-parsing when the page reports no DOM mutation since the last one
+        self.incremental_observation = incremental_observation or changed_elements_only
+        self.changed_elements_only = changed_elements_only
+        self.tree = HTMLTree(incremental=self.incremental_observation)
+        # (page, navigations, url, DOM version) of the last observation, the
+        # same key get_snapshot_state uses for page.content()
+        self.observed_state = None
+        self.last_dom_tree = ""
+        # page.content() is captured lazily, at most once per page state: a
+        # page, its navigations and the DOM version of the mutation observer
+        self.html_content = ""
+        self.snapshot_state = None
+        self.navigation_count = 0
+        # Main frame navigation requests, a navigation has started but not
+        # committed while this runs ahead of navigation_count
+        self.navigation_request_count = 0
+        self.snapshot_stats = {"captures": 0, "reuses": 0}
+        # Numbers of the elements in the last viewport-only observation
+        self.viewport_element_nums = set()
+        # "lxml" parses page.content() in Python, "browser" runs
+        # DOM_EXTRACTION_SCRIPT and only transfers the interactive nodes
+        if observation_backend not in ("lxml", "browser"):
+            raise ValueError(
+                f"Unknown observation backend {observation_backend}")
+        self.observation_backend = observation_backend
+        # Size of the last observation, recorded in the token_results files
+        self.observation_stats = {"tokens": 0, "elements": 0, "elided": 0}
         self.locale = locale
+        # With a pool, setup takes a fresh context of the pool's browser and
+        # close only releases it, headless and slow_mo are the pool's
+        self.browser_pool = browser_pool
+        # Shared by environments running concurrently, spaces out page loads per domain
+        self.domain_throttle = domain_throttle
+        # After actions, wait until the page settles, at most the ceiling of
+        # the action in ms. Without adaptive_page_settle the ceilings are slept.
+        self.page_settler = (page_settler or PageSettler()) if adaptive_page_settle else None
+        self.settle_ceilings = {**SettleCeilingDict, **(settle_ceilings or {})}
         self.context = None
         self.browser = None
+        self.playwright = None
 
     async def page_on_handler(self, page):
         self.page = page
+        page.on("framenavigated", self.frame_navigated_handler)
+        page.on("request", self.request_handler)
+        if self.page_settler is not None:
+            self.page_settler.watch(page)
+
+    def frame_navigated_handler(self, frame):
+        if frame.parent_frame is None:
+            self.navigation_count += 1
+
+    def request_handler(self, request):
+        if request.is_navigation_request() and request.frame.parent_frame is None:
+            self.navigation_request_count += 1
+
+    def navigation_state(self) -> tuple:
+        """Recorded before an action, so the page settler can tell whether
+        the action started a navigation"""
+        return (self.page.url, self.navigation_request_count, self.navigation_count)
 
     async def setup(self, start_url: str) -> None:
-        self.playwright = await async_playwright().start()
-        self.browser = await self.playwright.chromium.launch(
-            headless=self.headless, slow_mo=self.slow_mo
-        )
-        self.context = await self.browser.new_context(
-            viewport=self.viewport_size,
-            device_scale_factor=1,
-            locale=self.locale
-        )
+        if self.browser_pool is not None:
+            if self.context is not None:
+                await self.browser_pool.release(self.context)
+            self.context = await self.browser_pool.new_context(
+                viewport=self.viewport_size,
+                device_scale_factor=1,
+                locale=self.locale
+            )
+        else:
+            self.playwright = await async_playwright().start()
+            self.browser = await self.playwright.chromium.launch(
+                headless=self.headless, slow_mo=self.slow_mo
+            )
+            self.context = await self.browser.new_context(
+                viewport=self.viewport_size,
+                device_scale_factor=1,
+                locale=self.locale
+            )
         self.context.on("page", self.page_on_handler)
+        await self.context.add_init_script(DOM_MUTATION_OBSERVER_SCRIPT)
+        self.snapshot_state = None
+        if self.incremental_observation:
+            self.tree.reset_identities()
+            self.observed_state = None
+            self.viewport_element_nums = set()
         if start_url:
             self.page = await self.context.new_page()
             # await self.page.set_viewport_size({"width": 1080, "height": 720}) if not self.mode == "dom" else None
-            await self.page.goto(start_url, timeout=10000)
-            await self.page.wait_for_timeout(500)
-            self.html_content = await self.page.content()
+            await self.navigate(start_url, timeout=10000)
+            await self.wait_for_settled("setup")
         else:
             self.page = await self.context.new_page()
             # await self.page.set_viewport_size({"width": 1080, "height": 720}) if not self.mode == "dom" else None
-            self.html_content = await self.page.content()
         # self.last_page = self.page
 
-    async def get_obs(self) -> Union[str, Tuple[str, str]]:
+    async def get_obs(self, token_budget: int = None, user_request: str = "",
+                      token_model: str = "gpt-3.5-turbo",
+                      token_stats: bool = False) -> Union[str, Tuple[str, str]]:
+        """With `token_budget`, the accessibility tree keeps only the elements
+        ranked most useful for `user_request` that fit in that many tokens of
+        the `token_model` tokenizer, and says how many were elided. With
+        current_viewport_only, it only shows elements inside the viewport,
+        and with changed_elements_only only those that came into view or
+        changed since the last observation. The observation is only counted
+        into observation_stats with a token budget or `token_stats`."""
         observation = ""
         observation_VforD = ""
         try:
-            if not self.html_content.strip():
-                self.html_content = await self.retry_content()
-            self.tree.fetch_html_content(self.html_content)
-            logger.info("-- Successfully fetch html content")
+            if self.incremental_observation:
+                dom_tree = await self.get_incremental_dom_tree()
+            else:
+                await self.fetch_tree()
+                dom_tree = self.tree.build_dom_tree()
+            elements = self.tree.dom_elements
+            boxes = None
+            viewport_only = self.current_viewport_only and self.observation_backend == "lxml"
+            if viewport_only:
+                dom_tree, elements, boxes = await self.get_viewport_dom_tree(dom_tree)
+            elif self.changed_elements_only:
+                elements = self.tree.changed_dom_elements()
+            elided_count = 0
+            if token_budget is not None:
+                dom_tree, elided_count = await self.get_budgeted_dom_tree(
+                    token_budget, user_request, token_model, elements, boxes)
+                if self.changed_elements_only and not viewport_only:
+                    dom_tree += self.unchanged_elements_note()
             tab_name = await self.page.title()
-            dom_tree = self.tree.build_dom_tree()
             observation = f"current web tab name is \'{tab_name}\'\n" + dom_tree
             if self.mode in ["d_v", "dom_v_desc", "vision_to_dom"]:
                 observation_VforD = await self.capture()
+            observation_tokens = 0
+            if token_budget is not None or token_stats:
+                observation_tokens = count_tokens(observation, token_model)
+            self.observation_stats = {"tokens": observation_tokens,
+                                      "elements": len(elements),
+                                      "elided": elided_count}
         except Exception as e:
             logger.error(f"-- Failed to fetch html content,error occur {e}")
         if self.mode in ["d_v", "dom_v_desc", "vision_to_dom"]:
@@ -114,6 +253,151 @@ class AsyncHTMLEnvironment:
                 "Successfully fetch html content with observation_VforD:", message)
         return (observation, observation_VforD) if self.mode in ["d_v", "dom_v_desc", "vision_to_dom"] else observation
 
+    async def get_element_boxes(self, node_ids: list) -> Union[list, None]:
+        """Viewport-relative [x, y, width, height] of the given nodes in one
+        evaluate call, None for nodes that are not found or not rendered.
+        Options take the box of their select."""
+        xpaths = [self.tree.get_xpath(node_id) for node_id in node_ids]
+        try:
+            return await self.page.evaluate('''(xpaths) => xpaths.map(xpath => {
+                let element = document.evaluate(
+                    xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+                if (element && (element.tagName === 'OPTION' || element.tagName === 'OPTGROUP')) {
+                    element = element.closest('select');
+                }
+                if (!element || !element.getClientRects().length) {
+                    return null;
+                }
+                const rect = element.getBoundingClientRect();
+                return [rect.x, rect.y, rect.width, rect.height];
+            })''', xpaths)
+        except PlaywrightError as e:
+            logger.error(f"-- Failed to fetch element boxes, error occur {e}")
+            return None
+
+    async def get_viewport_dom_tree(self, dom_tree: str) -> Tuple[str, list, Union[list, None]]:
+        """Keep the lines of the elements intersecting the viewport, with
+        their boxes. The page is not re-read, so after a scroll only the
+        boxes are fetched again. Falls back to `dom_tree` without layout."""
+        elements = self.tree.dom_elements
+        boxes = await self.get_element_boxes([element["nodeId"] for element in elements])
+        if boxes is None:
+            return dom_tree, elements, None
+        elements, boxes, hidden_count = select_in_viewport(
+            elements, boxes, self.viewport_size, self.viewport_margin)
+        repeated_count = 0
+        if self.changed_elements_only:
+            # Element numbers are stable here, so after a scroll only the
+            # region that came into view is shown again
+            changed_nums = {self.tree.key2num[key] for key in self.tree.changed_keys}
+            kept = [i for i, element in enumerate(elements)
+                    if element["num"] not in self.viewport_element_nums or element["num"] in changed_nums]
+            self.viewport_element_nums = {element["num"] for element in elements}
+            repeated_count = len(elements) - len(kept)
+            elements = [elements[i] for i in kept]
+            boxes = [boxes[i] for i in kept]
+        dom_tree = "".join(element["line"] for element in elements)
+        if repeated_count:
+            dom_tree += f"({repeated_count} elements still in view and unchanged since the last observation " \
+                "are not repeated, their numbers are still valid)\n"
+        if hidden_count:
+            dom_tree += f"({hidden_count} elements outside the viewport are not shown, " \
+                "scroll to reveal them)\n"
+        return dom_tree, elements, boxes
+
+    async def get_budgeted_dom_tree(self, token_budget: int, user_request: str, token_model: str,
+                                    elements: list = None, boxes: list = None) -> Tuple[str, int]:
+        if elements is None:
+            elements = self.tree.dom_elements
+        if boxes is None:
+            boxes = await self.get_element_boxes([element["nodeId"] for element in elements])
+        return select_within_budget(
+            elements, token_budget, lambda text: count_tokens(text, token_model),
+            user_request, boxes, self.viewport_size["height"])
+
+    async def fetch_tree(self) -> None:
+        """Load the current page into self.tree with the configured backend.
+        The lxml backend parses the page snapshot of get_html_content."""
+        if self.observation_backend == "browser":
+            rules = DOM_EXTRACTION_RULES
+            if self.current_viewport_only:
+                rules = dict(rules, viewportMargin=self.viewport_margin)
+            nodes = await self.page.evaluate(DOM_EXTRACTION_SCRIPT, rules)
+            self.tree.fetch_extracted_nodes(nodes)
+            logger.info("-- Successfully extract interactive nodes")
+            return
+        await self.get_html_content()
+        if not self.html_content.strip():
+            self.html_content = await self.retry_content()
+        self.tree.fetch_html_content(self.html_content)
+        logger.info("-- Successfully fetch html content")
+
+    async def get_snapshot_state(self) -> Union[tuple, None]:
+        """State the page snapshot is valid for, None when the page has no
+        mutation observer and every snapshot has to be captured again"""
+        try:
+            dom_version = await self.page.evaluate("window.__webcanvasDomVersion")
+        except PlaywrightError:
+            return None
+        if dom_version is None:
+            return None
+        return (id(self.page), self.navigation_count, self.page.url, dom_version)
+
+    async def get_html_content(self) -> str:
+        """page.content() of the current page state. The snapshot is reused
+        until the page navigates or its DOM mutates, so the actions, the
+        observation and the step evaluation share one per step."""
+        state = await self.get_snapshot_state()
+        if state is not None and state == self.snapshot_state:
+            self.snapshot_stats["reuses"] += 1
+            return self.html_content
+        self.html_content = await self.page.content()
+        self.snapshot_state = state
+        self.snapshot_stats["captures"] += 1
+        return self.html_content
+
+    async def get_dom_version(self) -> Union[int, tuple, None]:
+        try:
+            if self.observation_backend == "browser" and self.current_viewport_only:
+                # The extracted nodes also depend on the scroll position
+                version = await self.page.evaluate(
+                    "[window.__webcanvasDomVersion, window.scrollX, window.scrollY]")
+                return None if version[0] is None else tuple(version)
+            return await self.page.evaluate("window.__webcanvasDomVersion")
+        except PlaywrightError:
+            return None
+
+    async def get_incremental_dom_tree(self) -> str:
+        """Re-parse the page only when it navigated or reported DOM mutations
+        since the last observation, and match the new tree against the
+        previous one so elements keep their numbers."""
+        dom_version = await self.get_dom_version()
+        # The version restarts at 0 in every new document, so it only means
+        # something together with the page and its navigation count
+        state = (id(self.page), self.navigation_count, self.page.url, dom_version)
+        if dom_version is not None and state == self.observed_state:
+            self.tree.changed_keys = set()
+            logger.info("-- DOM unchanged since the last observation")
+        else:
+            if self.observed_state is None or state[:3] != self.observed_state[:3]:
+                self.tree.reset_identities()
+                self.viewport_element_nums = set()
+            # Snapshot after reading the version, so the pair stays consistent
+            await self.fetch_tree()
+            self.last_dom_tree = self.tree.build_dom_tree()
+            self.observed_state = state
+        if not self.changed_elements_only:
+            return self.last_dom_tree
+        return self.tree.build_changed_dom_tree() + self.unchanged_elements_note()
+
+    def unchanged_elements_note(self) -> str:
+        unchanged_count = len(self.tree.observation_lines) - \
+            len(self.tree.changed_keys)
+        if not unchanged_count:
+            return ""
+        return f"({unchanged_count} elements unchanged since the last observation are not repeated, " \
+            "their numbers are still valid)\n"
+
     async def reset(self, start_url: str = ""):
         await self.setup(start_url)
 
@@ -137,24 +421,25 @@ class AsyncHTMLEnvironment:
                     url = urljoin(base_url, url)
                 # self.last_page = self.page
                 # self.page = await self.context.new_page()
-                await self.page.goto(url, timeout=10000)
-                await self.page.wait_for_timeout(2000)
-                self.html_content = await self.page.content()
+                await self.navigate(url, timeout=10000)
+                await self.wait_for_settled("link")
             except:
                 try:
                     # self.last_page = self.page
                     selector = rf"{selector}"
+                    before = self.navigation_state()
                     await self.page.evaluate(f'''(selector) => {{
                         var element = document.querySelector(selector);
                         if (element) {{
                             element.click();   
                         }} 
                     }}''', selector)
-                    self.html_content = await self.page.content()
+                    await self.wait_for_settled("click", before)
                 except Exception as e:
                     raise e
         else:
             try:
+                before = self.navigation_state()
                 try:
                     await self.page.locator(selector).click()
                 except:
@@ -165,14 +450,12 @@ class AsyncHTMLEnvironment:
                             element.click();   
                         }} 
                     }}''', selector)
-                await self.page.wait_for_timeout(1000)
-                self.html_content = await self.page.content()
+                await self.wait_for_settled("click", before)
             except Exception as e:
                 raise e
 
     async def goto(self, action):
         await self.load_page_with_retry(action['url'])
-        self.html_content = await self.page.content()
 
     async def fill_search(self, action):
         try:
@@ -189,7 +472,6 @@ class AsyncHTMLEnvironment:
             value = stringfy_value(action['fill_text'])
             await self.page.locator(selector).fill(value)
             await self.page.locator(selector).press("Enter")
-            self.html_content = await self.page.content()
         except:
             try:
                 selector = rf"{selector}"
@@ -204,7 +486,6 @@ class AsyncHTMLEnvironment:
                         }}
                     }}
                 ''', selector)
-                self.html_content = await self.page.content()
             except Exception as e:
                 raise e
 
@@ -222,7 +503,6 @@ class AsyncHTMLEnvironment:
         try:
             value = stringfy_value(action['fill_text'])
             await self.page.locator(selector).fill(value)
-            self.html_content = await self.page.content()
         except:
             try:
                 selector = rf"{selector}"
@@ -235,21 +515,18 @@ class AsyncHTMLEnvironment:
                         }}
                     }}
                 ''', selector)
-                self.html_content = await self.page.content()
             except Exception as e:
                 raise e
 
     async def search(self, action):
-        await self.page.goto("https://www.google.com/search?q="+action["fill_text"], timeout=30000)
-        await self.page.wait_for_timeout(2000)
-        self.html_content = await self.page.content()
+        await self.navigate("https://www.google.com/search?q="+action["fill_text"], timeout=30000)
+        await self.wait_for_settled("search")
 
     async def go_back_last_page(self, action):
         # self.page = self.last_page
         # self.last_page = self.page
         await self.page.go_back()
-        await self.page.wait_for_timeout(2000)
-        self.html_content = await self.page.content()
+        await self.wait_for_settled("go_back")
 
     async def select_option(self, action):
         try:
@@ -286,6 +563,7 @@ class AsyncHTMLEnvironment:
                     None, option, action['fill_text']).ratio()
                 if similarity > best_option[2]:
                     best_option = [i, option, similarity]
+            before = self.navigation_state()
             await self.page.evaluate(f'''(selector) => {{
                 var selectElement = document.querySelector(selector);
                 var options = selectElement.querySelectorAll('option');
@@ -308,8 +586,7 @@ class AsyncHTMLEnvironment:
                     }}
                 }}
             }}''', selector)
-            await self.page.wait_for_timeout(2000)
-            self.html_content = await self.page.content()
+            await self.wait_for_settled("select_option", before)
         except Exception as e:
             raise e
 
@@ -326,7 +603,6 @@ class AsyncHTMLEnvironment:
                 f"selector:{selector},label_name:{label},element_id: {element_id},error ({e}) in hover action.")
         try:
             await self.page.hover(selector)
-            self.html_content = await self.page.content()
         except:
             hover = '''() => {
                         var element = document.querySelector('%s');
@@ -336,41 +612,18 @@ class AsyncHTMLEnvironment:
                     }
                 ''' % selector
             await self.page.evaluate(hover)
-            self.html_content = await self.page.content()
 
-    async def scroll_down(self):
+    async def scroll(self, direction: str) -> None:
         try:
-            total_height = await self.page.evaluate("document.body.scrollHeight")
-            viewport_height = await self.page.evaluate("window.innerHeight")
-            if total_height < viewport_height:
-                await self.page.evaluate("window.scrollBy(0, 500)")
-                self.html_content = await self.page.content()
-            current_scroll = await self.page.evaluate("window.pageYOffset")
-            remaining_height = total_height - current_scroll - viewport_height
-            if remaining_height <= viewport_height:
-                await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-            else:
-                scroll_amount = current_scroll + viewport_height * 0.75
-                await self.page.evaluate(f"window.scrollTo(0, {scroll_amount})")
-            self.html_content = await self.page.content()
+            await self.page.evaluate(SCROLL_SCRIPT, direction)
         except:
-            await self.page.mouse.wheel(0, 100)
-            self.html_content = await self.page.content()
+            await self.page.mouse.wheel(0, 100 if direction == "down" else -100)
+
+    async def scroll_down(self):
+        await self.scroll("down")
 
     async def scroll_up(self):
-        try:
-            viewport_height = await self.page.evaluate("window.innerHeight")
-            current_scroll = await self.page.evaluate("window.pageYOffset")
-            if current_scroll > 0:
-                if current_scroll < viewport_height:
-                    scroll_amount = 0
-                else:
-                    scroll_amount = current_scroll - viewport_height / 2
-                await self.page.evaluate(f"window.scrollTo(0, {scroll_amount})")
-            self.html_content = await self.page.content()
-        except:
-            await self.page.mouse.wheel(0, -100)
-            self.html_content = await self.page.content()
+        await self.scroll("up")
 
     async def execute_action(self, action: Action) -> Union[str, Tuple[str, str]]:
         """
@@ -457,21 +710,21 @@ class AsyncHTMLEnvironment:
                         action['action_type'], error_message) from e
             case ActionTypes.NONE:
                 try:
-                    self.html_content = await self.page.content()
+                    await self.get_html_content()
                 except Exception as e:
                     error_message = f"An error({e}) occur"
                     raise ActionExecutionError(
                         action['action_type'], error_message) from e
             case ActionTypes.CACHE_DATA:
                 try:
-                    self.html_content = await self.page.content()
+                    await self.get_html_content()
                 except Exception as e:
                     error_message = f"An error({e}) occur"
                     raise ActionExecutionError(
                         action['action_type'], error_message) from e
             case ActionTypes.GET_FINAL_ANSWER:
                 try:
-                    self.html_content = await self.page.content()
+                    await self.get_html_content()
                 except Exception as e:
                     error_message = f"An error({e}) occur"
                     raise ActionExecutionError(
@@ -489,6 +742,13 @@ class AsyncHTMLEnvironment:
         return self.page, selector
 
     async def close(self):
+        logger.info(
+            f"-- Page snapshots: {self.snapshot_stats['captures']} captured, "
+            f"{self.snapshot_stats['reuses']} reused")
+        if self.browser_pool is not None:
+            await self.browser_pool.release(self.context)
+            self.context = None
+            return
         await self.context.close()
         await self.browser.close()
         await self.playwright.stop()
@@ -534,11 +794,26 @@ class AsyncHTMLEnvironment:
             return False
         return True
 
+    async def wait_for_settled(self, action: str, before: tuple = None) -> None:
+        """`before` is the navigation_state from before the action"""
+        ceiling = self.settle_ceilings[action]
+        if self.page_settler is None:
+            await self.page.wait_for_timeout(ceiling)
+            return
+        await self.page_settler.wait(self.page, ceiling, self.navigation_state, before)
+
+    async def navigate(self, url: str, timeout: float) -> None:
+        if self.domain_throttle is None:
+            await self.page.goto(url, timeout=timeout)
+            return
+        async with self.domain_throttle.navigation(url):
+            await self.page.goto(url, timeout=timeout)
+
     async def load_page_with_retry(self, url, retries=3, delay=5):
         for attempt in range(retries):
             try:
-                await self.page.goto(url, timeout=20000)
-                await self.page.wait_for_timeout(2000)
+                await self.navigate(url, timeout=20000)
+                await self.wait_for_settled("load_page")
                 return
             except Exception as e:
                 if "Timeout" in str(e):
@@ -556,7 +831,7 @@ class AsyncHTMLEnvironment:
         while retry_count < max_retries:
             try:
                 await self.page.reload()
-                await self.page.wait_for_timeout(3000)
+                await self.wait_for_settled("retry_content")
                 content = await self.page.content()
                 if not content.strip():
                     raise ValueError("Page content is empty")
@@ -0,0 +1,156 @@
+from typing import Union
+import asyncio
+import time
+
+from playwright.async_api import async_playwright, Browser, BrowserContext
+from playwright.async_api import Error as PlaywrightError
+
+from logs import logger
+
+
+class BrowserPool:
+    """Launches Chromium once and hands out a fresh BrowserContext per task.
+
+    Contexts do not share cookies, storage or pages, so tasks stay isolated
+    while the browser process is reused. A browser that disconnected is
+    relaunched, and a browser that served `max_contexts_per_browser`
+    contexts is retired and closed once its last context is released, to
+    bound memory growth over long runs."""
+
+    def __init__(
+        self,
+        headless: bool = True,
+        slow_mo: int = 0,
+        max_contexts_per_browser: int = 50,
+        launch_options: Union[dict, None] = None
+    ):
+        self.headless = headless
+        self.slow_mo = slow_mo
+        self.max_contexts_per_browser = max_contexts_per_browser
+        self.launch_options = launch_options or {}
+        self.playwright = None
+        self.browser = None
+        self.served_contexts = 0
+        # Open contexts per browser, retired browsers included
+        self.active_contexts = {}
+        self.context_browsers = {}
+        self.lock = asyncio.Lock()
+        self.metrics = {
+            "launches": 0,
+            "recycles": 0,
+            "health_check_failures": 0,
+            "contexts_created": 0,
+            "contexts_released": 0,
+            "launch_seconds": 0.0,
+            "context_seconds": 0.0
+        }
+
+    async def start(self) -> None:
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+
+    async def launch(self) -> Browser:
+        await self.start()
+        start_time = time.perf_counter()
+        browser = await self.playwright.chromium.launch(
+            headless=self.headless, slow_mo=self.slow_mo, **self.launch_options)
+        self.metrics["launches"] += 1
+        self.metrics["launch_seconds"] += time.perf_counter() - start_time
+        self.active_contexts[browser] = 0
+        self.served_contexts = 0
+        logger.info("-- Browser pool launched a browser")
+        return browser
+
+    def is_healthy(self, browser: Union[Browser, None]) -> bool:
+        return browser is not None and browser.is_connected()
+
+    async def get_browser(self) -> Browser:
+        """The current browser, relaunched when it disconnected and replaced
+        when it served max_contexts_per_browser contexts"""
+        if self.browser is not None and not self.is_healthy(self.browser):
+            logger.error("-- Browser pool found a disconnected browser, relaunching")
+            self.metrics["health_check_failures"] += 1
+            self.active_contexts.pop(self.browser, None)
+            self.browser = None
+        if self.browser is not None and self.served_contexts >= self.max_contexts_per_browser:
+            self.metrics["recycles"] += 1
+            retired = self.browser
+            self.browser = None
+            if self.active_contexts.get(retired) == 0:
+                await self.close_browser(retired)
+        if self.browser is None:
+            self.browser = await self.launch()
+        return self.browser
+
+    async def new_context(self, **context_options) -> BrowserContext:
+        """A fresh context of a healthy browser, with the keyword arguments
+        of Browser.new_context"""
+        async with self.lock:
+            start_time = time.perf_counter()
+            browser = await self.get_browser()
+            try:
+                context = await browser.new_context(**context_options)
+            except PlaywrightError as e:
+                # The browser died between the health check and the call
+                logger.error(f"-- Browser pool failed to open a context, relaunching: {e}")
+                self.metrics["health_check_failures"] += 1
+                self.active_contexts.pop(browser, None)
+                self.browser = None
+                browser = await self.get_browser()
+                context = await browser.new_context(**context_options)
+            self.served_contexts += 1
+            self.active_contexts[browser] += 1
+            self.context_browsers[context] = browser
+            self.metrics["contexts_created"] += 1
+            self.metrics["context_seconds"] += time.perf_counter() - start_time
+            return context
+
+    async def release(self, context: BrowserContext) -> None:
+        """Close a context from new_context, and its browser if that was retired"""
+        async with self.lock:
+            browser = self.context_browsers.pop(context, None)
+            try:
+                await context.close()
+            except PlaywrightError as e:
+                logger.error(f"-- Browser pool failed to close a context: {e}")
+            self.metrics["contexts_released"] += 1
+            if browser is None or browser not in self.active_contexts:
+                return
+            self.active_contexts[browser] -= 1
+            if browser is not self.browser and self.active_contexts[browser] == 0:
+                await self.close_browser(browser)
+
+    async def close_browser(self, browser: Browser) -> None:
+        self.active_contexts.pop(browser, None)
+        try:
+            await browser.close()
+        except PlaywrightError as e:
+            logger.error(f"-- Browser pool failed to close a browser: {e}")
+
+    async def close(self) -> None:
+        async with self.lock:
+            for context in list(self.context_browsers):
+                try:
+                    await context.close()
+                except PlaywrightError:
+                    pass
+            self.context_browsers = {}
+            for browser in list(self.active_contexts):
+                await self.close_browser(browser)
+            self.browser = None
+            if self.playwright is not None:
+                await self.playwright.stop()
+                self.playwright = None
+
+    def get_metrics(self) -> dict:
+        """Counters plus the mean seconds per launch and per context"""
+        metrics = dict(self.metrics)
+        metrics["open_contexts"] = len(self.context_browsers)
+        metrics["mean_launch_seconds"] = metrics["launch_seconds"] / max(1, metrics["launches"])
+        metrics["mean_context_seconds"] = metrics["context_seconds"] / max(1, metrics["contexts_created"])
+        return metrics
+
+
+__all__ = [
+    "BrowserPool"
+]
@@ -1,240 +1,268 @@
-from collections import deque
 from lxml.html import etree
 from io import StringIO
 
-from .utils import ElementNode, TagNameList, MapTagNameList, stringfy_selector
+from .utils import ElementNode, ObservationElement, MapTagNameSet, LabelList, stringfy_selector
 from .active_elements import ActiveElements
-
-
-import copy
+from .node_store import NodeStore
+from .dom_diff import match_node_keys
+from .selector_index import SelectorIndex
+from logs import logger
 
 
 class HTMLTree:
-    def __init__(self):
-        self.elementNodes = [ElementNode] * 100000
-        self.rawNode2id: dict = {}
-        self.element2id: dict = {}
-        self.id2rawNode: dict = {}
-        self.valid: list[bool] = [False] * 100000
-        self.nodeCounts: int
+    def __init__(self, incremental: bool = False):
+        """With `incremental`, nodes keep a stable key across observations and
+        build_dom_tree numbers elements by that key, so an element shown in an
+        earlier observation keeps its number and build_changed_dom_tree can
+        list only the elements that changed since the previous one."""
+        self.incremental = incremental
+        self.reset_identities()
+        self.reset()
+
+    def reset(self) -> None:
+        self.tree = None
+        self.selector_index = None
+        self.elementNodes = NodeStore()
+        self.nodeCounts: int = 0
         self.nodeDict = {}
         self.element_value = {}
+        self.dom_elements = []
 
-    def fetch_html_content(self, html_content) -> str:
-        self.__init__()
+    def reset_identities(self) -> None:
+        """Forget the previous observation, e.g. after navigating to a new page"""
+        self.elementNodes = NodeStore()
+        self.next_node_key = 0
+        self.key2num = {}
+        self.element_states = {}
+        self.observation_lines = []
+        self.changed_keys = set()
+
+    def fetch_html_content(self, html_content) -> None:
+        """Parse the page and mark valid nodes. The parsed document is never
+        copied or modified, so selectors and xpaths can still be resolved
+        against `self.tree`."""
+        previous = self.elementNodes
+        self.reset()
         parser = etree.HTMLParser()
         self.tree = etree.parse(StringIO(html_content), parser)
-        self.copy_tree = copy.deepcopy(self.tree)
         root = self.tree.getroot()
         self.init_html_tree(root)
-        self.build_html_tree(root)
-        return self.prune_tree()
+        ActiveElements.classify_store(self.elementNodes)
+        self.match_previous(previous)
+        self.prune_tree()
 
-    @staticmethod
-    def build_node(node, idx: int) -> ElementNode:
-        elementNode = ElementNode()
-        elementNode["nodeId"] = idx
-        elementNode["tagName"] = node.tag
-        elementNode["text"] = node.text
-        elementNode["attributes"] = node.attrib
-        elementNode["childIds"] = []
-        elementNode["parentId"] = ""
-        elementNode["siblingId"] = ""
-        elementNode["twinId"] = ""
-        elementNode["depth"] = 1
-        elementNode["htmlContents"] = etree.tostring(
-            node, pretty_print=True).decode()
-        return elementNode
-
-    def build_mapping(self) -> None:
-        self.element2id = {value["nodeId"]: index for index,
-                           value in enumerate(self.elementNodes)}
-        self.id2rawNode = {str(index): value for value,
-                           index in self.rawNode2id.items()}
+    def fetch_extracted_nodes(self, nodes: list) -> None:
+        """Load the node list returned by DOM_EXTRACTION_SCRIPT instead of
+        parsing page HTML. The browser already pruned it and no lxml document
+        is kept."""
+        previous = self.elementNodes
+        self.reset()
+        self.elementNodes = NodeStore.from_extracted(nodes)
+        self.nodeCounts = len(self.elementNodes)
+        ActiveElements.classify_store(self.elementNodes)
+        self.match_previous(previous)
+
+    def match_previous(self, previous: NodeStore) -> None:
+        if self.incremental:
+            self.next_node_key = match_node_keys(
+                previous, self.elementNodes, self.next_node_key)
 
     def init_html_tree(self, root) -> None:
-        node_queue = deque([root])
-        node_id = 0
-        while node_queue:
-            node = node_queue.popleft()
-            self.elementNodes[node_id] = HTMLTree().build_node(node, node_id)
-            self.rawNode2id[node] = node_id
-            node_id += 1
-            for child in node.getchildren():
-                node_queue.append(child)
-        self.build_mapping()
-        self.nodeCounts = node_id
-        self.valid = self.valid[:self.nodeCounts + 1]
-
-    def build_html_tree(self, root) -> None:
-        node_queue = deque([root])
-        root_id = self.rawNode2id[root]
-        self.elementNodes[root_id]["parentId"] = -1
-        while node_queue:
-            node = node_queue.popleft()
-            parent_id = self.rawNode2id[node]
-            tag_st = {}
-            sibling_id = 1
-            for child in node.getchildren():
-                child_id = self.rawNode2id[child]
-                tag_name = self.elementNodes[child_id].get("tagName")
-                tag_st[tag_name] = tag_st.get(tag_name, 0) + 1
-                twin_id = tag_st.get(tag_name)
-                self.elementNodes[parent_id]["childIds"].append(child_id)
-                self.elementNodes[child_id]["parentId"] = parent_id
-                self.elementNodes[child_id]["twinId"] = twin_id
-                self.elementNodes[child_id]["depth"] = self.elementNodes[parent_id]["depth"] + 1
-                self.elementNodes[child_id]["siblingId"] = sibling_id
-                node_queue.append(child)
-                sibling_id += 1
-        self.pruningTreeNode = copy.deepcopy(self.elementNodes)
+        """Walk the lxml DOM once, filling the parent, child, sibling, twin
+        and depth columns of the node store while assigning node ids."""
+        self.elementNodes = NodeStore.from_lxml(root)
+        self.nodeCounts = len(self.elementNodes)
+
+    def get_selector_index(self) -> SelectorIndex:
+        """Selectors and xpaths of all valid nodes, built once per observation"""
+        if self.selector_index is None:
+            self.selector_index = SelectorIndex(self.elementNodes)
+        return self.selector_index
 
     def get_xpath(self, idx: int) -> str:
-        locator_str = ""
-        current_node = self.elementNodes[idx]
-        tag_name = current_node["tagName"]
-        twinId = current_node["twinId"]
-        locator_str = "/" + tag_name + "[" + str(twinId) + "]"
-        while current_node["parentId"] != 0:
-            parentid = current_node["parentId"]
-            current_node = self.elementNodes[parentid]
-            current_tag_name = current_node["tagName"]
-            twinId = current_node["twinId"]
-            locator_str = "/" + current_tag_name + \
-                "[" + str(twinId) + "]" + locator_str
-        parentid = current_node["parentId"]
-        current_node = self.elementNodes[parentid]
-        current_tag_name = current_node["tagName"]
-        return "/" + current_tag_name + locator_str
+        xpath = self.get_selector_index().xpath(idx)
+        if xpath is not None:
+            return xpath
+        store = self.elementNodes
+        if idx == 0:
+            return "/" + store.tag_name(0)
+        locator_str = "/" + store.tag_name(idx) + \
+            "[" + str(store.twin_index[idx]) + "]"
+        current_id = idx
+        while store.parent[current_id] > 0:
+            current_id = store.parent[current_id]
+            locator_str = "/" + store.tag_name(current_id) + \
+                "[" + str(store.twin_index[current_id]) + "]" + locator_str
+        parent_id = store.parent[current_id]
+        if parent_id == -1:
+            return locator_str
+        return "/" + store.tag_name(parent_id) + locator_str
 
     def get_selector(self, idx: int) -> str:
+        selector = self.get_selector_index().selector(idx)
+        if selector is not None:
+            return selector
+        store = self.elementNodes
+        if store.selector_kind:
+            raise ValueError(f"No selector for pruned node {idx}")
         selector_str = ""
-        current_node = self.elementNodes[idx]
-        while current_node["parentId"] != -1:
-            tag_name = current_node["tagName"]
-            siblingId = str(current_node["siblingId"])
-            if current_node["attributes"].get('id'):
-                current_selector = stringfy_selector(
-                    current_node["attributes"].get('id'))
+        current_id = idx
+        while store.parent[current_id] != -1:
+            tag_name = store.tag_name(current_id)
+            siblingId = str(store.sibling_index[current_id])
+            element_id = store.get_attribute(current_id, 'id')
+            if element_id:
+                current_selector = stringfy_selector(element_id)
                 return "#" + current_selector + selector_str
-            if len(self.elementNodes[current_node["parentId"]]["childIds"]) > 1:
+            parent_id = store.parent[current_id]
+            if store.child_count[parent_id] > 1:
                 uu_twin_node = True
                 uu_id = True
-                for childId in self.elementNodes[current_node["parentId"]]["childIds"]:
-                    sib_node = self.elementNodes[childId]
-                    if sib_node["nodeId"] != current_node["nodeId"] and current_node["attributes"].get('class') and sib_node["attributes"].get("class") == current_node["attributes"].get('class'):
+                class_name = store.get_attribute(current_id, 'class')
+                tag_id = store.tag_id[current_id]
+                for childId in store.children(parent_id):
+                    if childId == current_id:
+                        continue
+                    if class_name and store.get_attribute(childId, "class") == class_name:
                         uu_twin_node = False
-                    if sib_node["nodeId"] != current_node["nodeId"] and current_node["tagName"] == sib_node["tagName"]:
+                    if store.tag_id[childId] == tag_id:
                         uu_id = False
                 if uu_id:
                     selector_str = " > " + tag_name + selector_str
-                elif current_node["attributes"].get('class') and uu_twin_node is True:
+                elif class_name and uu_twin_node is True:
                     # fix div.IbBox.Whs\(n\)
                     selector_str = " > " + tag_name + "." + \
-                        stringfy_selector(
-                            current_node["attributes"].get('class')) + selector_str
+                        stringfy_selector(class_name) + selector_str
                 else:
                     selector_str = " > " + tag_name + \
                         ":nth-child(" + siblingId + ")" + selector_str
             else:
                 selector_str = " > " + tag_name + selector_str
-            current_node = self.elementNodes[current_node["parentId"]]
-        return current_node["tagName"] + selector_str
+            current_id = parent_id
+        return store.tag_name(current_id) + selector_str
 
     def is_valid(self, idx: int) -> bool:
-        node = self.pruningTreeNode[idx]
-        if node["tagName"] in TagNameList:
-            return ActiveElements.is_valid_element(node)
-
-    def prune_tree(self) -> str:
-        """Traverse each element to determine if it is valid and prune"""
-        result_list = []
-        root = self.pruningTreeNode[0]
-        if root is None:
-            result_list = []
-        stack = [root]
-        while stack:
-            node = stack.pop()
-            nodeId = node["nodeId"]
-            result_list.append(nodeId)
-            children = []
-            for childId in node["childIds"]:
-                childNode = self.pruningTreeNode[childId]
-                children.append(childNode)
-            stack.extend(children)
-        result = result_list[::-1]
-        for nodeId in result:
-            if self.is_valid(nodeId) or self.valid[nodeId] is True:
-                rawNode = self.id2rawNode[str(nodeId)]
-                html_contents = etree.tostring(
-                    rawNode, pretty_print=True).decode()
-                self.pruningTreeNode[nodeId]["htmlContents"] = html_contents
-                self.valid[nodeId] = True
-                current_id = nodeId
-                while self.pruningTreeNode[current_id]["parentId"] != -1:
-                    parent_id = self.pruningTreeNode[current_id]["parentId"]
-                    self.valid[parent_id] = True
-                    current_id = parent_id
-            else:
-                rawNode = self.id2rawNode[str(nodeId)]
-                rawNode.getparent().remove(rawNode)
-                current_node = self.pruningTreeNode[nodeId]
-                current_node["htmlContents"] = ""
-                parentid = current_node["parentId"]
-                self.pruningTreeNode[parentid]["childIds"].remove(nodeId)
-                self.valid[nodeId] = False
-        return self.pruningTreeNode[0]["htmlContents"]
-
-    def get_element_contents(self, idx: int) -> str:
-        node = self.elementNodes[idx]
-        html_content = node["htmlContents"]
-        return html_content
+        return bool(self.elementNodes.self_valid[idx])
+
+    def prune_tree(self) -> None:
+        """Mark every node whose subtree contains a valid element. Pruned nodes
+        are only cleared in the validity bitmap, the raw lxml tree is left
+        intact. Node ids are in BFS order, so walking them backwards visits
+        every node after all of its descendants and a single pass that
+        propagates validity to the direct parent is enough."""
+        parent = self.elementNodes.parent
+        valid = self.elementNodes.valid
+        self_valid = self.elementNodes.self_valid
+        for nodeId in range(self.nodeCounts - 1, 0, -1):
+            if valid[nodeId] or self_valid[nodeId]:
+                valid[nodeId] = True
+                valid[parent[nodeId]] = True
+        if self.nodeCounts and self_valid[0]:
+            valid[0] = True
 
     def get_tag_name(self, element: ElementNode) -> (str, int):  # type: ignore
-        tag_name = ActiveElements.get_element_tagName(element)
-        tag_idx = element["nodeId"]
-        if tag_name == "unknown":
-            tag_name = element["tagName"]
-            tag_idx = element["nodeId"]
+        return self.get_node_tag_name(element["nodeId"])
+
+    def get_node_tag_name(self, idx: int) -> (str, int):  # type: ignore
+        """Label of a node from the cached classification. Unlabelled wrapper
+        tags take the label and id of the nearest labelled ancestor."""
+        store = self.elementNodes
+        label_code = store.label_code
+        while not label_code[idx]:
             # TODO Add more mappings
-            if tag_name in MapTagNameList:
-                parent_element = self.pruningTreeNode[element["parentId"]]
-                return self.get_tag_name(parent_element)
-            else:
-                return ("statictext", tag_idx)
-        return (tag_name, tag_idx)
+            if store.tag_name(idx) not in MapTagNameSet:
+                return ("statictext", idx)
+            idx = store.parent[idx]
+        return (LabelList[label_code[idx]], idx)
+
+    def get_element_num(self, nodeId: int, num: int) -> int:
+        """Observation number of an element: its position in the observation,
+        or in incremental mode a number tied to the node's stable key."""
+        if not self.incremental:
+            return num
+        key = self.elementNodes.node_key[nodeId]
+        element_num = self.key2num.get(key)
+        if element_num is None:
+            element_num = self.key2num[key] = len(self.key2num) + 1
+        return element_num
 
     def build_dom_tree(self) -> str:
-        root = self.pruningTreeNode[0]
-        stack = [root]
-        contents = ""
+        return "".join(self.iter_dom_tree())
+
+    def iter_dom_tree(self):
+        """Yield the observation one `[n] tag 'text'` line at a time, so
+        callers can stream it, stop at a budget or join it once. nodeDict,
+        element_value, dom_elements and the incremental change tracking are
+        filled as lines are yielded, so they cover exactly the lines consumed."""
+        store = self.elementNodes
+        previous_states = self.element_states
+        self.element_states = {}
+        self.observation_lines = []
+        self.changed_keys = set()
+        self.dom_elements = []
+        if not len(store) or not store.valid[0]:
+            return
+        valid = store.valid
+        depth = store.depth
+        stack = [0]
         num = 0
         while stack:
-            node = stack.pop()
-            if self.valid[node["nodeId"]] is True:
-                content_text = HTMLTree().process_element_contents(node)
-                if content_text != "":
-                    tag_name, tag_idx = self.get_tag_name(
-                        node)
-                    if tag_name.lower() != "statictext":
-                        num += 1
-                        self.nodeDict[num] = tag_idx
-                        contents += "  " * (node["depth"]-1) + "[" + str(num) + "] " + tag_name + \
-                            " " + f"\'{content_text}\'" + "\n"
-                        self.element_value[str(tag_idx)] = content_text
-            children = []
-            for child_id in node["childIds"]:
-                children.append(self.pruningTreeNode[child_id])
+            nodeId = stack.pop()
+            content_text = self.get_node_contents(nodeId)
+            if content_text != "":
+                tag_name, tag_idx = self.get_node_tag_name(nodeId)
+                if tag_name != "statictext":
+                    num += 1
+                    element_num = self.get_element_num(nodeId, num)
+                    self.nodeDict[element_num] = tag_idx
+                    line = f"{'  ' * (depth[nodeId] - 1)}[{element_num}] {tag_name} \'{content_text}\'\n"
+                    self.element_value[str(tag_idx)] = content_text
+                    self.dom_elements.append(ObservationElement(
+                        nodeId=nodeId, num=element_num, depth=depth[nodeId],
+                        tagName=tag_name, text=content_text, line=line))
+                    if self.incremental:
+                        key = store.node_key[nodeId]
+                        state = (tag_name, content_text)
+                        self.element_states[key] = state
+                        self.observation_lines.append((key, line))
+                        if previous_states.get(key) != state:
+                            self.changed_keys.add(key)
+                    yield line
+            children = [
+                child_id for child_id in store.children(nodeId) if valid[child_id]]
             stack.extend(reversed(children))
-        return contents
+
+    def get_node_contents(self, idx: int) -> str:
+        """process_element_contents for a node of the store, read straight
+        from the raw node instead of a materialized ElementNode"""
+        rawNode = self.elementNodes.raw_nodes[idx]
+        html_text = ActiveElements.node_value(
+            self.elementNodes.tag_name(idx), rawNode.text, rawNode)
+        return html_text.replace("\n", "").replace("\t", "").strip()
+
+    def build_changed_dom_tree(self) -> str:
+        """Lines of the last build_dom_tree whose element is new or whose tag
+        name or text changed since the observation before it. Only available
+        in incremental mode."""
+        return "".join(line for key, line in self.observation_lines
+                       if key in self.changed_keys)
+
+    def changed_dom_elements(self) -> list:
+        """The dom_elements of build_changed_dom_tree"""
+        node_key = self.elementNodes.node_key
+        return [element for element in self.dom_elements
+                if node_key[element["nodeId"]] in self.changed_keys]
 
     def get_selector_and_xpath(self, idx: int) -> (str, str):  # type: ignore
+        """Selector and xpath of node `idx`, or two empty strings when the
+        node can not be located"""
         try:
             selector = self.get_selector(idx)
             xpath = self.get_xpath(idx)
             return selector, xpath
-        except:
-            print(f"can't locate element")
+        except (ValueError, IndexError) as e:
+            logger.warning(f"Can't locate element {idx}: {e}")
+            return "", ""
 
     @staticmethod
     def process_element_contents(element: ElementNode) -> str:
@@ -0,0 +1,123 @@
+from array import array
+from collections import deque
+from difflib import SequenceMatcher
+
+from .node_store import NodeStore
+
+
+# Injected with BrowserContext.add_init_script so it runs in every document
+# before the page's own scripts. Each batch of DOM mutations bumps a counter
+# that get_obs compares to skip re-observing an unchanged page.
+DOM_MUTATION_OBSERVER_SCRIPT = '''
+(() => {
+    if (window.__webcanvasDomVersion !== undefined) {
+        return;
+    }
+    window.__webcanvasDomVersion = 0;
+    const observer = new MutationObserver(() => {
+        window.__webcanvasDomVersion += 1;
+    });
+    observer.observe(document, {
+        subtree: true, childList: true, attributes: true, characterData: true
+    });
+})();
+'''
+
+
+def node_anchor(store: NodeStore, idx: int) -> tuple:
+    rawNode = store.raw_nodes[idx]
+    return (store.tag_name(idx), rawNode.get("id"), rawNode.get("class"))
+
+
+def subtree_anchor(store: NodeStore, idx: int) -> int:
+    return store.subtree_hash[idx]
+
+
+def compute_subtree_hashes(store: NodeStore) -> None:
+    """Hash every subtree from its tag, attributes, text and the hashes of its
+    children. Children have larger ids than their parent, so one backward
+    pass over the ids is enough."""
+    subtree_hash = array("q", bytes(8 * len(store)))
+    for idx in range(len(store) - 1, -1, -1):
+        rawNode = store.raw_nodes[idx]
+        subtree_hash[idx] = hash((
+            store.tag_name(idx), tuple(rawNode.items()), rawNode.text, rawNode.tail,
+            tuple(subtree_hash[child_id] for child_id in store.children(idx))))
+    store.subtree_hash = subtree_hash
+
+
+def group_by_gap(children: list, matched_to) -> dict:
+    """Group the unmatched children by the nearest matched sibling before
+    them, given as its id in the previous tree (-1 before the first one)."""
+    gaps = {}
+    gap = -1
+    for child_id in children:
+        partner = matched_to(child_id)
+        if partner == -1:
+            gaps.setdefault(gap, []).append(child_id)
+        else:
+            gap = partner
+    return gaps
+
+
+def match_node_keys(previous: NodeStore, current: NodeStore, next_key: int) -> int:
+    """Give every node of `current` a stable key. Nodes matched to a node of
+    `previous` inherit its key and new nodes get a fresh one. Children of
+    matched parents are first paired by identical subtree. The remaining
+    ones are paired by tag, id and class only between the same two matched
+    siblings, aligned by their longest common subsequence, so a changed
+    node keeps its key when siblings are inserted or removed around it.
+    Returns the next unused key."""
+    node_count = len(current)
+    compute_subtree_hashes(current)
+    current.node_key = array("i", [-1]) * node_count
+    matched = array("i", [-1]) * node_count
+    if previous is not None and len(previous.node_key) and node_count \
+            and previous.tag_name(0) == current.tag_name(0):
+        matched[0] = 0
+    # Node ids are in BFS order, so every parent is matched before its children
+    for node_id in range(node_count):
+        previous_id = matched[node_id]
+        if previous_id == -1:
+            current.node_key[node_id] = next_key
+            next_key += 1
+            continue
+        current.node_key[node_id] = previous.node_key[previous_id]
+        if not current.child_count[node_id] or not previous.child_count[previous_id]:
+            continue
+        previous_children = list(previous.children(previous_id))
+        current_children = list(current.children(node_id))
+        candidates = {}
+        for previous_child in previous_children:
+            candidates.setdefault(subtree_anchor(previous, previous_child),
+                                  deque()).append(previous_child)
+        for child_id in current_children:
+            queue = candidates.get(subtree_anchor(current, child_id))
+            if queue:
+                matched[child_id] = queue.popleft()
+        taken = set(matched[child_id] for child_id in current_children)
+        taken.discard(-1)
+        if len(taken) in (len(previous_children), len(current_children)):
+            continue
+        previous_gaps = group_by_gap(
+            previous_children, lambda child_id: child_id if child_id in taken else -1)
+        current_gaps = group_by_gap(current_children, matched.__getitem__)
+        for gap, current_gap in current_gaps.items():
+            previous_gap = previous_gaps.get(gap)
+            if not previous_gap:
+                continue
+            blocks = SequenceMatcher(
+                None, [node_anchor(previous, child_id) for child_id in previous_gap],
+                [node_anchor(current, child_id) for child_id in current_gap],
+                autojunk=False).get_matching_blocks()
+            for previous_start, current_start, size in blocks:
+                for offset in range(size):
+                    matched[current_gap[current_start + offset]] = \
+                        previous_gap[previous_start + offset]
+    return next_key
+
+
+__all__ = [
+    "DOM_MUTATION_OBSERVER_SCRIPT",
+    "match_node_keys"
+]
@@ -0,0 +1,181 @@
+from .utils import TagNameList, ConditionTagNameList, RoleLabelDict
+
+
+# Evaluated with page.evaluate(DOM_EXTRACTION_SCRIPT, DOM_EXTRACTION_RULES).
+# Applies the ActiveElements rules to the live DOM and returns only the nodes
+# HTMLTree.prune_tree would keep, in preorder, as
+# [parentIndex, tag, text, attributes, siblingIndex, twinIndex, selectorKind].
+# Visibility comes from computed styles and layout boxes instead of the
+# inline style attribute. Siblings of kept nodes are not returned, so the
+# browser decides which selector segment HTMLTree.get_selector would pick
+# (one of the SELECTOR_* kinds) and Python only joins the segments.
+# A numeric viewportMargin rule also drops elements farther than that many
+# pixels outside the viewport.
+DOM_EXTRACTION_SCRIPT = r'''
+(rules) => {
+    const tagNames = new Set(rules.tagNames);
+    const conditionTagNames = new Set(rules.conditionTagNames);
+    const roleLabels = new Map(Object.entries(rules.roleLabels));
+    const ownLabels = new Set(['select', 'optgroup', 'textarea', 'option', 'datalist', 'button']);
+    const disableableLabels = new Set(['select', 'option', 'input', 'textarea', 'button']);
+    const keptAttributes = rules.attributes;
+
+    function elementLabel(element, tag) {
+        if (tag === 'input') {
+            const inputType = element.getAttribute('type');
+            if (inputType === 'checkbox' || inputType === 'radio' || inputType === 'button') {
+                return inputType;
+            }
+            return 'input';
+        }
+        if (ownLabels.has(tag)) {
+            return tag;
+        }
+        if (tag === 'a') {
+            return 'link';
+        }
+        if (conditionTagNames.has(tag)) {
+            return roleLabels.get(element.getAttribute('role')) || 'unknown';
+        }
+        return 'unknown';
+    }
+
+    function isInteractive(element, tag) {
+        const label = elementLabel(element, tag);
+        if (label === 'input' && element.getAttribute('type') === 'hidden') {
+            return false;
+        }
+        if (disableableLabels.has(label) && (element.disabled === true || element.getAttribute('disabled'))) {
+            return false;
+        }
+        return true;
+    }
+
+    function isVisible(element, tag) {
+        if (element.getAttribute('aria-hidden') === 'true') {
+            return false;
+        }
+        const style = window.getComputedStyle(element);
+        if (style.display === 'none' || style.opacity === '0' ||
+                style.visibility === 'hidden' || style.visibility === 'collapse') {
+            return false;
+        }
+        // Options of a closed select have no layout box of their own
+        if (tag !== 'option' && tag !== 'optgroup' && element.getClientRects().length === 0) {
+            return false;
+        }
+        return rules.viewportMargin == null || inViewport(element, tag);
+    }
+
+    // Options are placed by their select, they have no box of their own
+    function inViewport(element, tag) {
+        const boxElement = (tag === 'option' || tag === 'optgroup') ? element.closest('select') : element;
+        if (!boxElement) {
+            return true;
+        }
+        const margin = rules.viewportMargin;
+        const rect = boxElement.getBoundingClientRect();
+        return rect.bottom >= -margin && rect.top <= window.innerHeight + margin &&
+            rect.right >= -margin && rect.left <= window.innerWidth + margin;
+    }
+
+    function leadingText(element) {
+        let text = null;
+        for (let child = element.firstChild; child && child.nodeType === Node.TEXT_NODE; child = child.nextSibling) {
+            text = (text || '') + child.data;
+        }
+        return text;
+    }
+
+    function attributes(element) {
+        const attrs = {};
+        for (const name of keptAttributes) {
+            const value = element.getAttribute(name);
+            if (value !== null) {
+                attrs[name] = value;
+            }
+        }
+        return attrs;
+    }
+
+    const nodes = [];
+
+    function visit(element, tag, parentIndex, siblingIndex, twinIndex, selectorKind) {
+        const index = nodes.length;
+        nodes.push(null);
+        const children = Array.from(element.children);
+        const childTags = children.map(child => child.tagName.toLowerCase());
+        const tagCounts = new Map();
+        const classCounts = new Map();
+        children.forEach((child, i) => {
+            tagCounts.set(childTags[i], (tagCounts.get(childTags[i]) || 0) + 1);
+            const className = child.getAttribute('class');
+            if (className) {
+                classCounts.set(className, (classCounts.get(className) || 0) + 1);
+            }
+        });
+        const twinCounts = new Map();
+        let kept = false;
+        children.forEach((child, i) => {
+            const childTag = childTags[i];
+            const twin = (twinCounts.get(childTag) || 0) + 1;
+            twinCounts.set(childTag, twin);
+            const elementId = child.getAttribute('id');
+            const className = child.getAttribute('class');
+            let childSelectorKind = rules.selectorNthChild;
+            if (elementId && elementId.trim()) {
+                childSelectorKind = rules.selectorId;
+            } else if (tagCounts.get(childTag) === 1) {
+                childSelectorKind = rules.selectorTag;
+            } else if (className && className.trim() && classCounts.get(className) === 1) {
+                childSelectorKind = rules.selectorClass;
+            }
+            if (visit(child, childTag, index, i + 1, twin, childSelectorKind)) {
+                kept = true;
+            }
+        });
+        if (!kept && !(tagNames.has(tag) && isInteractive(element, tag) && isVisible(element, tag))) {
+            nodes.length = index;
+            return false;
+        }
+        nodes[index] = [parentIndex, tag, leadingText(element), attributes(element),
+                        siblingIndex, twinIndex, selectorKind];
+        return true;
+    }
+
+    const root = document.documentElement;
+    if (root) {
+        visit(root, root.tagName.toLowerCase(), -1, 0, 0, rules.selectorTag);
+    }
+    return nodes;
+}
+'''
+
+SELECTOR_TAG = 0
+SELECTOR_CLASS = 1
+SELECTOR_NTH_CHILD = 2
+SELECTOR_ID = 3
+
+DOM_EXTRACTION_RULES = {
+    "selectorTag": SELECTOR_TAG,
+    "selectorClass": SELECTOR_CLASS,
+    "selectorNthChild": SELECTOR_NTH_CHILD,
+    "selectorId": SELECTOR_ID,
+    # Attributes read by ActiveElements, the selectors and the actions
+    "attributes": ["id", "class", "type", "role", "disabled", "title", "placeholder",
+                   "aria-label", "aria-checked", "href", "name", "value"],
+    "tagNames": TagNameList,
+    "conditionTagNames": ConditionTagNameList,
+    "roleLabels": RoleLabelDict,
+    "viewportMargin": None
+}
+
+
+__all__ = [
+    "SELECTOR_TAG",
+    "SELECTOR_CLASS",
+    "SELECTOR_NTH_CHILD",
+    "SELECTOR_ID",
+    "DOM_EXTRACTION_SCRIPT",
+    "DOM_EXTRACTION_RULES"
+]
@@ -0,0 +1,39 @@
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+import asyncio
+import time
+
+
+class DomainThrottle:
+    """Politeness limit for tasks running side by side: at most
+    `max_concurrent_per_domain` page loads of one domain at a time, started
+    at least `min_interval` seconds apart."""
+
+    def __init__(self, max_concurrent_per_domain: int = 2, min_interval: float = 1.0):
+        self.max_concurrent_per_domain = max_concurrent_per_domain
+        self.min_interval = min_interval
+        self.semaphores = {}
+        self.locks = {}
+        self.last_start = {}
+
+    @asynccontextmanager
+    async def navigation(self, url: str):
+        domain = urlparse(url).netloc
+        if not domain:
+            yield
+            return
+        semaphore = self.semaphores.setdefault(
+            domain, asyncio.Semaphore(self.max_concurrent_per_domain))
+        lock = self.locks.setdefault(domain, asyncio.Lock())
+        async with semaphore:
+            async with lock:
+                wait = self.last_start.get(domain, 0.0) + self.min_interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self.last_start[domain] = time.monotonic()
+            yield
+
+
+__all__ = [
+    "DomainThrottle"
+]
@@ -0,0 +1,163 @@
+from array import array
+from collections import deque
+import sys
+
+from .utils import ElementNode
+
+
+class ExtractedNode:
+    """Stand-in for an lxml element, built from one entry returned by
+    DOM_EXTRACTION_SCRIPT. Only the parts of the lxml API that the tree
+    code reads are provided."""
+    __slots__ = ("tag", "text", "tail", "attrib")
+
+    def __init__(self, tag: str, text: str, attrib: dict):
+        self.tag = tag
+        self.text = text
+        self.tail = None
+        self.attrib = attrib
+
+    def get(self, name: str, default=None):
+        return self.attrib.get(name, default)
+
+    def items(self) -> list:
+        return list(self.attrib.items())
+
+
+class NodeStore:
+    """Struct-of-arrays storage for the nodes of one parsed page.
+
+    Node ids follow BFS order, so a parent id is always smaller than the ids
+    of its children. Every column is sized to the real node count, tag names
+    are interned into `tag_names`, and attributes and text are read from the
+    lxml element only when asked for. Indexing the store materializes an
+    `ElementNode` dict on demand, which keeps the old `elementNodes[idx]`
+    interface working.
+    """
+
+    def __init__(self):
+        self.raw_nodes: list = []
+        self.parent = array("i")
+        self.first_child = array("i")
+        self.last_child = array("i")
+        self.next_sibling = array("i")
+        self.child_count = array("i")
+        self.depth = array("i")
+        self.sibling_index = array("i")
+        self.twin_index = array("i")
+        self.tag_id = array("i")
+        # Stable identities across observations, filled by dom_diff.match_node_keys
+        self.node_key = array("i")
+        self.subtree_hash = array("q")
+        # Filled only for stores built from the in-browser extraction
+        self.selector_kind = array("b")
+        self.valid = bytearray()
+        # Cached classification, filled by ActiveElements.classify_store
+        self.label_code = array("b")
+        self.self_valid = bytearray()
+        self.tag_names: list = []
+        self.tag_ids: dict = {}
+
+    def __len__(self) -> int:
+        return len(self.raw_nodes)
+
+    def __getitem__(self, idx: int) -> ElementNode:
+        return self.element(idx)
+
+    def element(self, idx: int, with_children: bool = True) -> ElementNode:
+        """Materialize one node. Listing the children is O(child count), so
+        callers that only look at tag and attributes can skip it."""
+        raw_node = self.raw_nodes[idx]
+        elementNode = ElementNode()
+        elementNode["nodeId"] = idx
+        elementNode["tagName"] = self.tag_names[self.tag_id[idx]]
+        elementNode["text"] = raw_node.text
+        elementNode["attributes"] = raw_node.attrib
+        elementNode["childIds"] = list(self.children(idx)) if with_children else []
+        elementNode["parentId"] = self.parent[idx]
+        elementNode["siblingId"] = self.sibling_index[idx] or ""
+        elementNode["twinId"] = self.twin_index[idx] or ""
+        elementNode["depth"] = self.depth[idx]
+        return elementNode
+
+    @classmethod
+    def from_lxml(cls, root) -> "NodeStore":
+        """Walk the lxml DOM once in BFS order and fill every column"""
+        store = cls()
+        store.add_node(root, -1, 0, 0, 1)
+        node_queue = deque([(root, 0)])
+        while node_queue:
+            node, parent_id = node_queue.popleft()
+            depth = store.depth[parent_id] + 1
+            tag_st = {}
+            for sibling_index, child in enumerate(node, 1):
+                tag_id = store.intern_tag(child.tag)
+                twin_index = tag_st[tag_id] = tag_st.get(tag_id, 0) + 1
+                child_id = store.add_node(
+                    child, parent_id, sibling_index, twin_index, depth, tag_id)
+                node_queue.append((child, child_id))
+        store.valid = bytearray(len(store))
+        return store
+
+    @classmethod
+    def from_extracted(cls, nodes: list) -> "NodeStore":
+        """Build the store from the preorder node list of DOM_EXTRACTION_SCRIPT.
+        The browser already dropped pruned nodes, so every node is valid."""
+        store = cls()
+        for parent_id, tag, text, attrib, sibling_index, twin_index, selector_kind in nodes:
+            depth = store.depth[parent_id] + 1 if parent_id != -1 else 1
+            store.add_node(ExtractedNode(tag, text, attrib),
+                           parent_id, sibling_index, twin_index, depth)
+            store.selector_kind.append(selector_kind)
+        store.valid = bytearray(b"\x01") * len(store)
+        return store
+
+    def intern_tag(self, tag) -> int:
+        tag_id = self.tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = len(self.tag_names)
+            # Comments and processing instructions use factory functions as tag
+            self.tag_names.append(sys.intern(tag) if isinstance(tag, str) else tag)
+            self.tag_ids[tag] = tag_id
+        return tag_id
+
+    def add_node(self, raw_node, parent_id: int, sibling_index: int, twin_index: int, depth: int,
+                 tag_id: int = None) -> int:
+        node_id = len(self.raw_nodes)
+        self.raw_nodes.append(raw_node)
+        self.parent.append(parent_id)
+        self.first_child.append(-1)
+        self.last_child.append(-1)
+        self.next_sibling.append(-1)
+        self.child_count.append(0)
+        self.depth.append(depth)
+        self.sibling_index.append(sibling_index)
+        self.twin_index.append(twin_index)
+        self.tag_id.append(self.intern_tag(raw_node.tag) if tag_id is None else tag_id)
+        if parent_id != -1:
+            last_child = self.last_child[parent_id]
+            if last_child == -1:
+                self.first_child[parent_id] = node_id
+            else:
+                self.next_sibling[last_child] = node_id
+            self.last_child[parent_id] = node_id
+            self.child_count[parent_id] += 1
+        return node_id
+
+    def children(self, idx: int):
+        child_id = self.first_child[idx]
+        while child_id != -1:
+            yield child_id
+            child_id = self.next_sibling[child_id]
+
+    def tag_name(self, idx: int):
+        return self.tag_names[self.tag_id[idx]]
+
+    def get_attribute(self, idx: int, name: str, default=None):
+        return self.raw_nodes[idx].get(name, default)
+
+
+__all__ = [
+    "ExtractedNode",
+    "NodeStore"
+]
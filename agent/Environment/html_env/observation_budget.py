@@ -0,0 +1,114 @@
+from typing import Callable, List, Tuple, Union
+import re
+
+from .utils import ObservationElement
+
+
+# Base value of an element by its observation label, form controls first
+LabelWeightDict = {
+    "input": 1.6,
+    "search-box": 1.6,
+    "textarea": 1.5,
+    "select": 1.4,
+    "button": 1.3,
+    "checkbox": 1.2,
+    "radio": 1.2,
+    "switch": 1.2,
+    "link": 1.0,
+    "datalist": 0.8,
+    "optgroup": 0.6,
+    "option": 0.6,
+    "row": 0.4
+}
+
+WORD_PATTERN = re.compile(r"\w{3,}")
+
+
+def text_words(text: str) -> set:
+    """Lower-case words of three or more letters, with a plural s dropped"""
+    return {word[:-1] if len(word) > 3 and word.endswith("s") else word
+            for word in WORD_PATTERN.findall(text.lower())}
+
+
+def element_score(element: ObservationElement, order: int, element_count: int,
+                  request_words: set, box: Union[list, None], viewport_height: int) -> float:
+    """Higher is more useful: form controls before links and options,
+    elements near or inside the viewport, shallow elements and elements
+    whose text shares words with the user request."""
+    score = LabelWeightDict.get(element["tagName"], 1.0)
+    if request_words:
+        words = text_words(element["text"])
+        shared = len(words & request_words)
+        if shared:
+            score += 1.0 + 2.0 * shared / len(request_words)
+    if box is not None:
+        top, height = box[1], box[3]
+        if top + height < 0:
+            distance = -(top + height)
+        else:
+            distance = max(0, top - viewport_height)
+        score += 2.0 / (1 + distance / viewport_height)
+    else:
+        # Without layout, earlier elements are assumed to be higher on the page
+        score += 0.5 * (1.0 - order / element_count)
+    score -= 0.02 * element["depth"]
+    if len(element["text"]) > 200:
+        score -= 0.5
+    return score
+
+
+def select_within_budget(elements: List[ObservationElement], token_budget: int,
+                         count_tokens: Callable[[str], int], user_request: str = "",
+                         boxes: Union[list, None] = None,
+                         viewport_height: int = 720) -> Tuple[str, int]:
+    """Keep the highest-ranked elements whose lines fit in `token_budget`
+    tokens, as counted by `count_tokens`, and return them in document order,
+    followed by a note on how many were elided, together with the number of
+    elided elements."""
+    request_words = text_words(user_request)
+    element_count = len(elements)
+    ranked = sorted(
+        range(element_count),
+        key=lambda i: element_score(
+            elements[i], i, element_count, request_words,
+            boxes[i] if boxes is not None else None, viewport_height),
+        reverse=True)
+    note = "({} less relevant elements were elided to fit the token budget)\n"
+    remaining = token_budget - count_tokens(note.format(element_count))
+    selected = []
+    for i in ranked:
+        line_tokens = count_tokens(elements[i]["line"])
+        if line_tokens <= remaining:
+            selected.append(i)
+            remaining -= line_tokens
+    selected.sort()
+    dom_tree = "".join(elements[i]["line"] for i in selected)
+    elided_count = element_count - len(selected)
+    if elided_count:
+        dom_tree += note.format(elided_count)
+    return dom_tree, elided_count
+
+
+def in_viewport(box: Union[list, None], viewport_size: dict, margin: int = 0) -> bool:
+    """Whether a viewport-relative [x, y, width, height] box intersects the
+    viewport grown by `margin` pixels on every side"""
+    if box is None:
+        return False
+    x, y, width, height = box
+    return y + height >= -margin and y <= viewport_size["height"] + margin and \
+        x + width >= -margin and x <= viewport_size["width"] + margin
+
+
+def select_in_viewport(elements: List[ObservationElement], boxes: list, viewport_size: dict,
+                       margin: int = 0) -> Tuple[List[ObservationElement], list, int]:
+    """Elements whose boxes intersect the viewport, their boxes and the
+    number of elements left out"""
+    kept = [i for i, box in enumerate(boxes) if in_viewport(box, viewport_size, margin)]
+    return [elements[i] for i in kept], [boxes[i] for i in kept], len(elements) - len(kept)
+
+
+__all__ = [
+    "select_within_budget",
+    "in_viewport",
+    "select_in_viewport"
+]
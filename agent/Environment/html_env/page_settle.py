@@ -0,0 +1,199 @@
+from typing import Callable, Union
+import asyncio
+import time
+
+from playwright.async_api import Page
+from playwright.async_api import Error as PlaywrightError
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+
+# Evaluated with page.evaluate(DOM_QUIET_SCRIPT, {"quietMs": ..., "timeoutMs": ...}).
+# Resolves once the document went quietMs without a mutation, or after
+# timeoutMs, with the milliseconds it waited.
+DOM_QUIET_SCRIPT = r'''
+({quietMs, timeoutMs}) => new Promise(resolve => {
+    const start = performance.now();
+    let quietTimer = null;
+    let ceilingTimer = null;
+    const observer = new MutationObserver(() => {
+        clearTimeout(quietTimer);
+        quietTimer = setTimeout(finish, quietMs);
+    });
+    function finish() {
+        observer.disconnect();
+        clearTimeout(quietTimer);
+        clearTimeout(ceilingTimer);
+        resolve(performance.now() - start);
+    }
+    observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+    quietTimer = setTimeout(finish, quietMs);
+    ceilingTimer = setTimeout(finish, timeoutMs);
+})
+'''
+
+
+# Longest wait in ms after each AsyncHTMLEnvironment step, the fixed sleeps
+# these steps used before
+SettleCeilingDict = {
+    "setup": 500,
+    "click": 1000,
+    "link": 2000,
+    "search": 2000,
+    "go_back": 2000,
+    "select_option": 2000,
+    "load_page": 2000,
+    "retry_content": 3000
+}
+
+
+class InflightRequests:
+    """Requests of one page that have neither finished nor failed yet"""
+
+    def __init__(self, page: Page):
+        self.requests = set()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        page.on("request", self.started)
+        page.on("requestfinished", self.ended)
+        page.on("requestfailed", self.ended)
+        page.on("framenavigated", self.navigated)
+
+    def started(self, request) -> None:
+        # Event streams stay open for the life of the page
+        if request.resource_type in ("eventsource", "websocket"):
+            return
+        self.requests.add(request)
+        self.idle.clear()
+
+    def ended(self, request) -> None:
+        self.requests.discard(request)
+        if not self.requests:
+            self.idle.set()
+
+    def navigated(self, frame) -> None:
+        # Requests of the replaced document are not always reported as failed
+        if frame.parent_frame is None:
+            self.requests = set(
+                request for request in self.requests if request.is_navigation_request())
+            if not self.requests:
+                self.idle.set()
+
+
+class PageSettler:
+    """Waits until a page has settled instead of sleeping a fixed time.
+
+    The page has settled once the document is parsed, no request is in
+    flight and the DOM saw no mutation for `dom_quiet` ms. The network and
+    the DOM are checked concurrently, so a page without pending requests
+    settles after the quiet window alone. Waiting for the network is capped
+    at `network_idle_timeout` ms, since polling and analytics requests can
+    keep a page busy forever, and the whole wait at the caller's ceiling.
+    Requests are only seen on pages passed to `watch`, which callers do when
+    the page is created; other pages are watched from their first wait on.
+
+    A navigation started by a script click or a form submit only replaces
+    the document once its response commits, and until then the load states
+    and the quiet check pass on the old document. Callers that pass the
+    `navigation_state` of the page, (url, navigation requests, committed
+    navigations), and its value from before the action are waited for until
+    such a navigation commits and the new document settles."""
+
+    def __init__(self, network_idle_timeout: int = 1500, dom_quiet: int = 300):
+        self.network_idle_timeout = network_idle_timeout
+        self.dom_quiet = dom_quiet
+        self.metrics = {"waits": 0, "seconds": 0.0, "ceiling_seconds": 0.0, "navigations": 0}
+        self.inflight = {}
+
+    def watch(self, page: Page) -> None:
+        """Track the requests in flight on `page` until it closes"""
+        if page in self.inflight:
+            return
+        self.inflight[page] = InflightRequests(page)
+        page.once("close", lambda closed_page: self.inflight.pop(closed_page, None))
+
+    async def wait(self, page: Page, ceiling: int, navigation_state: Callable[[], tuple] = None,
+                   before: tuple = None) -> float:
+        """Wait at most `ceiling` ms and return the seconds waited"""
+        start_time = time.perf_counter()
+
+        def remaining() -> int:
+            return int(ceiling - (time.perf_counter() - start_time) * 1000)
+
+        def network_remaining() -> int:
+            return min(remaining(), int(
+                self.network_idle_timeout - (time.perf_counter() - start_time) * 1000))
+
+        self.watch(page)
+        observed = before
+        for _ in range(3):
+            try:
+                if observed is not None:
+                    await self.wait_for_commit(page, navigation_state(), observed, remaining())
+                    observed = navigation_state()
+                await page.wait_for_load_state("domcontentloaded", timeout=max(1, remaining()))
+                await self.wait_for_quiet(page, remaining, network_remaining)
+            except PlaywrightTimeoutError:
+                break
+            except PlaywrightError:
+                # A navigation replaced the document while it was observed,
+                # wait for the new one within what is left of the ceiling
+                if remaining() <= 0:
+                    break
+                continue
+            # Settled, unless a navigation started while the page settled
+            if observed is None or navigation_state() == observed or remaining() <= 0:
+                break
+        waited = time.perf_counter() - start_time
+        self.metrics["waits"] += 1
+        self.metrics["seconds"] += waited
+        self.metrics["ceiling_seconds"] += ceiling / 1000
+        return waited
+
+    async def wait_for_quiet(self, page: Page, remaining: Callable[[], int],
+                             network_remaining: Callable[[], int]) -> None:
+        """Wait until the network and the DOM are quiet at the same time.
+        Requests that finish after the DOM went quiet can still change it
+        from their responses, so the DOM is checked once more then."""
+        while remaining() > 0:
+            network = asyncio.ensure_future(self.wait_for_network(page, network_remaining()))
+            try:
+                await page.evaluate(DOM_QUIET_SCRIPT, {"quietMs": min(self.dom_quiet, remaining()),
+                                                       "timeoutMs": remaining()})
+                dom_quiet_at = time.perf_counter()
+                network_quiet_at = await network
+            finally:
+                network.cancel()
+            if network_quiet_at is None or network_quiet_at <= dom_quiet_at:
+                return
+
+    async def wait_for_network(self, page: Page, timeout: int) -> Union[float, None]:
+        """Wait for the requests in flight on `page` to finish. Returns when
+        they did, or None when none was in flight or they outlasted `timeout`."""
+        inflight = self.inflight.get(page)
+        if inflight is None or inflight.idle.is_set() or timeout <= 0:
+            return None
+        try:
+            await asyncio.wait_for(inflight.idle.wait(), timeout / 1000)
+        except asyncio.TimeoutError:
+            return None
+        return time.perf_counter()
+
+    async def wait_for_commit(self, page: Page, state: tuple, observed: tuple, timeout: int) -> None:
+        """Wait for a navigation requested since `observed` to commit. One
+        that never commits, like a download or a 204, ends at the timeout."""
+        _, requests, commits = state
+        if requests == observed[1] or commits != observed[2]:
+            return
+        self.metrics["navigations"] += 1
+        try:
+            await page.wait_for_event("framenavigated", predicate=lambda frame: frame.parent_frame is None,
+                                      timeout=max(1, timeout))
+        except PlaywrightTimeoutError:
+            pass
+
+
+__all__ = [
+    "DOM_QUIET_SCRIPT",
+    "SettleCeilingDict",
+    "PageSettler"
+]
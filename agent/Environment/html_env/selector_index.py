@@ -0,0 +1,104 @@
+from .node_store import NodeStore
+from .dom_extraction import SELECTOR_TAG, SELECTOR_CLASS, SELECTOR_NTH_CHILD, SELECTOR_ID
+from .utils import stringfy_selector
+
+
+class SelectorIndex:
+    """CSS selectors and xpaths of every valid node of one observation.
+
+    Built in a single top-down pass over the node ids, which are in BFS
+    order, so a node's selector and xpath extend the already computed ones
+    of its parent. Tag and class uniqueness come from one frequency table
+    per parent instead of a sibling scan per ancestor and lookup is O(1).
+    Produces the same strings as HTMLTree.get_selector and get_xpath.
+    """
+
+    def __init__(self, store: NodeStore):
+        node_count = len(store)
+        self.selectors: list = [None] * node_count
+        self.xpaths: list = [None] * node_count
+        if not node_count or not store.valid[0]:
+            return
+        root_tag = store.tag_name(0)
+        self.selectors[0] = root_tag
+        # The root has no siblings, so no twin index either
+        self.xpaths[0] = "/" + root_tag
+        valid = store.valid
+        extracted = bool(store.selector_kind)
+        for parent_id in range(node_count):
+            if not valid[parent_id] or not store.child_count[parent_id]:
+                continue
+            parent_selector = self.selectors[parent_id]
+            if parent_id == 0:
+                parent_xpath = "/" + root_tag
+            else:
+                parent_xpath = self.xpaths[parent_id]
+            if not extracted:
+                tag_counts, class_counts = self.sibling_counts(store, parent_id)
+            for child_id in store.children(parent_id):
+                if not valid[child_id]:
+                    continue
+                tag_name = store.tag_name(child_id)
+                self.xpaths[child_id] = parent_xpath + "/" + tag_name + \
+                    "[" + str(store.twin_index[child_id]) + "]"
+                if extracted:
+                    selector_kind = store.selector_kind[child_id]
+                else:
+                    selector_kind = self.selector_kind(
+                        store, child_id, tag_counts, class_counts)
+                try:
+                    self.selectors[child_id] = self.child_selector(
+                        store, child_id, tag_name, selector_kind, parent_selector)
+                except IndexError:
+                    # stringfy_selector rejects blank ids and classes, leave
+                    # the node to the ancestor walk, which reports it
+                    pass
+
+    @staticmethod
+    def sibling_counts(store: NodeStore, parent_id: int) -> (dict, dict):  # type: ignore
+        tag_counts = {}
+        class_counts = {}
+        for child_id in store.children(parent_id):
+            tag_id = store.tag_id[child_id]
+            tag_counts[tag_id] = tag_counts.get(tag_id, 0) + 1
+            class_name = store.get_attribute(child_id, "class")
+            if class_name:
+                class_counts[class_name] = class_counts.get(class_name, 0) + 1
+        return tag_counts, class_counts
+
+    @staticmethod
+    def selector_kind(store: NodeStore, idx: int, tag_counts: dict, class_counts: dict) -> int:
+        if store.get_attribute(idx, "id"):
+            return SELECTOR_ID
+        if tag_counts[store.tag_id[idx]] == 1:
+            return SELECTOR_TAG
+        class_name = store.get_attribute(idx, "class")
+        if class_name and class_counts[class_name] == 1:
+            return SELECTOR_CLASS
+        return SELECTOR_NTH_CHILD
+
+    @staticmethod
+    def child_selector(store: NodeStore, idx: int, tag_name: str, selector_kind: int,
+                       parent_selector: str) -> str:
+        if selector_kind == SELECTOR_ID:
+            return "#" + stringfy_selector(store.get_attribute(idx, "id"))
+        if parent_selector is None:
+            return None
+        if selector_kind == SELECTOR_CLASS:
+            return parent_selector + " > " + tag_name + "." + \
+                stringfy_selector(store.get_attribute(idx, "class"))
+        if selector_kind == SELECTOR_NTH_CHILD:
+            return parent_selector + " > " + tag_name + \
+                ":nth-child(" + str(store.sibling_index[idx]) + ")"
+        return parent_selector + " > " + tag_name
+
+    def selector(self, idx: int) -> str:
+        return self.selectors[idx]
+
+    def xpath(self, idx: int) -> str:
+        return self.xpaths[idx]
+
+
+__all__ = [
+    "SelectorIndex"
+]
@@ -1,4 +1,4 @@
-from typing import TypedDict, List
+from typing import TypedDict, List, NotRequired
 from enum import IntEnum
 
 
@@ -11,9 +11,18 @@ class ElementNode(TypedDict):
     attributes: dict            # Element attributes
     text: str                   # Text attribute
     parentId: int               # Parent element
-    htmlContents: str           # All information of the element
+    htmlContents: NotRequired[str]  # All information of the element, serialized on demand
     depth: int                  # Depth
 
+
+class ObservationElement(TypedDict):
+    nodeId: int                 # Element ID in the node store
+    num: int                    # Number shown in the observation
+    depth: int                  # Depth
+    tagName: str                # Observation label
+    text: str                   # Text shown in the observation
+    line: str                   # Observation line
+
 TagNameList = [
     "button",
     "a",
@@ -82,6 +91,67 @@ TypeList = [
     "submit"
 ]
 
+# Lookup tables compiled from the lists above for ActiveElements
+TagNameSet = frozenset(TagNameList)
+MapTagNameSet = frozenset(MapTagNameList)
+ConditionTagNameSet = frozenset(ConditionTagNameList)
+TypeSet = frozenset(TypeList)
+
+# Labels shown in the observation, a node's label is cached as its index here
+LabelList = [
+    "unknown",
+    "input",
+    "checkbox",
+    "radio",
+    "button",
+    "select",
+    "optgroup",
+    "textarea",
+    "option",
+    "datalist",
+    "link",
+    "switch",
+    "row",
+    "search-box"
+]
+
+LabelCodeDict = {label: code for code, label in enumerate(LabelList)}
+
+# Tags labelled by their name alone, input is refined by its type
+TagLabelDict = {
+    "select": "select",
+    "optgroup": "optgroup",
+    "textarea": "textarea",
+    "option": "option",
+    "datalist": "datalist",
+    "button": "button",
+    "a": "link"
+}
+
+InputTypeLabelDict = {
+    "checkbox": "checkbox",
+    "radio": "radio",
+    "button": "button"
+}
+
+# Labels of the ConditionTagNameList tags, by role
+RoleLabelDict = {
+    "button": "button",
+    "link": "link",
+    "menuitem": "link",
+    "textbox": "input",
+    "checkbox": "checkbox",
+    "radio": "radio",
+    "tab": "link",
+    "switch": "switch",
+    "option": "option",
+    "row": "row",
+    "search-box": "search-box"
+}
+
+# Labels whose disabled attribute makes the element non-interactive
+DisableableLabelSet = frozenset(["select", "option", "input", "textarea", "button"])
+
 
 def stringfy_selector(string: str):
     special_chars = '#.>+~[]():*^$|=%@!\''
@@ -102,10 +172,21 @@ def stringfy_value(string):
 
 __all__ = [
     "ElementNode",
+    "ObservationElement",
     "TagNameList",
     "DelTagNameList",
     "ConditionTagNameList",
     "TypeList",
+    "TagNameSet",
+    "MapTagNameSet",
+    "ConditionTagNameSet",
+    "TypeSet",
+    "LabelList",
+    "LabelCodeDict",
+    "TagLabelDict",
+    "InputTypeLabelDict",
+    "RoleLabelDict",
+    "DisableableLabelSet",
     "stringfy_selector",
     "stringfy_value"
 ]
@@ -1,5 +1,13 @@
 from .openai import *
 from .llm_instance import *
 from .token_cal import *
-from .claude import *
-from .token_calculation import *
\ No newline at end of file
+try:
+    from .claude import *
+except ImportError:
+    pass
+from .token_calculation import *
+from .rate_limit import *
+from .client_registry import *
+from .llm_response import *
+from .tokenizer import *
+from .context_packer import *
\ No newline at end of file
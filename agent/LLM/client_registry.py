@@ -0,0 +1,127 @@
+import importlib.util
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from openai import AsyncOpenAI
+from sanic.log import logger
+
+
+TOGETHER_BASE_URL = "https://api.together.xyz/v1"
+
+
+class LLMClientRegistry:
+    """Process-wide LLM clients and generators.
+
+    Every generator of a provider shares one AsyncOpenAI client, and with it
+    one keep-alive connection pool (HTTP/2 when the h2 package is installed)
+    capped at `max_connections`, so TLS handshakes happen once per run
+    instead of once per step. Generators are created once per model, and the
+    SDK calls that block (Gemini) share one thread pool.
+    Call close() when the run is over."""
+
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 60.0, http2: bool = True, max_workers: int = None,
+                 request_timeout: float = 60.0, max_retries: int = 2, openai_base_url: str = None):
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.openai_base_url = openai_base_url or None
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections,
+                                   keepalive_expiry=keepalive_expiry)
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        self.max_workers = max_workers or (os.cpu_count() or 1) * 2
+        self.clients = {}
+        self.generators = {}
+        self._executor = None
+        self.closed = False
+
+    def async_openai_client(self, api_key: str, base_url: str = None) -> AsyncOpenAI:
+        return AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=self.request_timeout,
+            max_retries=self.max_retries,
+            http_client=httpx.AsyncClient(limits=self.limits, http2=self.http2))
+
+    def openai_client(self) -> AsyncOpenAI:
+        if "openai" not in self.clients:
+            self.clients["openai"] = self.async_openai_client(
+                os.getenv("OPENAI_API_KEY"), self.openai_base_url)
+        return self.clients["openai"]
+
+    def together_client(self) -> AsyncOpenAI:
+        if "together" not in self.clients:
+            self.clients["together"] = self.async_openai_client(
+                os.environ.get("TOGETHER_API_KEY"), TOGETHER_BASE_URL)
+        return self.clients["together"]
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Thread pool of the SDK calls that block"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix="llm")
+        return self._executor
+
+    def get_generator(self, model: str, json_mode: bool = False, all_json_models=None):
+        """The shared generator of `model`, see create_llm_instance"""
+        key = (model, bool(json_mode))
+        if key not in self.generators:
+            # Imported here, the generators get their clients from this module
+            from .llm_instance import create_llm_instance
+            self.generators[key] = create_llm_instance(model, json_mode, all_json_models)
+        return self.generators[key]
+
+    async def close(self) -> None:
+        for name, client in self.clients.items():
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning(f"Closing the {name} LLM client failed: {e}")
+        self.clients.clear()
+        self.generators.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.closed = True
+
+
+_registry = None
+
+
+def configure_llm_registry(client_config: dict = None) -> LLMClientRegistry:
+    """Replace the process-wide registry from the [llm_client] settings"""
+    global _registry
+    client_config = client_config or {}
+    _registry = LLMClientRegistry(
+        max_connections=client_config.get("max_connections", 100),
+        max_keepalive_connections=client_config.get("max_keepalive_connections", 20),
+        keepalive_expiry=client_config.get("keepalive_expiry", 60.0),
+        http2=client_config.get("http2", True),
+        max_workers=client_config.get("max_workers"),
+        request_timeout=client_config.get("request_timeout", 60.0),
+        max_retries=client_config.get("max_retries", 2),
+        openai_base_url=client_config.get("openai_base_url"))
+    return _registry
+
+
+def get_llm_registry() -> LLMClientRegistry:
+    if _registry is None or _registry.closed:
+        configure_llm_registry()
+    return _registry
+
+
+async def close_llm_registry() -> None:
+    global _registry
+    if _registry is not None:
+        await _registry.close()
+        _registry = None
+
+
+__all__ = [
+    "LLMClientRegistry",
+    "configure_llm_registry",
+    "get_llm_registry",
+    "close_llm_registry"
+]
@@ -0,0 +1,279 @@
+from typing import Union
+import base64
+import binascii
+import math
+import struct
+
+from sanic.log import logger
+
+from .tokenizer import get_tokenizer
+
+
+# Context window in tokens by model name prefix, the longest matching
+# prefix wins. Prompts of other models are sent unpacked, unless their
+# window is configured, see configure_context_sizes.
+ModelContextSizeDict = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-3.5-turbo-instruct": 4096,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4-vision": 128000,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "o1": 200000,
+    "o1-mini": 128000,
+    "o1-preview": 128000,
+    "o3": 200000,
+    "claude": 200000,
+    "gemini-1.0": 32760,
+    "gemini-1.5-flash": 1048576,
+    "gemini-1.5-pro": 2097152,
+    "gemini-2": 1048576,
+    "meta-llama/Meta-Llama-3-": 8192,
+    "meta-llama/Meta-Llama-3.1-": 131072,
+    "meta-llama/Llama-3.2-": 131072,
+    "meta-llama/Llama-3.3-": 131072,
+    "Qwen/Qwen2": 32768,
+    "mistralai/Mixtral-8x7B": 32768,
+    "mistralai/Mistral-7B": 32768,
+}
+
+# Tokens the chat format adds around every message and before the reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+
+# Other models are counted with cl100k_base, which can be off by some
+# percent for their own tokenizers, so part of their window is kept free
+TiktokenModelPrefixes = ("gpt", "o1", "o3")
+UNKNOWN_TOKENIZER_MARGIN = 0.1
+
+# Elided text keeps at most this many tokens of its head, the rest of what
+# fits comes from its tail, where prompts put the latest observation
+MAX_HEAD_TOKENS = 1024
+ELISION_MARKER = "\n[... {} tokens elided to fit the context window ...]\n"
+IMAGE_PLACEHOLDER = "[image omitted to fit the context window]"
+
+# Tokens of an image whose size is unknown, per provider
+DefaultImageTokenDict = {
+    "openai": 765,
+    "claude": 1600,
+    "gemini": 258
+}
+
+
+_unsized_models = set()
+
+
+def configure_context_sizes(context_sizes: dict = None) -> None:
+    """Add or override context windows by model name prefix, from the
+    [llm_client.context_sizes] settings"""
+    ModelContextSizeDict.update({prefix: int(size) for prefix, size in (context_sizes or {}).items()})
+
+
+def model_context_size(model: str) -> Union[int, None]:
+    """Context window of `model`, None when it is unknown"""
+    matches = [prefix for prefix in ModelContextSizeDict if model.startswith(prefix)]
+    if not matches:
+        if model not in _unsized_models:
+            _unsized_models.add(model)
+            logger.warning(f"Context window of {model} is unknown, its prompts are not packed. "
+                           f"Set it in [llm_client.context_sizes] to pack them.")
+        return None
+    return ModelContextSizeDict[max(matches, key=len)]
+
+
+def image_provider(model: str) -> str:
+    if "claude" in model:
+        return "claude"
+    if "gemini" in model:
+        return "gemini"
+    return "openai"
+
+
+def image_size(url: str) -> Union[tuple, None]:
+    """(width, height) of a base64 PNG or JPEG data URL, None otherwise"""
+    if not url or not url.startswith("data:") or "," not in url:
+        return None
+    try:
+        data = base64.b64decode(url.split(",", 1)[1])
+    except (binascii.Error, ValueError):
+        return None
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:2] == b"\xff\xd8":
+        position = 2
+        while position + 9 < len(data):
+            if data[position] != 0xFF:
+                position += 1
+                continue
+            marker = data[position + 1]
+            length = struct.unpack(">H", data[position + 2:position + 4])[0]
+            # Start of frame markers, without DHT, JPG and DAC
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", data[position + 5:position + 9])
+                return width, height
+            position += 2 + length
+    return None
+
+
+def image_tokens(part: dict, model: str) -> int:
+    """Tokens an image part costs: OpenAI's 512px tile model, Anthropic's
+    width * height / 750 and Gemini's flat 258"""
+    provider = image_provider(model)
+    if provider == "gemini":
+        return DefaultImageTokenDict["gemini"]
+    image_url = part.get("image_url") or {}
+    if isinstance(image_url, str):
+        image_url = {"url": image_url}
+    size = image_size(image_url.get("url") or part.get("text") or "")
+    if size is None:
+        return DefaultImageTokenDict[provider]
+    width, height = size
+    if provider == "claude":
+        return min(DefaultImageTokenDict["claude"], math.ceil(width * height / 750))
+    if image_url.get("detail") == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+class ContextPacker:
+    """Fits chat messages into a model's context window with exact token
+    counts.
+
+    Messages that fit are returned as they are. Otherwise, in this order:
+    messages between the system prompt and the latest message are dropped
+    oldest first, the text of the latest message loses the middle of its
+    longest part (the older trace, while the head with the task and the tail
+    with the latest observation stay), its images are replaced by a
+    placeholder, and last the system prompt is elided the same way."""
+
+    def __init__(self, model: str, context_size: int = None):
+        self.model = model
+        self.tokenizer = get_tokenizer(model)
+        self.context_size = context_size or model_context_size(model)
+        if self.context_size and not model.startswith(TiktokenModelPrefixes):
+            self.context_size = int(self.context_size * (1 - UNKNOWN_TOKENIZER_MARGIN))
+
+    def content_tokens(self, content) -> int:
+        if isinstance(content, str):
+            return self.tokenizer.count(content)
+        tokens = 0
+        for part in content or []:
+            if part.get("type") == "image_url":
+                tokens += image_tokens(part, self.model)
+            elif "text" in part.get("type", ""):
+                tokens += self.tokenizer.count(part.get("text") or "")
+        return tokens
+
+    def message_tokens(self, message: dict) -> int:
+        return MESSAGE_OVERHEAD_TOKENS + self.content_tokens(message.get("content"))
+
+    def messages_tokens(self, messages: list) -> int:
+        return REPLY_OVERHEAD_TOKENS + sum(self.message_tokens(message) for message in messages)
+
+    def elide_text(self, text: str, excess: int) -> str:
+        """`text` without about `excess` tokens from its middle"""
+        tokens = self.tokenizer.encode(text)
+        marker_tokens = self.tokenizer.count(ELISION_MARKER.format(len(tokens)))
+        keep = len(tokens) - excess - marker_tokens
+        if keep <= 0:
+            return ""
+        head = min(keep // 4, MAX_HEAD_TOKENS)
+        tail = keep - head
+        encoding = self.tokenizer.encoding
+        return encoding.decode(tokens[:head]) + ELISION_MARKER.format(len(tokens) - keep) + \
+            encoding.decode(tokens[len(tokens) - tail:])
+
+    def shrink_text(self, message: dict, excess: int) -> dict:
+        """A copy of `message` whose text is about `excess` tokens shorter,
+        taken from its longest text parts first"""
+        content = message.get("content")
+        if isinstance(content, str):
+            return {**message, "content": self.elide_text(content, excess)}
+        parts = [dict(part) for part in content or []]
+        text_parts = sorted((part for part in parts if "text" in part.get("type", "") and part.get("text")),
+                            key=lambda part: self.tokenizer.count(part["text"]), reverse=True)
+        for part in text_parts:
+            if excess <= 0:
+                break
+            part_tokens = self.tokenizer.count(part["text"])
+            part["text"] = self.elide_text(part["text"], excess)
+            excess -= part_tokens - self.tokenizer.count(part["text"])
+        return {**message, "content": parts}
+
+    def drop_images(self, message: dict, excess: int) -> dict:
+        content = message.get("content")
+        if isinstance(content, str):
+            return message
+        parts = []
+        for part in content or []:
+            if excess > 0 and part.get("type") == "image_url":
+                excess -= image_tokens(part, self.model)
+                part = {"type": "text", "text": IMAGE_PLACEHOLDER}
+            parts.append(part)
+        return {**message, "content": parts}
+
+    def pack(self, messages: list, max_output_tokens: int = 500) -> list:
+        if not self.context_size:
+            return messages
+        budget = self.context_size - max_output_tokens
+        total = self.messages_tokens(messages)
+        if total <= budget:
+            return messages
+        original_total = total
+        messages = list(messages)
+        latest = len(messages) - 1
+        # Older turns first, keeping the system prompt and the latest message
+        position = 0
+        while total > budget and position < latest:
+            if messages[position].get("role") != "system":
+                total -= self.message_tokens(messages.pop(position))
+                latest -= 1
+            else:
+                position += 1
+        shrink_steps = [(latest, self.shrink_text), (latest, self.drop_images)] + \
+            [(i, self.shrink_text) for i in range(latest) if messages[i].get("role") == "system"]
+        for index, shrink in shrink_steps:
+            # Re-encoding the joined text can differ by a few tokens
+            for _ in range(3):
+                if total <= budget:
+                    break
+                messages[index] = shrink(messages[index], total - budget)
+                total = self.messages_tokens(messages)
+        if total > budget:
+            logger.error(f"Messages of {original_total} tokens do not fit the {self.context_size} token "
+                         f"context of {self.model} even after packing, {total} tokens are left")
+        else:
+            logger.warning(f"Packed messages of {original_total} tokens into {total} tokens "
+                           f"for the {self.context_size} token context of {self.model}")
+        return messages
+
+
+def pack_messages(messages: list, model: str, max_output_tokens: int = 500) -> list:
+    """`messages` fitted into the context window of `model`, see ContextPacker"""
+    if not messages or not model or model_context_size(model) is None:
+        return messages
+    try:
+        return ContextPacker(model).pack(messages, max_output_tokens)
+    except Exception as e:
+        # Packing only saves tokens, a tokenizer that can not be loaded
+        # (offline, unknown encoding) must not fail the request
+        logger.warning(f"Packing messages for {model} failed, sending them unpacked: {e}")
+        return messages
+
+
+__all__ = [
+    "ModelContextSizeDict",
+    "configure_context_sizes",
+    "model_context_size",
+    "image_tokens",
+    "ContextPacker",
+    "pack_messages"
+]
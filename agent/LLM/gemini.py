@@ -1,12 +1,15 @@
 import os
 import asyncio
 from functools import partial
-from concurrent.futures import ThreadPoolExecutor
 from sanic.log import logger
 import google.generativeai as genai
 import logging
 import json
 from ..Prompt.dom_vision_prompts import DomVisionPrompts
+from .rate_limit import model_rate_limit
+from .client_registry import get_llm_registry
+from .llm_response import LLMResponse, usage_from_gemini
+from .context_packer import pack_messages
 
 # Configure the logger
 logger = logging.getLogger('gemini_generator_logger')
@@ -23,21 +26,22 @@ class GeminiGenerator:
     def __init__(self, model=None, system_instruction=None):
         self.model = model
         self.system_instruction = system_instruction
-        self.pool = ThreadPoolExecutor(max_workers=os.cpu_count() * 2)
+        self.pool = get_llm_registry().executor
 
-    async def request(self, messages: list = None, max_tokens: int = 500, temperature: float = 0.7) -> (str, str):
+    async def request(self, messages: list = None, max_tokens: int = 500, temperature: float = 0.7) -> LLMResponse:
        
         genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
         loop = asyncio.get_event_loop()
         try:
-            response = await loop.run_in_executor(
-                self.pool,
-                partial(self.chat, messages, max_tokens, temperature)
-            )
-            return response, ""
+            messages = pack_messages(messages, self.model, max_tokens)
+            async with model_rate_limit(self.model):
+                return await loop.run_in_executor(
+                    self.pool,
+                    partial(self.chat, messages, max_tokens, temperature)
+                )
         except Exception as e:
             logger.error(f"Error in GeminiGenerator.request: {e}")
-            return "", str(e)
+            return LLMResponse("", str(e))
 
     def chat(self, messages, max_tokens=500, temperature=0.7):
         """
@@ -46,7 +50,7 @@ class GeminiGenerator:
         :param messages: List of messages to send.
         :param max_tokens: Maximum number of tokens in the response.
         :param temperature: Sampling temperature.
-        :return: Response text from the API.
+        :return: LLMResponse with the response text and the token usage Gemini reported.
         """
         systemPlanningMessage = DomVisionPrompts.d_v_planning_prompt_system
         systemRewardMessage = DomVisionPrompts.current_d_vision_reward_prompt_system
@@ -54,7 +58,7 @@ class GeminiGenerator:
             logger.debug("Entering chat method.")
             if not messages:
                 logger.debug("No messages provided to the chat method.")
-                return ""
+                return LLMResponse()
 
             chat_history = []
 
@@ -131,15 +135,15 @@ class GeminiGenerator:
 
                 # Access the response text directly
                 response_text = getattr(response, 'text', '')  # Adjust based on actual attribute
-                return response_text  # Return the text instead of the dictionary
+                return LLMResponse(response_text, "", usage_from_gemini(response))
 
             except Exception as e:
                 logger.error(f"Exception after chat_history: {e}")
-                return ""
+                return LLMResponse()
 
         except Exception as e:
             logger.error(f"Exception in chat method: {e}")
-            return ""
+            return LLMResponse()
 
     def _extract_latest_user_message(self, messages):
         """
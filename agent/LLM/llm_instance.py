@@ -1,7 +1,12 @@
 from .openai import GPTGenerator, GPTGeneratorWithJSON
-from .claude import ClaudeGenerator
+try:
+    from .claude import ClaudeGenerator
+except ImportError:
+    # claude.py is not in every checkout, only Claude models need it
+    ClaudeGenerator = None
 from .gemini import GeminiGenerator
 from .togetherai import TogetherAIGenerator
+from .client_registry import get_llm_registry
 
 
 def create_llm_instance(model, json_mode=False, all_json_models=None):
@@ -16,6 +21,8 @@ def create_llm_instance(model, json_mode=False, all_json_models=None):
     elif "claude" in model:
         if json_mode:
             raise ValueError("Claude does not support JSON mode.")
+        elif ClaudeGenerator is None:
+            raise ValueError("Claude models need agent/LLM/claude.py.")
         else:
             return ClaudeGenerator(model)
     elif "gemini" in model:
@@ -30,5 +37,5 @@ def create_llm_instance(model, json_mode=False, all_json_models=None):
             return TogetherAIGenerator(model)
 
 async def semantic_match_llm_request(messages: list = None):
-    GPT35 = GPTGenerator(model="gpt-3.5-turbo")
+    GPT35 = get_llm_registry().get_generator("gpt-3.5-turbo")
     return await GPT35.request(messages)
\ No newline at end of file
@@ -0,0 +1,49 @@
+from typing import NamedTuple, Union
+
+
+class TokenUsage(NamedTuple):
+    prompt_tokens: int
+    completion_tokens: int
+
+
+class LLMResponse(tuple):
+    """What generator.request returns: the (response, error_message) pair
+    callers unpack, carrying the token usage the provider reported, or None
+    when it reported none"""
+
+    def __new__(cls, response: str = "", error_message: str = "", usage: Union[TokenUsage, None] = None):
+        result = super().__new__(cls, (response, error_message))
+        result.usage = usage
+        return result
+
+    @property
+    def response(self) -> str:
+        return self[0]
+
+    @property
+    def error_message(self) -> str:
+        return self[1]
+
+
+def usage_from_openai(response) -> Union[TokenUsage, None]:
+    """TokenUsage of an OpenAI compatible chat completion"""
+    usage = getattr(response, "usage", None)
+    if usage is None or usage.prompt_tokens is None or usage.completion_tokens is None:
+        return None
+    return TokenUsage(usage.prompt_tokens, usage.completion_tokens)
+
+
+def usage_from_gemini(response) -> Union[TokenUsage, None]:
+    """TokenUsage of a google.generativeai GenerateContentResponse"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None or not usage.prompt_token_count:
+        return None
+    return TokenUsage(usage.prompt_token_count, usage.candidates_token_count or 0)
+
+
+__all__ = [
+    "TokenUsage",
+    "LLMResponse",
+    "usage_from_openai",
+    "usage_from_gemini"
+]
@@ -1,50 +1,46 @@
 import os
 import sys
 import openai
-import asyncio
-from functools import partial
-import multiprocessing
-from concurrent.futures import ThreadPoolExecutor
 from sanic.log import logger
 from agent.Utils import *
-from .token_cal import truncate_messages_based_on_estimated_tokens
+from .context_packer import pack_messages
 from .token_calculation import calculation_of_token, save_token_count_to_file
+from .rate_limit import model_rate_limit
+from .client_registry import get_llm_registry
+from .llm_response import LLMResponse, usage_from_openai
 
 
 class GPTGenerator:
+    """Requests go through the registry's shared AsyncOpenAI client, so they
+    hold no thread while waiting and are cancelled with their task"""
+
     def __init__(self, model=None):
         self.model = model
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = get_llm_registry().openai_client()
 
-    async def request(self, messages: list = None, max_tokens: int = 500, temperature: float = 0.7) -> (str, str):
+    async def request(self, messages: list = None, max_tokens: int = 500, temperature: float = 0.7) -> LLMResponse:
         try:
-            if "gpt-3.5" in self.model:
-                messages = truncate_messages_based_on_estimated_tokens(messages, max_tokens=16385)
             if "o1" in self.model:
                 messages = [
                     {**msg, "role": "user"} if msg["role"] == "system" else msg
                     for msg in messages
                 ]
-            cpu_count = multiprocessing.cpu_count()
-            with ThreadPoolExecutor(max_workers=cpu_count * 2) as pool:
+            messages = pack_messages(messages, self.model, max_tokens)
+            async with model_rate_limit(self.model):
                 if "o1" in self.model:
-                    future_answer = pool.submit(self.chat, messages)
+                    future_answer_result = await self.chat(messages)
                 else:
-                    future_answer = pool.submit(self.chat, messages, max_tokens, temperature)
-                future_answer_result = await future_answer.result()
-                choice = future_answer_result.choices[0]
-                if choice.finish_reason == 'length':
-                    logger.warning("Response may be truncated due to length. Be cautious when parsing JSON.")
-                openai_response = choice.message.content
-                # output_token_count = future_answer_result.usage.completion_tokens
-                # input_token_count = future_answer_result.usage.prompt_tokens
-                return openai_response, ""
+                    future_answer_result = await self.chat(messages, max_tokens, temperature)
+            choice = future_answer_result.choices[0]
+            if choice.finish_reason == 'length':
+                logger.warning("Response may be truncated due to length. Be cautious when parsing JSON.")
+            openai_response = choice.message.content
+            return LLMResponse(openai_response, "", usage_from_openai(future_answer_result))
         except Exception as e:
             logger.error(f"Error in GPTGenerator.request: {e}")
-            return "", str(e)
+            return LLMResponse("", str(e))
 
     async def chat(self, messages, max_tokens=500, temperature=0.7):
-        loop = asyncio.get_event_loop()
         if "o1" in self.model:
             data = {
                 'model': self.model,
@@ -60,8 +56,7 @@ class GPTGenerator:
         if hasattr(self, 'response_format'):
             data['response_format'] = self.response_format
 
-        func = partial(self.client.chat.completions.create, **data)
-        return await loop.run_in_executor(None, func)
+        return await self.client.chat.completions.create(**data)
 
 
 class JSONModeMixin(GPTGenerator):
@@ -80,7 +75,7 @@ class JSONModeMixin(GPTGenerator):
             messages.insert(0, {"role": "system", "content": "You are a helpful assistant designed to output json."})
         return messages
 
-    async def request(self, messages: list = None, max_tokens: int = 500, temperature: float = 0.7) -> (str, str):
+    async def request(self, messages: list = None, max_tokens: int = 500, temperature: float = 0.7) -> LLMResponse:
         messages = self.prepare_messages_for_json_mode(messages)  # Prepare messages for JSON mode
         return await super().request(messages, max_tokens, temperature)
 
@@ -0,0 +1,31 @@
+from contextlib import asynccontextmanager
+
+from aiolimiter import AsyncLimiter
+
+
+_model_limiters = {}
+
+
+def set_model_rate_limits(requests_per_minute: dict) -> None:
+    """Allow each model at most the given number of requests per minute,
+    shared by every generator and task. Models without an entry are not
+    limited."""
+    _model_limiters.clear()
+    for model, rate in requests_per_minute.items():
+        _model_limiters[model] = AsyncLimiter(rate, 60)
+
+
+@asynccontextmanager
+async def model_rate_limit(model: str):
+    limiter = _model_limiters.get(model)
+    if limiter is None:
+        yield
+        return
+    async with limiter:
+        yield
+
+
+__all__ = [
+    "set_model_rate_limits",
+    "model_rate_limit"
+]
@@ -6,24 +6,27 @@ from sanic.log import logger
 from agent.Utils import *
 import requests
 from sanic.log import logger
+from .rate_limit import model_rate_limit
+from .client_registry import get_llm_registry
+from .llm_response import LLMResponse, usage_from_openai
+from .context_packer import pack_messages
 
 
 class TogetherAIGenerator:
     def __init__(self, model=None):
         self.model = model
-        self.client = AsyncOpenAI(
-            api_key=os.environ.get("TOGETHER_API_KEY"),
-            base_url="https://api.together.xyz/v1"
-        )
+        self.client = get_llm_registry().together_client()
 
     async def request(self, messages: list = None, max_tokens: int = 500, temperature: float = 0.7
-                      ) -> (str, str):
+                      ) -> LLMResponse:
         try:
-            openai_response = await self.chat(messages, max_tokens, temperature)
-            return openai_response, ""
+            messages = pack_messages(messages, self.model, max_tokens)
+            async with model_rate_limit(self.model):
+                response = await self.chat(messages, max_tokens, temperature)
+            return LLMResponse(self.message_content(response), "", usage_from_openai(response))
         except Exception as e:
             logger.error(f"Error in TogetherAIGenerator.request: {e}")
-            return "", str(e)
+            return LLMResponse("", str(e))
 
     async def chat(self, messages, max_tokens=512, temperature=0.7):
         data = {
@@ -33,7 +36,10 @@ class TogetherAIGenerator:
             'messages': messages,
         }
 
-        response = await self.client.chat.completions.create(**data)
+        return await self.client.chat.completions.create(**data)
+
+    @staticmethod
+    def message_content(response) -> str:
         try:
             message_content = response.choices[0].message.content
             return message_content
@@ -1,6 +1,16 @@
 import json
 
-import tiktoken
+from .tokenizer import get_tokenizer
+
+
+def request_token_counts(messages, response, model='gpt-3.5-turbo') -> tuple:
+    """(input, output) tokens of one request: the usage the provider reported
+    with `response` (an LLMResponse), counted locally when it reported none"""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        return usage.prompt_tokens, usage.completion_tokens
+    response_text = response[0] if isinstance(response, tuple) else response
+    return calculation_of_token(messages, model=model), calculation_of_token(response_text, model=model)
 
 
 def calculation_of_token(messages, model='gpt-3.5-turbo', max_tokens=4096):
@@ -11,19 +21,14 @@ def calculation_of_token(messages, model='gpt-3.5-turbo', max_tokens=4096):
     :param max_tokens: Maximum number of tokens allowed
     :return: Number of tokens in the messages
     """
-    # Load encoding for the model
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        print("Warning: Model not found. Using default encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
+    # Segment counts are cached, only text new since the last call is encoded
+    tokenizer = get_tokenizer(model)
 
     truncated_messages = []
     current_tokens = 0
 
     if isinstance(messages, str):
-        tokens = encoding.encode(messages)
-        current_tokens += len(tokens)
+        current_tokens += tokenizer.count(messages)
     else:
         for message in messages:
             # if 'content' in message:  # message with 'content' field
@@ -36,8 +41,7 @@ def calculation_of_token(messages, model='gpt-3.5-turbo', max_tokens=4096):
                 for element in content:
                     if 'text' in element.get('type', ''):  # Processing text messages
                         text = element['text']
-                        tokens = encoding.encode(text)
-                        current_tokens += len(tokens)
+                        current_tokens += tokenizer.count(text)
 
                         # if current_tokens + len(tokens) <= max_tokens:
                         #     truncated_messages.append(message)
@@ -53,8 +57,7 @@ def calculation_of_token(messages, model='gpt-3.5-turbo', max_tokens=4096):
                     #     # Non-text messages
                     #     break
             else:  # content is not a list, directly process text messages
-                tokens = encoding.encode(content)
-                current_tokens += len(tokens)
+                current_tokens += tokenizer.count(content)
                 # if current_tokens + len(tokens) <= max_tokens:
                 #     truncated_messages.append(message)
                 #     current_tokens += len(tokens)
@@ -92,6 +95,8 @@ def save_token_count_to_file(filename, step_tokens, task_name, global_reward_tex
                 "total_input_tokens": 0,
                 "total_output_tokens": 0,
                 "total_tokens": 0,
+                "total_observation_tokens": 0,
+                "total_observation_elided_elements": 0,
                 }
 
     call_record = {
@@ -107,6 +112,11 @@ def save_token_count_to_file(filename, step_tokens, task_name, global_reward_tex
     data["total_input_tokens"] += step_tokens["steps_input_token_counts"]
     data["total_output_tokens"] += step_tokens["steps_output_token_counts"]
     data["total_tokens"] += step_tokens["steps_token_counts"]
+    # Files written before observation sizes were recorded lack these totals
+    data["total_observation_tokens"] = data.get("total_observation_tokens", 0) + \
+        step_tokens.get("steps_observation_token_counts", 0)
+    data["total_observation_elided_elements"] = data.get("total_observation_elided_elements", 0) + \
+        step_tokens.get("steps_observation_elided_counts", 0)
 
     # if "total_planning_input_token_cost" not in data:
     #     if planning_text_model in token_pricing["pricing_models"]:
@@ -0,0 +1,94 @@
+from collections import OrderedDict
+from functools import lru_cache
+import hashlib
+import re
+
+import tiktoken
+from sanic.log import logger
+
+
+# Splits text after line breaks that end a pre-token of the encodings in
+# SegmentedEncodingSet: the last break before the next non-space character,
+# unless a "/" follows it directly. The token count of a text in those
+# encodings is the sum of the counts of its segments.
+SEGMENT_PATTERN = re.compile(r"(?<=[\r\n])(?![\r\n/])(?=[^\S\r\n]*\S)")
+
+# Older encodings merge line breaks with the indentation after them, texts
+# are counted whole there
+SegmentedEncodingSet = frozenset(["cl100k_base", "o200k_base"])
+
+# Segments shorter than this are encoded directly, hashing them costs about
+# as much
+MIN_CACHED_LENGTH = 32
+
+
+@lru_cache(maxsize=None)
+def load_encoding(model: str):
+    """tiktoken encoding of `model`, loaded once per model"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        logger.warning(f"No tiktoken encoding for model {model}, counting with cl100k_base")
+        return tiktoken.get_encoding("cl100k_base")
+
+
+class Tokenizer:
+    """Token counts in one model's encoding.
+
+    Texts are split into line segments and the count of each segment is
+    cached by content hash, so counting a prompt that mostly repeats the
+    previous step's system prompt, trace and observation only encodes its
+    new lines."""
+
+    def __init__(self, model: str, cache_size: int = 200000):
+        self.model = model
+        self.encoding = load_encoding(model)
+        self.segmented = self.encoding.name in SegmentedEncodingSet
+        self.cache_size = cache_size
+        self.segment_counts = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "encoded_chars": 0}
+
+    def encode(self, text: str) -> list:
+        return self.encoding.encode(text)
+
+    def count_segment(self, segment: str) -> int:
+        if len(segment) < MIN_CACHED_LENGTH:
+            return len(self.encoding.encode(segment))
+        key = hashlib.blake2b(segment.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        count = self.segment_counts.get(key)
+        if count is not None:
+            self.stats["hits"] += 1
+            self.segment_counts.move_to_end(key)
+            return count
+        self.stats["misses"] += 1
+        self.stats["encoded_chars"] += len(segment)
+        count = len(self.encoding.encode(segment))
+        self.segment_counts[key] = count
+        if len(self.segment_counts) > self.cache_size:
+            self.segment_counts.popitem(last=False)
+        return count
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if not self.segmented:
+            return self.count_segment(text)
+        return sum(self.count_segment(segment) for segment in SEGMENT_PATTERN.split(text))
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model: str = "gpt-3.5-turbo") -> Tokenizer:
+    """The process-wide Tokenizer of `model`"""
+    return Tokenizer(model)
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    return get_tokenizer(model).count(text)
+
+
+__all__ = [
+    "load_encoding",
+    "Tokenizer",
+    "get_tokenizer",
+    "count_tokens"
+]
@@ -27,12 +27,10 @@ class DomMode(InteractionMode):
         logger.info(
             f"\033[32mDOM_based_planning_request:\n{planning_request}\033[0m\n")
         logger.info(f"planning_text_model: {self.text_model.model}")
-        planning_response, error_message = await self.text_model.request(planning_request)
-        # if "gpt" in self.text_model.model:
-        #     output_token_count = future_answer_result.usage.completion_tokens
-        #     input_token_count = future_answer_result.usage.prompt_tokens
-        input_token_count = calculation_of_token(planning_request, model=self.text_model.model)
-        output_token_count = calculation_of_token(planning_response, model=self.text_model.model)
+        planning_result = await self.text_model.request(planning_request)
+        planning_response, error_message = planning_result
+        input_token_count, output_token_count = request_token_counts(
+            planning_request, planning_result, model=self.text_model.model)
         planning_token_count = [input_token_count, output_token_count]
 
         return planning_response, error_message, None, None, planning_token_count
@@ -182,14 +180,14 @@ class Planning:
         status_description
     ):
 
-        gpt35 = GPTGenerator(model="gpt-3.5-turbo")
-        gpt4v = GPTGenerator(model="gpt-4-turbo")
-        gemini = GeminiGenerator(model="gemini-1.5-flash")
+        llm_registry = get_llm_registry()
+        gpt35 = llm_registry.get_generator("gpt-3.5-turbo")
+        gemini = llm_registry.get_generator("gemini-1.5-flash")
 
         all_json_models = config["model"]["json_models"]
         is_json_response = config["model"]["json_model_response"]
 
-        llm_planning_text = create_llm_instance(
+        llm_planning_text = llm_registry.get_generator(
             text_model_name, is_json_response, all_json_models)
 
         modes = {
@@ -427,3 +427,17 @@ class SemanticMatchPromptConstructor(BasePromptConstructor):
         messages = [{"role": "system", "content": self.prompt_system}, {
             "role": "user", "content": self.prompt_user}]
         return messages
+
+
+class SemanticMatchBatchPromptConstructor(BasePromptConstructor):
+    def __init__(self):
+        self.prompt_system = BasePrompts.semantic_match_batch_prompt_system
+        self.prompt_user = BasePrompts.semantic_match_batch_prompt_user
+
+    def construct(self, pairs) -> list:
+        """`pairs` of (input_answer, semantic_method), numbered from 1"""
+        self.prompt_user = Template(self.prompt_user).render(
+            pairs=[(semantic_method, input_answer) for input_answer, semantic_method in pairs])
+        messages = [{"role": "system", "content": self.prompt_system}, {
+            "role": "user", "content": self.prompt_user}]
+        return messages
@@ -58,15 +58,16 @@ class InteractionMode:
                 try:
                     if "vision" in global_reward_mode:
                         # TODO
-                        response_str, error_message = await self.visual_model.request(reward_request)
+                        reward_result = await self.visual_model.request(reward_request)
                     else:
                         print_info(
                             f"using gpt_global_reward_text: {self.text_model.model}", "purple")
-                        response_str, error_message = await self.text_model.request(reward_request)
+                        reward_result = await self.text_model.request(reward_request)
+                    response_str, error_message = reward_result
                     reward_response = ActionParser().extract_status_and_description(
                         response_str)
-                    input_token_count = calculation_of_token(reward_request, model=self.text_model.model)
-                    output_token_count = calculation_of_token(response_str, model=self.text_model.model)
+                    input_token_count, output_token_count = request_token_counts(
+                        reward_request, reward_result, model=self.text_model.model)
                     reward_input_token_count += input_token_count
                     reward_output_token_count += output_token_count
                     reward_token_count = [reward_input_token_count, reward_output_token_count]
@@ -101,13 +102,13 @@ class GlobalReward:
         ground_truth_data,
     ):
 
-        gpt4v = GPTGenerator(model="gpt-4-turbo")
-        gemini = GeminiGenerator(model="gemini-1.5-flash")
+        llm_registry = get_llm_registry()
+        gemini = llm_registry.get_generator("gemini-1.5-flash")
 
         all_json_models = config["model"]["json_models"]
         is_json_response = config["model"]["json_model_response"]
 
-        llm_global_reward_text = create_llm_instance(
+        llm_global_reward_text = llm_registry.get_generator(
             model_name, is_json_response, all_json_models)
         
         _, reward_response, reward_token_count = await InteractionMode(text_model=llm_global_reward_text, visual_model=gemini).get_global_reward(
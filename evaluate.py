@@ -1,4 +1,10 @@
 from agent.Environment.html_env.async_env import AsyncHTMLEnvironment
+from agent.Environment.html_env.browser_pool import BrowserPool
+from agent.Environment.html_env.domain_throttle import DomainThrottle
+from agent.Environment.html_env.page_settle import PageSettler
+from agent.LLM.rate_limit import set_model_rate_limits
+from agent.LLM.client_registry import configure_llm_registry, close_llm_registry
+from agent.LLM.context_packer import configure_context_sizes
 from evaluate import *
 from agent.Plan import *
 from dataclasses import dataclass
@@ -12,6 +18,8 @@ import logging
 from agent.Utils.utils import *
 # evaluate tools
 from evaluate.evaluate_utils import run_task, read_config, read_file
+from evaluate.task_scheduler import TaskScheduler, OrderedResultWriter, completed_task_indices
+from evaluate.semantic_match import configure_semantic_match
 from experiment_results import get_evaluate_result
 
 logger = logging.getLogger(__name__)
@@ -98,44 +106,61 @@ def load_ground_truth_data(config, ground_truth_mode):
     return None
 
 
-def create_html_environment(mode):
+def create_html_environment(mode, observation_config=None, browser_pool=None, domain_throttle=None,
+                            settle_config=None):
+    observation_config = observation_config or {}
+    settle_config = settle_config or {}
     return AsyncHTMLEnvironment(
         mode=mode,
         max_page_length=8192,
         headless=False,
         slow_mo=1000,
-        current_viewport_only=False,
+        current_viewport_only=observation_config.get("viewport_only", False),
+        viewport_margin=observation_config.get("viewport_margin", 0),
+        incremental_observation=observation_config.get("incremental", False),
+        changed_elements_only=observation_config.get("changed_elements_only", False),
+        observation_backend=observation_config.get("backend", "lxml"),
         viewport_size={"width": 1080, "height": 720},
         save_trace_enabled=False,
         sleep_after_execution=0.0,
         locale="en-US",
-        use_vimium_effect=True
+        use_vimium_effect=True,
+        browser_pool=browser_pool,
+        domain_throttle=domain_throttle,
+        page_settler=PageSettler(
+            network_idle_timeout=settle_config.get("network_idle_timeout", 1500),
+            dom_quiet=settle_config.get("dom_quiet", 300)),
+        adaptive_page_settle=settle_config.get("adaptive", True),
+        settle_ceilings=settle_config.get("ceilings")
     )
 
 
-async def run_experiment(task_range, experiment_config):
-    for task_index in task_range:
-        task_uuid = None
-        if experiment_config.config['basic']['task_mode'] == "batch_tasks":
-            task = experiment_config.file[task_index]
-            task_name, task_uuid, reference_task_length, reference_evaluate_steps = task
-            evaluate_steps = reference_evaluate_steps
-            log_task_info(task_index, task_name,
-                          reference_task_length, reference_evaluate_steps)
-        elif experiment_config.config['basic']['task_mode'] == "single_task":
-            task_name = experiment_config.single_task_name
-            reference_task_length = experiment_config.config['steps']['single_task_action_step']
-            # TODO
-            evaluate_steps = experiment_config.config['steps']['single_task_action_step']
-            reference_evaluate_steps = None
-            logger.info(f"task_name: {task_name}")
-
-        env = create_html_environment(experiment_config.mode)
-
-        # if not os.path.exists("token_results"):
-        #     os.makedirs("token_results")
-        # token_counts_filename = f"token_results/token_counts_{experiment_config.record_time}_{experiment_config.planning_text_model}_{experiment_config.global_reward_text_model}.json"
-
+async def run_experiment_task(task_index, experiment_config, browser_pool, domain_throttle, result_writer):
+    task_uuid = None
+    if experiment_config.config['basic']['task_mode'] == "batch_tasks":
+        task = experiment_config.file[task_index]
+        task_name, task_uuid, reference_task_length, reference_evaluate_steps, evaluation_plan = task
+        evaluate_steps = reference_evaluate_steps
+        log_task_info(task_index, task_name,
+                      reference_task_length, reference_evaluate_steps)
+    elif experiment_config.config['basic']['task_mode'] == "single_task":
+        task_name = experiment_config.single_task_name
+        reference_task_length = experiment_config.config['steps']['single_task_action_step']
+        # TODO
+        evaluate_steps = experiment_config.config['steps']['single_task_action_step']
+        reference_evaluate_steps = None
+        evaluation_plan = None
+        logger.info(f"task_name: {task_name}")
+
+    env = create_html_environment(
+        experiment_config.mode, experiment_config.config.get("observation"), browser_pool, domain_throttle,
+        experiment_config.config.get("page_settle"))
+
+    # if not os.path.exists("token_results"):
+    #     os.makedirs("token_results")
+    # token_counts_filename = f"token_results/token_counts_{experiment_config.record_time}_{experiment_config.planning_text_model}_{experiment_config.global_reward_text_model}.json"
+
+    try:
         await run_task(mode=experiment_config.mode,
                        task_mode=experiment_config.config['basic']['task_mode'],
                        task_name=task_name,
@@ -153,11 +178,57 @@ async def run_experiment(task_range, experiment_config):
                        ground_truth_data=experiment_config.ground_truth_data,
                        interaction_mode=experiment_config.config['steps']['interaction_mode'],
                        task_index=task_index,
-                       record_time=experiment_config.record_time,)
+                       record_time=experiment_config.record_time,
+                       result_writer=result_writer,
+                       evaluation_plan=evaluation_plan)
                     #    token_pricing=experiment_config.config['token_pricing'])
-
+    finally:
         await env.close()
-        del env
+
+
+async def run_experiment(task_range, experiment_config):
+    scheduler_config = experiment_config.config.get("scheduler", {})
+    max_concurrent_tasks = scheduler_config.get("max_concurrent_tasks", 1)
+    if experiment_config.config['steps']['interaction_mode'] and max_concurrent_tasks > 1:
+        logger.warning("interaction_mode reads from the console, running tasks one at a time")
+        max_concurrent_tasks = 1
+    set_model_rate_limits(scheduler_config.get("model_requests_per_minute", {}))
+    # LLM clients and their connections are shared by every step and task
+    configure_llm_registry(experiment_config.config.get("llm_client"))
+    configure_context_sizes(experiment_config.config.get("llm_client", {}).get("context_sizes"))
+    semantic_match_service = configure_semantic_match(experiment_config.config.get("semantic_match"))
+    # Page loads of concurrent tasks are spaced out per domain
+    domain_throttle = None
+    if max_concurrent_tasks > 1:
+        domain_throttle = DomainThrottle(
+            scheduler_config.get("max_concurrent_per_domain", 2),
+            scheduler_config.get("domain_interval", 1.0))
+    if scheduler_config.get("resume", False) and experiment_config.config['basic']['task_mode'] == "batch_tasks":
+        completed = completed_task_indices(experiment_config.write_result_file_path)
+        task_range = [task_index for task_index in task_range if task_index not in completed]
+        logger.info(f"Resuming, {len(completed)} tasks already have results")
+
+    # One browser for the whole run, each task gets a fresh context of it
+    browser_pool = BrowserPool(
+        headless=False,
+        slow_mo=1000,
+        max_contexts_per_browser=experiment_config.config.get(
+            "browser", {}).get("max_contexts_per_browser", 50))
+    result_writer = OrderedResultWriter(task_range)
+    scheduler = TaskScheduler(max_concurrent_tasks)
+    try:
+        await scheduler.run(
+            task_range,
+            lambda task_index: run_experiment_task(
+                task_index, experiment_config, browser_pool, domain_throttle, result_writer),
+            result_writer)
+    finally:
+        try:
+            await browser_pool.close()
+        finally:
+            await close_llm_registry()
+    logger.info(f"Browser pool metrics: {browser_pool.get_metrics()}")
+    logger.info(f"Semantic match stats: {semantic_match_service.stats}")
 
     # with open(token_counts_filename, 'r') as file:
     #     data = json.load(file)
@@ -1,2 +1,3 @@
 from .step_score import *
-from .task_score import *
\ No newline at end of file
+from .task_score import *
+from .rubric_plan import *
\ No newline at end of file
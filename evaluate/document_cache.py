@@ -0,0 +1,53 @@
+from collections import OrderedDict
+from functools import lru_cache
+
+from cssselect import HTMLTranslator
+from lxml import etree, html
+
+
+class ParsedDocument:
+    """One lxml parse of a page, queried by the element-path matchers"""
+
+    def __init__(self, html_content: str):
+        self.root = html.fromstring(html_content)
+
+    def select_one(self, selector: str):
+        """First element matching a CSS selector in document order, or None"""
+        elements = compile_selector(selector)(self.root)
+        return elements[0] if elements else None
+
+    def xpath(self, expression: str) -> list:
+        return self.root.xpath(expression)
+
+
+@lru_cache(maxsize=1024)
+def compile_selector(selector: str) -> etree.XPath:
+    """HTML semantics, as in the browser: case-insensitive tag names and
+    :checked, :disabled or :link read from the element's attributes"""
+    return etree.XPath(HTMLTranslator().css_to_xpath(selector))
+
+
+# Keyed by the page html itself: str caches its hash, and the snapshot
+# string shared by a step is the same object for every rubric item
+_documents = OrderedDict()
+MAX_CACHED_DOCUMENTS = 4
+
+
+def get_parsed_document(html_content: str) -> ParsedDocument:
+    """Parse `html_content` once, however many matchers of a step ask for it"""
+    document = _documents.get(html_content)
+    if document is not None:
+        _documents.move_to_end(html_content)
+        return document
+    document = ParsedDocument(html_content)
+    _documents[html_content] = document
+    if len(_documents) > MAX_CACHED_DOCUMENTS:
+        _documents.popitem(last=False)
+    return document
+
+
+__all__ = [
+    "ParsedDocument",
+    "compile_selector",
+    "get_parsed_document"
+]
@@ -13,6 +13,7 @@ from agent.Plan import Planning
 from agent.Utils.utils import save_screenshot, is_valid_base64
 from agent.Reward.global_reward import GlobalReward
 from evaluate import FinishTaskEvaluator, TaskLengthEvaluator, URLEvaluator, ElementEvaluator
+from evaluate.rubric_plan import EvaluationPlan, StepInputs, compile_evaluation_plan
 from logs import logger
 
 
@@ -87,8 +88,10 @@ def read_file(file_path="./data/example/example_130.json"):
                         f"element_value error in task {task_name_id}, step {i}, match_function: {match_function}")
                     exit(1)
 
+        # Compiled once here, so steps only run the matchers still pending
         return_list.append(
-            [task_name, task_name_id, reference_task_length, reference_evaluate_steps])
+            [task_name, task_name_id, reference_task_length, reference_evaluate_steps,
+             compile_evaluation_plan(reference_evaluate_steps)])
 
     return return_list
 
@@ -105,140 +108,21 @@ async def adjust_max_action_step(conditions, current_info, encountered_errors, i
     return total_increase, encountered_errors
 
 
-def get_netloc(url: str) -> str:
-    """Extract the domain name, for example, extract 'zhihu' from 'zhihu.com', extract 'google' from 'www.google.com.hk' """
-    url = urlparse(url)
-    try:
-        if url.netloc.startswith("www"):
-            netloc = re.findall(".*?\.(.*?)\..*?", url.netloc)[0]
-        else:
-            netloc = re.findall("(.*?)\..*?", url.netloc)[0]
-    except:
-        netloc = ""
-    return netloc
-
-
-async def step_evaluate(page: Page, evaluate_steps=[], input_path=None, element_value=None, text_content=None):
-    """Evaluate step score"""
+async def step_evaluate(page: Page, evaluate_steps=[], input_path=None, element_value=None, text_content=None,
+                        get_html_content=None, evaluation_plan: EvaluationPlan = None):
+    """Evaluate step score. `get_html_content` returns the page html, by
+    default page.content(); AsyncHTMLEnvironment.get_html_content shares the
+    environment's snapshot instead of serializing the page again.
+    `evaluation_plan` is the task's rubric compiled by read_file, compiled
+    here when it is not given."""
+    if evaluation_plan is None:
+        evaluation_plan = compile_evaluation_plan(evaluate_steps)
+    step_inputs = StepInputs(page.url, input_path, element_value, text_content,
+                             get_html_content or page.content)
+    await evaluation_plan.evaluate(step_inputs)
     step_score = 0
     match_result = []
     for evaluate in evaluate_steps:
-        score = 0
-        if evaluate["score"] != 1:
-            match_function = evaluate["match_function"]
-            if match_function == "url_exactly_match":
-                score = URLEvaluator.url_exact_match(
-                    page.url, evaluate["reference_answer"], evaluate["key"])
-            elif match_function == "url_included_match":
-                score = URLEvaluator.url_include_match(
-                    page.url, evaluate["reference_answer"], evaluate["key"])
-            elif match_function == "url_semantic_match":
-                score = await URLEvaluator.url_semantic_match(
-                    page.url, evaluate["reference_answer"], evaluate["key"])
-                # print(score, "url_semantic_match")
-            elif match_function == "element_path_exactly_match":
-                input_netloc = get_netloc(page.url)
-                method = evaluate["method"]
-                score = ElementEvaluator.path_exact_match(
-                    input_path, evaluate["reference_answer"], method, await page.content(), input_netloc,
-                    evaluate["netloc"])
-                # print(score, "path_exact_match:", input_path,
-                #       "***", evaluate["reference_answer"])
-            elif match_function == "element_path_included_match":
-                pass
-                # * Temporarily not doing
-
-            elif match_function == "element_value_exactly_match":
-                if input_path is not None and element_value is not None:
-                    input_netloc = get_netloc(page.url)
-
-                    # print(element_value)
-                    # print(await page.locator(input_path).input_value())
-                    if "path" in evaluate.keys():
-                        path_score = ElementEvaluator.path_exact_match(input_path, evaluate["path"], "selector",
-                                                                       await page.content(), input_netloc,
-                                                                       evaluate["netloc"])
-                        if path_score == 0:
-                            # print("Path mismatch in value evaluation")
-                            score = 0
-                        else:
-                            score = ElementEvaluator.element_value_exact_match(
-                                element_value, evaluate["reference_answer"], input_netloc, evaluate["netloc"])
-                    else:
-                        score = ElementEvaluator.element_value_exact_match(
-                            element_value, evaluate["reference_answer"], input_netloc, evaluate["netloc"])
-                    # print(score, "element_value_exactly_match",
-                    #       element_value, "*", evaluate["reference_answer"])
-                else:
-                    score = 0
-            elif match_function == "element_value_included_match":
-                if input_path is not None and element_value is not None:
-                    input_netloc = get_netloc(page.url)
-                    if "path" in evaluate.keys():
-                        path_score = ElementEvaluator.path_exact_match(input_path, evaluate["path"], "selector",
-                                                                       await page.content(), input_netloc,
-                                                                       evaluate["netloc"])
-                        if path_score == 0:
-                            # print("Path mismatch in value evaluation")
-                            score = 0
-                        else:
-                            score = ElementEvaluator.element_value_include_match(
-                                element_value, evaluate["reference_answer"], input_netloc, evaluate["netloc"])
-                    else:
-                        score = ElementEvaluator.element_value_include_match(
-                            element_value, evaluate["reference_answer"], input_netloc, evaluate["netloc"])
-                    # print(score, "element_value_included_match",
-                    #       element_value, "*", evaluate["reference_answer"])
-                else:
-                    score = 0
-            elif match_function == "element_value_semantic_match":
-                if input_path is not None and element_value is not None:
-                    input_netloc = get_netloc(page.url)
-
-                    if len(element_value) > 0:
-                        if "path" in evaluate.keys():
-                            path_score = ElementEvaluator.path_exact_match(input_path, evaluate["path"], "selector",
-                                                                           await page.content(), input_netloc,
-                                                                           evaluate["netloc"])
-                            if path_score == 0:
-                                # print("Path mismatch in value evaluation")
-                                score = 0
-                            else:
-                                score = await ElementEvaluator.element_value_semantic_match(
-                                    element_value, evaluate["reference_answer"], input_netloc, evaluate["netloc"])
-                        else:
-                            score = await ElementEvaluator.element_value_semantic_match(
-                                element_value, evaluate["reference_answer"], input_netloc, evaluate["netloc"])
-                        # print(score, "element_value_semantic_match",
-                        #       element_value, "*", evaluate["reference_answer"])
-                else:
-                    score = 0
-            elif match_function == "cache_data_exact_match":
-                if text_content is not None and text_content != "":
-                    score = TextEvaluator.text_exact_match(
-                        text_content, evaluate["reference_answer"])
-            elif match_function == "cache_data_included_match":
-                if text_content is not None and text_content != "":
-                    score = TextEvaluator.text_included_match(
-                        text_content, evaluate["reference_answer"])
-            elif match_function == "cache_data_semantic_match":
-                if text_content is not None and text_content != "":
-                    score = TextEvaluator.text_semantic_match(
-                        text_content, evaluate["reference_answer"])
-            elif match_function == "final_answer_exact_match":
-                if text_content is not None and text_content != "":
-                    score = TextEvaluator.text_exact_match(
-                        text_content, evaluate["reference_answer"])
-            elif match_function == "final_answer_included_match":
-                if text_content is not None and text_content != "":
-                    score = TextEvaluator.text_included_match(
-                        text_content, evaluate["reference_answer"])
-            elif match_function == "final_answer_semantic_match":
-                if text_content is not None and text_content != "":
-                    score = TextEvaluator.text_semantic_match(
-                        text_content, evaluate["reference_answer"])
-
-            evaluate["score"] = max(evaluate["score"], score)
         if evaluate["score"] >= 1:
             match_result.append(
                 {evaluate["match_function"]: evaluate["reference_answer"]})
@@ -336,7 +220,9 @@ async def run_task(
         interaction_mode,
         task_index,
         record_time=None,
-        token_pricing=None
+        token_pricing=None,
+        result_writer=None,
+        evaluation_plan=None
 ):
     await env.reset("about:blank")
 
@@ -363,6 +249,10 @@ async def run_task(
     conditions = config["conditions"]
     increase_step = config["steps"]["batch_tasks_condition_step_increase"]
     encountered_errors = set()
+    # Cap the accessibility tree at env.max_page_length tokens when enabled
+    observation_token_budget = env.max_page_length \
+        if config.get("observation", {}).get("token_budget", False) else None
+    observation_token_stats = config.get("observation", {}).get("token_stats", False)
     current_info = {"URL": env.page.url}
     num_steps = 0
     step_index = 0
@@ -389,6 +279,8 @@ async def run_task(
     steps_reward_output_token_counts = 0
     steps_input_token_counts = 0
     steps_output_token_counts = 0
+    steps_observation_token_counts = 0
+    steps_observation_elided_counts = 0
     token_counts_filename = f"token_results/token_counts_{record_time}_{planning_text_model}_{global_reward_text_model}.json"
 
     while num_steps < max_steps + additional_steps:
@@ -399,6 +291,7 @@ async def run_task(
         planning_input_token_count = 0
         planning_output_token_count = 0
         reward_token_count = [0, 0]
+        observation_stats = {"tokens": 0, "elements": 0, "elided": 0}
 
         logger.info(
             "**🤖 The agent is in the process of starting planning 🤖**")
@@ -468,7 +361,9 @@ async def run_task(
             if task_mode == "batch_tasks":
                 try:
                     evaluate_steps, match_result = await step_evaluate(page=env.page, evaluate_steps=evaluate_steps,
-                                                                       input_path=selector, element_value=element_value, text_content=text_content)
+                                                                       input_path=selector, element_value=element_value, text_content=text_content,
+                                                                       get_html_content=env.get_html_content,
+                                                                       evaluation_plan=evaluation_plan)
                 except Exception as ee:
                     logger.info(f"Current step evaluate error :{ee}")
 
@@ -512,11 +407,16 @@ async def run_task(
                 error_description = error_message
 
             if mode in ["d_v", "dom_v_desc", "vision_to_dom"]:
-                observation, observation_VforD = await env.get_obs()
+                observation, observation_VforD = await env.get_obs(
+                    token_budget=observation_token_budget, user_request=task_name,
+                    token_model=planning_text_model, token_stats=observation_token_stats)
                 save_screenshot(mode=mode, record_time=record_time, task_name=task_name,
                                 step_number=num_steps, description="obs", screenshot_base64=observation_VforD)
             else:
-                observation = await env.get_obs()
+                observation = await env.get_obs(
+                    token_budget=observation_token_budget, user_request=task_name,
+                    token_model=planning_text_model, token_stats=observation_token_stats)
+            observation_stats = env.observation_stats
 
             # URL after executing the action
             each_step_dict["step_url"] = env.page.url
@@ -574,7 +474,10 @@ async def run_task(
             "reward_token_count": reward_token_count_number,
             "input_token_count": step_input_token_count,
             "output_token_count": step_output_token_count,
-            "token_count": step_token_count
+            "token_count": step_token_count,
+            "observation_token_count": observation_stats["tokens"],
+            "observation_element_count": observation_stats["elements"],
+            "observation_elided_count": observation_stats["elided"]
         }
 
         step_tokens["steps_tokens_record"].append(single_step_tokens)
@@ -586,6 +489,8 @@ async def run_task(
         steps_input_token_counts += step_input_token_count
         steps_output_token_counts += step_output_token_count
         steps_token_counts += step_token_count
+        steps_observation_token_counts += observation_stats["tokens"]
+        steps_observation_elided_counts += observation_stats["elided"]
 
     step_tokens["steps_planning_input_token_counts"] = steps_planning_input_token_counts
     step_tokens["steps_planning_output_token_counts"] = steps_planning_output_token_counts
@@ -594,6 +499,8 @@ async def run_task(
     step_tokens["steps_input_token_counts"] = steps_input_token_counts
     step_tokens["steps_output_token_counts"] = steps_output_token_counts
     step_tokens["steps_token_counts"] = steps_token_counts
+    step_tokens["steps_observation_token_counts"] = steps_observation_token_counts
+    step_tokens["steps_observation_elided_counts"] = steps_observation_elided_counts
 
     save_token_count_to_file(token_counts_filename, step_tokens, task_name, global_reward_text_model,
                              planning_text_model, config["token_pricing"])
@@ -641,6 +548,10 @@ async def run_task(
             os.makedirs(json_result_folder)
         json_out_file_path = os.path.join(
             json_result_folder, str(task_index) + "_" + str(task_result["id"]) + ".json")
+        # Scheduled runs write results in task order through an OrderedResultWriter
+        if result_writer is not None:
+            result_writer.write(task_index, json_out_file_path, task_result)
+            return
         logger.info(f"Write results to json file: {json_out_file_path}")
         with open(json_out_file_path, 'w') as json_file:
             json.dump(task_result, json_file)
\ No newline at end of file
@@ -0,0 +1,253 @@
+import asyncio
+import re
+from urllib.parse import parse_qs, urlparse, unquote
+
+from .step_score import MatchFunction, ElementEvaluator
+
+
+WWW_NETLOC_PATTERN = re.compile(r".*?\.(.*?)\..*?")
+NETLOC_PATTERN = re.compile(r"(.*?)\..*?")
+
+
+def get_netloc(url: str) -> str:
+    """Extract the domain name, for example, extract 'zhihu' from 'zhihu.com', extract 'google' from 'www.google.com.hk' """
+    url = urlparse(url)
+    try:
+        if url.netloc.startswith("www"):
+            netloc = WWW_NETLOC_PATTERN.findall(url.netloc)[0]
+        else:
+            netloc = NETLOC_PATTERN.findall(url.netloc)[0]
+    except:
+        netloc = ""
+    return netloc
+
+
+class StepInputs:
+    """What the agent did in one step, read by the matchers of the rubric.
+    Derived inputs are computed on first use and shared by every matcher."""
+
+    def __init__(self, url: str, input_path=None, element_value=None, text_content=None,
+                 get_html_content=None):
+        self.url = url
+        self.input_path = input_path
+        self.element_value = element_value
+        self.text_content = text_content
+        self.get_html_content = get_html_content
+        self._parsed_url = None
+        self._url_params = None
+        self._netloc = None
+        self._html_task = None
+
+    @property
+    def parsed_url(self):
+        if self._parsed_url is None:
+            self._parsed_url = urlparse(self.url)
+        return self._parsed_url
+
+    @property
+    def url_params(self) -> dict:
+        if self._url_params is None:
+            self._url_params = parse_qs(self.parsed_url.query)
+        return self._url_params
+
+    @property
+    def netloc(self) -> str:
+        if self._netloc is None:
+            self._netloc = get_netloc(self.url)
+        return self._netloc
+
+    def html_task(self) -> asyncio.Future:
+        # A task, so concurrent matchers wait for the same page.content()
+        if self._html_task is None:
+            self._html_task = asyncio.ensure_future(self.get_html_content())
+        return self._html_task
+
+    async def html_content(self) -> str:
+        return await self.html_task()
+
+    def prefetch(self, inputs: set) -> None:
+        """Compute the derived inputs named in `inputs` once, before the
+        matchers that read them run. The page html is only fetched when the
+        step has a selector to look up in it."""
+        if "url" in inputs and self._netloc is None:
+            self._netloc = get_netloc(self.url)
+            self._url_params = parse_qs(self.parsed_url.query)
+        if "dom" in inputs and self.input_path is not None and self.get_html_content is not None:
+            self.html_task()
+
+
+class RubricMatcher:
+    """One rubric item of a task. `evaluate` is the item's dict in
+    reference_evaluate_steps, which keeps the score and is written to the
+    results; the matcher only holds what was parsed from it. `inputs` names
+    the StepInputs it reads, see StepInputs.prefetch."""
+    inputs = ()
+
+    def __init__(self, evaluate: dict):
+        self.evaluate = evaluate
+        self.match_function = evaluate["match_function"]
+        self.reference_answer = evaluate["reference_answer"]
+        self.mode = self.match_function.rsplit("_", 2)[-2]
+
+    @property
+    def satisfied(self) -> bool:
+        return self.evaluate["score"] == 1
+
+    async def score(self, step_inputs: StepInputs):
+        return 0
+
+    async def match(self, input_answer: str, reference_answer: str):
+        if self.mode in ("exactly", "exact"):
+            return MatchFunction.exact_match(input_answer, reference_answer)
+        if self.mode == "included":
+            return MatchFunction.include_match(input_answer, reference_answer)
+        return await MatchFunction.semantic_match(input_answer, reference_answer)
+
+
+class URLMatcher(RubricMatcher):
+    inputs = ("url",)
+
+    def __init__(self, evaluate: dict):
+        super().__init__(evaluate)
+        self.key = evaluate.get("key")
+
+    def input_answer(self, step_inputs: StepInputs):
+        if self.key:
+            values = step_inputs.url_params.get(self.key)
+            if not values:
+                return None
+            return unquote(values[0])
+        if self.mode == "included":
+            parsed_url = step_inputs.parsed_url
+            input_answer = parsed_url.netloc + parsed_url.path
+            if parsed_url.fragment:
+                input_answer += "#" + parsed_url.fragment
+            return unquote(input_answer)
+        return unquote(step_inputs.url)
+
+    async def score(self, step_inputs: StepInputs):
+        input_answer = self.input_answer(step_inputs)
+        if input_answer is None:
+            return 0
+        return await self.match(input_answer, self.reference_answer)
+
+
+class ElementPathMatcher(RubricMatcher):
+    inputs = ("url", "selector", "dom")
+
+    def __init__(self, evaluate: dict):
+        super().__init__(evaluate)
+        self.method = evaluate["method"]
+        self.netloc = evaluate["netloc"]
+
+    async def score(self, step_inputs: StepInputs):
+        # element_path_included_match is not scored yet
+        if self.mode != "exactly" or step_inputs.input_path is None:
+            return 0
+        if step_inputs.netloc != self.netloc:
+            return 0
+        return ElementEvaluator.path_exact_match(
+            step_inputs.input_path, self.reference_answer, self.method, await step_inputs.html_content(),
+            step_inputs.netloc, self.netloc)
+
+
+class ElementValueMatcher(RubricMatcher):
+    inputs = ("url", "selector", "value", "dom")
+
+    def __init__(self, evaluate: dict):
+        super().__init__(evaluate)
+        self.netloc = evaluate["netloc"]
+        self.path = evaluate.get("path")
+        if self.path is None:
+            self.inputs = ("url", "value")
+
+    async def score(self, step_inputs: StepInputs):
+        if step_inputs.input_path is None or step_inputs.element_value is None:
+            return 0
+        if step_inputs.netloc != self.netloc:
+            return 0
+        if self.mode == "semantic" and len(step_inputs.element_value) == 0:
+            return 0
+        if self.path is not None:
+            path_score = ElementEvaluator.path_exact_match(
+                step_inputs.input_path, self.path, "selector", await step_inputs.html_content(),
+                step_inputs.netloc, self.netloc)
+            if path_score == 0:
+                return 0
+        return await self.match(step_inputs.element_value, self.reference_answer)
+
+
+class TextMatcher(RubricMatcher):
+    """cache_data and final_answer items, compared case-insensitively
+    except for semantic matches"""
+    inputs = ("text",)
+
+    def __init__(self, evaluate: dict):
+        super().__init__(evaluate)
+        self.lower_reference_answer = self.reference_answer.lower()
+
+    async def score(self, step_inputs: StepInputs):
+        text_content = step_inputs.text_content
+        if text_content is None or text_content == "":
+            return 0
+        if self.mode == "semantic":
+            return await self.match(text_content, self.reference_answer)
+        return await self.match(text_content.lower(), self.lower_reference_answer)
+
+
+# Matcher of each match_function prefix, see read_file
+RubricMatcherDict = {
+    "url": URLMatcher,
+    "element_path": ElementPathMatcher,
+    "element_value": ElementValueMatcher,
+    "cache_data": TextMatcher,
+    "final_answer": TextMatcher
+}
+
+
+def create_matcher(evaluate: dict) -> RubricMatcher:
+    for prefix, matcher_class in RubricMatcherDict.items():
+        if evaluate["match_function"].startswith(prefix):
+            return matcher_class(evaluate)
+    return RubricMatcher(evaluate)
+
+
+class EvaluationPlan:
+    """The rubric of a task compiled once into matchers. Each step runs only
+    the matchers whose item is not satisfied yet, all of them concurrently."""
+
+    def __init__(self, evaluate_steps: list):
+        self.evaluate_steps = evaluate_steps
+        self.matchers = [create_matcher(evaluate) for evaluate in evaluate_steps]
+
+    def pending(self) -> list:
+        return [matcher for matcher in self.matchers if not matcher.satisfied]
+
+    async def evaluate(self, step_inputs: StepInputs) -> None:
+        """Raise the score of every pending item to what this step reached"""
+        pending = self.pending()
+        if not pending:
+            return
+        step_inputs.prefetch(set().union(*(matcher.inputs for matcher in pending)))
+        scores = await asyncio.gather(*(matcher.score(step_inputs) for matcher in pending))
+        for matcher, score in zip(pending, scores):
+            matcher.evaluate["score"] = max(matcher.evaluate["score"], score)
+
+
+def compile_evaluation_plan(evaluate_steps: list) -> EvaluationPlan:
+    return EvaluationPlan(evaluate_steps)
+
+
+__all__ = [
+    "get_netloc",
+    "StepInputs",
+    "RubricMatcher",
+    "URLMatcher",
+    "ElementPathMatcher",
+    "ElementValueMatcher",
+    "TextMatcher",
+    "RubricMatcherDict",
+    "create_matcher",
+    "EvaluationPlan",
+    "compile_evaluation_plan"
+]
@@ -0,0 +1,256 @@
+from collections import OrderedDict
+from typing import List, Tuple, Union
+import asyncio
+import json
+import os
+import re
+
+from agent.LLM import get_llm_registry
+from agent.Prompt import SemanticMatchPromptConstructor, SemanticMatchBatchPromptConstructor
+from logs import logger
+
+
+SCORE_PATTERN = re.compile(r"```(.*?)```", re.S)
+BATCH_SCORE_PATTERN = re.compile(r"(\d+)\s*[:.)]\s*(-?\d+(?:\.\d+)?)")
+WORD_PATTERN = re.compile(r"\w+")
+
+# Words of a judge rule that say nothing about the expected answer
+RuleStopWordSet = frozenset([
+    "decide", "whether", "judge", "the", "a", "an", "is", "are", "i", "i'm", "im", "am",
+    "looking", "for", "of", "in", "to", "and", "or", "it", "this", "that", "be", "with"
+])
+
+
+def parse_score(text: str) -> Union[float, None]:
+    try:
+        return max(0.0, min(1.0, float(text.strip())))
+    except ValueError:
+        return None
+
+
+def round_score(score: float) -> Union[int, float]:
+    return int(score) if score in (0, 1) else round(score, 2)
+
+
+class LLMSemanticScorer:
+    """Asks an LLM to score answers against judge rules, one pair per
+    request or several numbered pairs in one request"""
+    name = "llm"
+
+    def __init__(self, model: str = "gpt-3.5-turbo", retries: int = 3):
+        self.model = model
+        self.retries = retries
+        self.generator = None
+        # Scores of different models are cached apart
+        self.name = f"{LLMSemanticScorer.name}:{model}"
+
+    async def score_batch(self, pairs: List[Tuple[str, str]]) -> List[Union[float, None]]:
+        """Scores of (input_answer, semantic_method) pairs, None where the
+        model never gave a usable score"""
+        scores = [None] * len(pairs)
+        if self.generator is None:
+            self.generator = get_llm_registry().get_generator(self.model)
+        for _ in range(self.retries):
+            missing = [i for i, score in enumerate(scores) if score is None]
+            if not missing:
+                break
+            if len(missing) == 1:
+                input_answer, semantic_method = pairs[missing[0]]
+                messages = SemanticMatchPromptConstructor().construct(input_answer, semantic_method)
+            else:
+                messages = SemanticMatchBatchPromptConstructor().construct([pairs[i] for i in missing])
+            response, error_message = await self.generator.request(messages)
+            if error_message:
+                logger.error(f"Semantic match request failed: {error_message}")
+                continue
+            blocks = SCORE_PATTERN.findall(response)
+            if len(missing) == 1:
+                if blocks:
+                    scores[missing[0]] = parse_score(blocks[0])
+                continue
+            for block in blocks or [response]:
+                for number, value in BATCH_SCORE_PATTERN.findall(block):
+                    position = int(number) - 1
+                    if 0 <= position < len(missing) and scores[missing[position]] is None:
+                        scores[missing[position]] = parse_score(value)
+        return scores
+
+
+class TokenOverlapScorer:
+    """Offline scorer for CI: the share of the answer's words that the judge
+    rule mentions, ignoring the rule's boilerplate words"""
+    name = "token_overlap"
+
+    async def score_batch(self, pairs: List[Tuple[str, str]]) -> List[Union[float, None]]:
+        scores = []
+        for input_answer, semantic_method in pairs:
+            answer_words = set(WORD_PATTERN.findall(input_answer.lower()))
+            rule_words = set(WORD_PATTERN.findall(semantic_method.lower())) - RuleStopWordSet
+            if not answer_words or not rule_words:
+                scores.append(0.0)
+                continue
+            scores.append(len(answer_words & rule_words) / len(answer_words))
+        return scores
+
+
+SemanticScorerDict = {
+    LLMSemanticScorer.name: LLMSemanticScorer,
+    TokenOverlapScorer.name: TokenOverlapScorer
+}
+
+
+class SemanticMatchService:
+    """Scores semantic rubric items through a pluggable scorer.
+
+    Scores are kept in an LRU cache keyed by scorer, input and rule, and
+    appended to `cache_path` as JSON lines so later runs start warm. Calls
+    made in the same event loop turn, such as the items of one step under
+    asyncio.gather, are sent together in batches of up to `batch_size`.
+    A caller waits at most `timeout` seconds and then scores 0, while the
+    request goes on and caches its score for the next step."""
+
+    def __init__(self, scorer=None, cache_size: int = 4096, cache_path: str = "",
+                 batch_size: int = 1, timeout: float = 60):
+        self.scorer = scorer if scorer is not None else LLMSemanticScorer()
+        self.cache_size = cache_size
+        self.cache_path = cache_path
+        self.batch_size = max(1, batch_size)
+        self.timeout = timeout
+        self.cache = OrderedDict()
+        self.pending = OrderedDict()
+        self.in_flight = {}
+        self.flush_scheduled = False
+        self.flush_tasks = set()
+        self.stats = {"hits": 0, "misses": 0, "requests": 0, "timeouts": 0}
+        if cache_path and os.path.exists(cache_path):
+            self.load_cache()
+
+    def cache_key(self, input_answer: str, semantic_method: str) -> tuple:
+        return (self.scorer.name, input_answer, semantic_method)
+
+    def load_cache(self) -> None:
+        with open(self.cache_path, encoding="utf-8") as cache_file:
+            for line in cache_file:
+                try:
+                    scorer_name, input_answer, semantic_method, score = json.loads(line)
+                except ValueError:
+                    continue
+                self.remember((scorer_name, input_answer, semantic_method), score)
+
+    def remember(self, key: tuple, score: float) -> None:
+        self.cache[key] = score
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def persist(self, entries: list) -> None:
+        if not self.cache_path or not entries:
+            return
+        folder = os.path.dirname(self.cache_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        with open(self.cache_path, "a", encoding="utf-8") as cache_file:
+            for key, score in entries:
+                cache_file.write(json.dumps([*key, score], ensure_ascii=False) + "\n")
+
+    async def score(self, input_answer: str, semantic_method: str) -> float:
+        key = self.cache_key(input_answer, semantic_method)
+        if key in self.cache:
+            self.stats["hits"] += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        future = self.pending.get(key) or self.in_flight.get(key)
+        if future is None:
+            self.stats["misses"] += 1
+            future = asyncio.get_running_loop().create_future()
+            self.pending[key] = future
+            if len(self.pending) >= self.batch_size:
+                self.start_flush(self.flush())
+            elif not self.flush_scheduled:
+                self.flush_scheduled = True
+                self.start_flush(self.flush_soon())
+        try:
+            # Shielded, so a timed out caller leaves the request to the others
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout or None)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.warning(f"Semantic match timed out after {self.timeout}s, scored 0")
+            return 0
+
+    async def score_many(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        return await asyncio.gather(*(self.score(input_answer, semantic_method)
+                                      for input_answer, semantic_method in pairs))
+
+    def start_flush(self, flush) -> None:
+        task = asyncio.create_task(flush)
+        self.flush_tasks.add(task)
+        task.add_done_callback(self.flush_tasks.discard)
+
+    async def flush_soon(self) -> None:
+        # Let the other coroutines of this turn queue their pairs first
+        await asyncio.sleep(0)
+        self.flush_scheduled = False
+        await self.flush()
+
+    async def flush(self) -> None:
+        while self.pending:
+            batch = []
+            while self.pending and len(batch) < self.batch_size:
+                batch.append(self.pending.popitem(last=False))
+            keys = [key for key, _ in batch]
+            self.in_flight.update(batch)
+            self.stats["requests"] += 1
+            try:
+                scores = await self.scorer.score_batch([(key[1], key[2]) for key in keys])
+            except Exception as e:
+                logger.error(f"Semantic match scorer failed: {e}")
+                scores = [None] * len(keys)
+            entries = []
+            for (key, future), score in zip(batch, scores):
+                if score is not None:
+                    score = round_score(score)
+                    self.remember(key, score)
+                    entries.append((key, score))
+                self.in_flight.pop(key, None)
+                if not future.done():
+                    future.set_result(score if score is not None else 0)
+            self.persist(entries)
+
+
+_service = None
+
+
+def configure_semantic_match(semantic_config: Union[dict, None] = None) -> SemanticMatchService:
+    """Replace the shared service from the [semantic_match] settings"""
+    global _service
+    semantic_config = semantic_config or {}
+    scorer_name = semantic_config.get("scorer", LLMSemanticScorer.name)
+    if scorer_name not in SemanticScorerDict:
+        raise ValueError(f"Unknown semantic match scorer {scorer_name}")
+    if scorer_name == LLMSemanticScorer.name:
+        scorer = LLMSemanticScorer(model=semantic_config.get("model", "gpt-3.5-turbo"))
+    else:
+        scorer = SemanticScorerDict[scorer_name]()
+    _service = SemanticMatchService(
+        scorer=scorer,
+        cache_size=semantic_config.get("cache_size", 4096),
+        cache_path=semantic_config.get("cache_path", ""),
+        batch_size=semantic_config.get("batch_size", 1),
+        timeout=semantic_config.get("timeout", 60))
+    return _service
+
+
+def get_semantic_match_service() -> SemanticMatchService:
+    if _service is None:
+        configure_semantic_match()
+    return _service
+
+
+__all__ = [
+    "LLMSemanticScorer",
+    "TokenOverlapScorer",
+    "SemanticScorerDict",
+    "SemanticMatchService",
+    "configure_semantic_match",
+    "get_semantic_match_service"
+]
@@ -1,12 +1,12 @@
 import re
 from urllib.parse import parse_qs, urlparse, unquote
-from bs4 import BeautifulSoup
 
 import requests
-from lxml import html
 from agent.LLM import *
 from agent.Prompt import *
 from agent.Environment.html_env.utils import MapTagNameList
+from .document_cache import get_parsed_document
+from .semantic_match import get_semantic_match_service
 
 
 class StepEvaluator():
@@ -78,6 +78,8 @@ class ElementEvaluator(StepEvaluator):
     '''Element evaluation and scoring'''
     @staticmethod
     def path_exact_match(input_answer, reference_answer, method, html_content, input_netloc, reference_netloc):
+        """The page is parsed once per html snapshot and shared by all the
+        matchers of a step, see get_parsed_document"""
         score = 0
         if method == "xpath":
             if reference_netloc != input_netloc:
@@ -85,12 +87,12 @@ class ElementEvaluator(StepEvaluator):
                 #       "input_netloc:", input_netloc)
                 return 0
             try:
-                tree = html.fromstring(html_content)
-                input_elements = tree.xpath(input_answer)
-                reference_elements = tree.xpath(reference_answer)
+                document = get_parsed_document(html_content)
+                input_elements = document.xpath(input_answer)
+                reference_elements = document.xpath(reference_answer)
             except:
-                score = 0
-            if (input_elements is not None) and (reference_elements is not None):
+                return 0
+            if input_elements and reference_elements:
                 score = input_elements[0] is reference_elements[0]
                 try:
                     if reference_elements[0].tag in MapTagNameList:
@@ -111,14 +113,14 @@ class ElementEvaluator(StepEvaluator):
                 #       "input_netloc:", input_netloc)
                 return 0
             try:
-                soup = BeautifulSoup(html_content, 'html.parser')
-                input_element = soup.select_one(input_answer)
-                reference_element = soup.select_one(reference_answer)
+                document = get_parsed_document(html_content)
+                input_element = document.select_one(input_answer)
+                reference_element = document.select_one(reference_answer)
                 if (input_element is not None) and (reference_element is not None):
                     score = input_element is reference_element
 
                     try:
-                        if reference_element.name in MapTagNameList:
+                        if reference_element.tag in MapTagNameList:
                             # parent_elements = reference_element.parent
                             # score_parent = input_element is parent_elements
                             # score = max(score, score_parent)
@@ -126,7 +128,7 @@ class ElementEvaluator(StepEvaluator):
                             current_element = reference_element
                             while trace_up_count < 3 and score == 0:
                                 trace_up_count += 1
-                                current_element = current_element.parent
+                                current_element = current_element.getparent()
                                 score_parent = input_element is current_element
                                 score = max(score, score_parent)
                     except:
@@ -195,8 +197,8 @@ class TextEvaluator(StepEvaluator):
         return result_score
 
     @staticmethod
-    def text_semantic_match(input_answer, semantic_method):
-        result_score = MatchFunction.semantic_match(
+    async def text_semantic_match(input_answer, semantic_method):
+        result_score = await MatchFunction.semantic_match(
             input_answer, semantic_method)
         return result_score
 
@@ -215,25 +217,6 @@ class MatchFunction():
 
     @staticmethod
     async def semantic_match(input_answer, semantic_method) -> float:
-        # GPT35 = GPTGenerator(model="gpt-3.5-turbo")
-        semantic_request = SemanticMatchPromptConstructor(
-        ).construct(input_answer, semantic_method)
-        score = None
-        for i in range(3):
-            try:
-                # response, _ = await GPT35.request(semantic_request)
-                response, _ = await semantic_match_llm_request(semantic_request)
-                score = re.findall("```(.*?)```", response, re.S)[0]
-                score = eval(score)
-                # Limit the score between 0 and 1
-                score = max(0, min(1, score))
-                if score != None:
-                    break
-            except:
-                score = None
-        if score == None:
-            score = 0
-        if score != 0 and score != 1:
-            return round(score, 2)
-        else:
-            return score
+        """Score through the shared SemanticMatchService, which caches scores
+        and batches the concurrent requests of a step"""
+        return await get_semantic_match_service().score(input_answer, semantic_method)
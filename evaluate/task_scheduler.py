@@ -0,0 +1,97 @@
+import asyncio
+import json
+import os
+import re
+import traceback
+
+from logs import logger
+
+
+# Result files are named "{task_index}_{task_uuid}.json" by run_task
+RESULT_FILE_PATTERN = re.compile(r"(\d+)_.*\.json$")
+
+
+def completed_task_indices(json_result_folder: str) -> set:
+    """Indices of the tasks that already have a result file, to resume a run"""
+    if not os.path.isdir(json_result_folder):
+        return set()
+    indices = set()
+    for file_name in os.listdir(json_result_folder):
+        match = RESULT_FILE_PATTERN.match(file_name)
+        if match:
+            indices.add(int(match.group(1)))
+    return indices
+
+
+def write_json_atomic(path: str, data) -> None:
+    """Write through a temporary file, so an interrupted run never leaves a
+    partial result that resuming would mistake for a finished task"""
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, 'w') as json_file:
+        json.dump(data, json_file)
+    os.replace(temporary_path, path)
+
+
+class OrderedResultWriter:
+    """Writes task results in task order, whatever order the tasks finish
+    in. A result waits until every earlier task has finished, and a task
+    that finishes without a result no longer holds later ones back."""
+
+    def __init__(self, task_indices):
+        self.order = list(task_indices)
+        self.position = 0
+        self.results = {}
+        self.finished = set()
+
+    def write(self, task_index: int, path: str, result: dict) -> None:
+        self.results[task_index] = (path, result)
+        self.flush()
+
+    def finish(self, task_index: int) -> None:
+        self.finished.add(task_index)
+        self.flush()
+
+    def flush(self) -> None:
+        while self.position < len(self.order):
+            task_index = self.order[self.position]
+            if task_index not in self.finished and task_index not in self.results:
+                break
+            if task_index in self.results:
+                logger.info(f"Write results to json file: {self.results[task_index][0]}")
+                write_json_atomic(*self.results.pop(task_index))
+            self.position += 1
+
+
+class TaskScheduler:
+    """Runs tasks on one event loop, at most `max_concurrent_tasks` at a
+    time and started in task order. A failed task is logged and does not
+    stop the others."""
+
+    def __init__(self, max_concurrent_tasks: int = 1):
+        self.max_concurrent_tasks = max(1, max_concurrent_tasks)
+
+    async def run(self, task_indices, run_one, result_writer: OrderedResultWriter) -> None:
+        """Await `run_one(task_index)` for every index"""
+        semaphore = asyncio.Semaphore(self.max_concurrent_tasks)
+
+        async def run_bounded(task_index):
+            async with semaphore:
+                try:
+                    await run_one(task_index)
+                except Exception:
+                    logger.error(f"Task {task_index} failed: {traceback.format_exc()}")
+                finally:
+                    result_writer.finish(task_index)
+
+        await asyncio.gather(*(run_bounded(task_index) for task_index in task_indices))
+
+
+__all__ = [
+    "completed_task_indices",
+    "write_json_atomic",
+    "OrderedResultWriter",
+    "TaskScheduler"
+]
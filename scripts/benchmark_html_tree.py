@@ -0,0 +1,192 @@
+"""Benchmark HTMLTree observation building.
+
+Measures the saved pages in --pages-dir, by default the search results,
+booking form and forum pages in tests/fixtures/pages, and synthetic
+documents of --nodes elements.
+
+Usage:
+    python scripts/benchmark_html_tree.py --pages-dir tests/fixtures/pages --nodes 50000
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.Environment.html_env.build_tree import HTMLTree  # noqa: E402
+from agent.Environment.html_env.active_elements import ActiveElements  # noqa: E402
+from agent.Environment.html_env.utils import TagNameList  # noqa: E402
+
+
+SYNTHETIC_TAGS = ["div", "span", "li", "p", "a", "button", "input", "select", "td", "label"]
+SYNTHETIC_ROLES = ["", "", "", "button", "link", "tab", "checkbox"]
+
+
+def synthetic_html(node_count: int, seed: int = 0, fanout: int = 6, max_depth: int = 30) -> str:
+    """Build a product-listing-like document with roughly `node_count` elements"""
+    rng = random.Random(seed)
+    parts = ["<html><head><title>synthetic</title></head><body>"]
+    produced = 0
+    open_tags = []
+    while produced < node_count:
+        depth = len(open_tags)
+        tag = rng.choice(SYNTHETIC_TAGS)
+        role = rng.choice(SYNTHETIC_ROLES)
+        attrs = f' class="c{rng.randint(0, 20)}"'
+        if role:
+            attrs += f' role="{role}"'
+        if tag == "a":
+            attrs += f' href="/item/{produced}"'
+        if tag in ("input", "select"):
+            parts.append(f'<{tag}{attrs} placeholder="field {produced}">')
+            if tag == "select":
+                parts.append("<option>one</option><option>two</option></select>")
+                produced += 2
+        else:
+            parts.append(f"<{tag}{attrs}>item {produced}")
+            if depth < max_depth and rng.randint(0, fanout) > 1:
+                open_tags.append(tag)
+                produced += 1
+                continue
+            parts.append(f"</{tag}>")
+        produced += 1
+        while open_tags and rng.randint(0, fanout) == 0:
+            parts.append(f"</{open_tags.pop()}>")
+    parts.extend(f"</{tag}>" for tag in reversed(open_tags))
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def time_observation(html_content: str, repeat: int) -> tuple:
+    tree = HTMLTree()
+    build_times = []
+    dom_times = []
+    selector_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tree.fetch_html_content(html_content)
+        build_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        tree.build_dom_tree()
+        dom_times.append(time.perf_counter() - start)
+        # Resolve every numbered element, as trace logging and replay do
+        start = time.perf_counter()
+        for idx in tree.nodeDict.values():
+            tree.get_selector_and_xpath(idx)
+        selector_times.append(time.perf_counter() - start)
+    return min(build_times), min(dom_times), min(selector_times), tree.nodeCounts
+
+
+def prune_scaling(node_counts: list, repeat: int) -> None:
+    """Time prune_tree alone on increasingly large, deeply nested documents.
+    A flat time per node means pruning scales linearly."""
+    for node_count in node_counts:
+        tree = HTMLTree()
+        tree.fetch_html_content(synthetic_html(node_count, fanout=12, max_depth=200))
+        valid = tree.elementNodes.valid
+        max_depth = max(tree.elementNodes.depth)
+        prune_times = []
+        for _ in range(repeat):
+            valid[:] = bytes(len(valid))
+            start = time.perf_counter()
+            tree.prune_tree()
+            prune_times.append(time.perf_counter() - start)
+        prune_time = min(prune_times)
+        print(f"prune nodes={tree.nodeCounts:>7} max_depth={max_depth:>4} "
+              f"total={prune_time * 1000:>9.1f} ms per_node={prune_time / tree.nodeCounts * 1e6:>6.2f} us")
+
+
+def classification(node_counts: list, repeat: int) -> None:
+    """Compare classifying one node at a time through materialized
+    ElementNode dicts with the batch ActiveElements.classify_store."""
+    for node_count in node_counts:
+        tree = HTMLTree()
+        tree.fetch_html_content(synthetic_html(node_count))
+        store = tree.elementNodes
+        per_node_times = []
+        batch_times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for idx in range(len(store)):
+                if store.tag_name(idx) in TagNameList:
+                    element = store[idx]
+                    ActiveElements.is_valid_element(element)
+                    ActiveElements.get_element_tagName(element)
+            per_node_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            ActiveElements.classify_store(store)
+            batch_times.append(time.perf_counter() - start)
+        print(f"classify nodes={tree.nodeCounts:>7} per_node={min(per_node_times) * 1000:>8.1f} ms "
+              f"batch={min(batch_times) * 1000:>8.1f} ms")
+
+
+def _observation_peak_rss(html_content: str, queue) -> None:
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tree = HTMLTree()
+    tree.fetch_html_content(html_content)
+    tree.build_dom_tree()
+    queue.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)
+
+
+def observation_peak_rss(html_content: str) -> int:
+    """Peak-RSS growth (KiB on Linux) of one observation step, measured in a
+    fresh child process so earlier measurements do not hide it"""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_observation_peak_rss, args=(html_content, queue))
+    process.start()
+    peak = queue.get()
+    process.join()
+    return peak
+
+
+def report(name: str, html_content: str, repeat: int, memory: bool = False) -> None:
+    build_time, dom_time, selector_time, node_count = time_observation(html_content, repeat)
+    line = f"{name:<40} nodes={node_count:>7} build={build_time * 1000:>9.1f} ms " \
+           f"dom_tree={dom_time * 1000:>8.1f} ms selectors={selector_time * 1000:>8.1f} ms"
+    if memory:
+        line += f" peak_rss=+{observation_peak_rss(html_content) / 1024:.1f} MiB"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTMLTree observation building.")
+    parser.add_argument("--pages-dir", default="tests/fixtures/pages",
+                        help="Directory with saved *.html pages to benchmark.")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[50000],
+                        help="Node counts of the synthetic documents.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--memory", action="store_true",
+                        help="Also report the peak-RSS growth of one observation step.")
+    parser.add_argument("--prune-scaling", action="store_true",
+                        help="Only time prune_tree on documents from 1k to 200k nodes.")
+    parser.add_argument("--classification", action="store_true",
+                        help="Only compare per-node and batch element classification.")
+    args = parser.parse_args()
+
+    if args.prune_scaling:
+        prune_scaling([1000, 5000, 20000, 50000, 100000, 200000], args.repeat)
+        return
+    if args.classification:
+        classification(args.nodes, args.repeat)
+        return
+
+    pages = sorted(glob.glob(os.path.join(args.pages_dir, "*.html")))
+    if not pages:
+        print(f"No *.html pages found in {args.pages_dir}, only synthetic documents are measured.")
+    for page_path in pages:
+        with open(page_path, encoding="utf-8", errors="ignore") as f:
+            report(os.path.basename(page_path), f.read(), args.repeat, args.memory)
+    for node_count in args.nodes:
+        html_content = synthetic_html(node_count)
+        report(f"synthetic-{node_count} ({len(html_content) / 2 ** 20:.1f} MB)",
+               html_content, args.repeat, args.memory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Benchmark the adaptive page-settled wait against the fixed sleeps.
+
+Serves local fixture pages, navigates to each one and waits either for a
+fixed sleep or for PageSettler with the same ceiling, then checks that the
+content the page builds after loading is present.
+
+The action fixtures instead click a button whose script navigates, or that
+submits a form, to a page the server answers after a delay. They compare
+the fixed sleep with PageSettler given the navigation state from before the
+click, and with PageSettler without it, which settles on the old document.
+
+Usage:
+    python scripts/benchmark_page_settle.py --repeat 5 --ceiling 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playwright.async_api import async_playwright  # noqa: E402
+from playwright.async_api import Error as PlaywrightError  # noqa: E402
+
+from agent.Environment.html_env.page_settle import PageSettler  # noqa: E402
+
+
+# Every fixture adds an element with id "done" once its content is complete
+FIXTURES = {
+    "static": """<html><body><a href="/next">next</a><div id="done">static</div></body></html>""",
+    "xhr": """<html><body><ul id="list"></ul><script>
+        fetch('/api?delay=400').then(r => r.json()).then(items => {
+            for (const item of items) {
+                const li = document.createElement('li');
+                li.textContent = item;
+                document.getElementById('list').appendChild(li);
+            }
+            document.body.insertAdjacentHTML('beforeend', '<div id="done">xhr</div>');
+        });
+    </script></body></html>""",
+    "mutating": """<html><body><ul id="list"></ul><script>
+        let count = 0;
+        const timer = setInterval(() => {
+            const li = document.createElement('li');
+            li.textContent = 'row ' + count;
+            document.getElementById('list').appendChild(li);
+            if (++count === 8) {
+                clearInterval(timer);
+                document.body.insertAdjacentHTML('beforeend', '<div id="done">mutating</div>');
+            }
+        }, 100);
+    </script></body></html>""",
+    "polling": """<html><body><script>
+        setTimeout(() => document.body.insertAdjacentHTML('beforeend', '<div id="done">polling</div>'), 200);
+        function poll() {
+            fetch('/api?delay=3000').then(poll, poll);
+        }
+        poll();
+    </script></body></html>""",
+    "slow-image": """<html><body><div id="done">slow image</div>
+        <img src="/api?delay=800&image=1"></body></html>"""
+}
+
+# Clicking #go navigates to /target, answered after --navigation-delay ms,
+# which has the element with id "done"
+ActionFixtures = {
+    "js-click": """<html><body><button id="go" onclick="setTimeout(() => {{
+        location.href = '/target?delay={delay}'; }}, 50)">go</button></body></html>""",
+    "submit": """<html><body><form action="/target" method="get">
+        <input name="delay" value="{delay}"><button id="go" type="submit">go</button>
+        </form></body></html>"""
+}
+TARGET_PAGE = """<html><body><div id="done">target</div></body></html>"""
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/api":
+            query = parse_qs(url.query)
+            time.sleep(int(query.get("delay", ["0"])[0]) / 1000)
+            body = json.dumps(["alpha", "beta", "gamma"]).encode()
+            content_type = "application/json"
+        elif url.path == "/target":
+            query = parse_qs(url.query)
+            time.sleep(int(query.get("delay", ["0"])[0]) / 1000)
+            body = TARGET_PAGE.encode()
+            content_type = "text/html"
+        elif url.path.strip("/") in ActionFixtures:
+            body = ActionFixtures[url.path.strip("/")].format(delay=self.server.navigation_delay).encode()
+            content_type = "text/html"
+        else:
+            body = FIXTURES.get(url.path.strip("/"), FIXTURES["static"]).encode()
+            content_type = "text/html"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(navigation_delay: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    server.daemon_threads = True
+    server.navigation_delay = navigation_delay
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def measure(page, url: str, ceiling: int, settler) -> tuple:
+    """Seconds spent waiting after the navigation, and whether the page was complete"""
+    await page.goto(url, wait_until="commit")
+    start_time = time.perf_counter()
+    if settler is None:
+        await page.wait_for_timeout(ceiling)
+    else:
+        await settler.wait(page, ceiling)
+    waited = time.perf_counter() - start_time
+    return waited, await page.query_selector("#done") is not None
+
+
+class NavigationTracker:
+    """The navigation_state AsyncHTMLEnvironment keeps for the settler"""
+
+    def __init__(self, page):
+        self.page = page
+        self.requests = 0
+        self.commits = 0
+        page.on("request", self.on_request)
+        page.on("framenavigated", self.on_frame_navigated)
+
+    def on_request(self, request):
+        if request.is_navigation_request() and request.frame.parent_frame is None:
+            self.requests += 1
+
+    def on_frame_navigated(self, frame):
+        if frame.parent_frame is None:
+            self.commits += 1
+
+    def state(self) -> tuple:
+        return (self.page.url, self.requests, self.commits)
+
+
+async def measure_action(page, tracker, url: str, ceiling: int, settler, with_state: bool) -> tuple:
+    """Seconds spent waiting after a click that navigates, and whether the
+    target page was loaded when the wait returned"""
+    await page.goto(url)
+    before = tracker.state()
+    # A form submit only returns from evaluate once its navigation commits
+    start_time = time.perf_counter()
+    await page.evaluate("document.getElementById('go').click()")
+    if settler is None:
+        await page.wait_for_timeout(ceiling)
+    elif with_state:
+        await settler.wait(page, ceiling, tracker.state, before)
+    else:
+        await settler.wait(page, ceiling)
+    waited = time.perf_counter() - start_time
+    try:
+        return waited, await page.query_selector("#done") is not None
+    except PlaywrightError:
+        # The navigation replaced the document only after the wait
+        return waited, False
+
+
+async def run(args) -> None:
+    server = start_server(args.navigation_delay)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    settler = PageSettler(network_idle_timeout=args.network_idle_timeout, dom_quiet=args.dom_quiet)
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=True, executable_path=args.executable_path)
+        context = await browser.new_context()
+        page = await context.new_page()
+        settler.watch(page)
+        tracker = NavigationTracker(page)
+        print(f"{'fixture':<12}{'fixed ms':>10}{'settled ms':>12}{'saved':>8}{'complete':>10}")
+        fixed_total = settled_total = 0.0
+        for name in FIXTURES:
+            url = f"{base_url}/{name}"
+            fixed_times, settled_times, complete = [], [], 0
+            for _ in range(args.repeat):
+                waited, _ = await measure(page, url, args.ceiling, None)
+                fixed_times.append(waited)
+                waited, done = await measure(page, url, args.ceiling, settler)
+                settled_times.append(waited)
+                complete += done
+            fixed = statistics.median(fixed_times) * 1000
+            settled = statistics.median(settled_times) * 1000
+            fixed_total += fixed
+            settled_total += settled
+            print(f"{name:<12}{fixed:>10.0f}{settled:>12.0f}{1 - settled / fixed:>8.0%}"
+                  f"{complete:>6}/{args.repeat}")
+        print(f"{'total':<12}{fixed_total:>10.0f}{settled_total:>12.0f}{1 - settled_total / fixed_total:>8.0%}")
+        print()
+        print(f"{'action':<12}{'fixed ms':>10}{'settled ms':>12}{'complete':>10}"
+              f"{'no-state ms':>13}{'complete':>10}")
+        for name in ActionFixtures:
+            url = f"{base_url}/{name}"
+            times = {"fixed": [], "state": [], "no-state": []}
+            complete = {"fixed": 0, "state": 0, "no-state": 0}
+            for _ in range(args.repeat):
+                for mode, mode_settler, with_state in (("fixed", None, False), ("state", settler, True),
+                                                       ("no-state", settler, False)):
+                    waited, done = await measure_action(page, tracker, url, args.ceiling,
+                                                        mode_settler, with_state)
+                    times[mode].append(waited)
+                    complete[mode] += done
+            medians = {mode: statistics.median(values) * 1000 for mode, values in times.items()}
+            print(f"{name:<12}{medians['fixed']:>10.0f}{medians['state']:>12.0f}"
+                  f"{complete['state']:>6}/{args.repeat}"
+                  f"{medians['no-state']:>13.0f}{complete['no-state']:>6}/{args.repeat}")
+        await browser.close()
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the adaptive page-settled wait.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Navigations per fixture and mode.")
+    parser.add_argument("--ceiling", type=int, default=2000,
+                        help="Fixed sleep in ms, and ceiling of the adaptive wait.")
+    parser.add_argument("--network-idle-timeout", type=int, default=1500)
+    parser.add_argument("--dom-quiet", type=int, default=300)
+    parser.add_argument("--navigation-delay", type=int, default=1800,
+                        help="Response delay in ms of the page the action fixtures navigate to.")
+    parser.add_argument("--executable-path", default=None,
+                        help="Chromium binary to use instead of Playwright's own.")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
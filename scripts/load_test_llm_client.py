@@ -0,0 +1,196 @@
+"""Load test the LLM request path against a local stub server.
+
+Starts an OpenAI-compatible stub in a subprocess that answers every chat
+completion after a fixed latency, then sends the same number of requests
+at the same concurrency through
+
+    threaded  the previous path: a ThreadPoolExecutor per request and the
+              synchronous client called in the default executor
+    async     GPTGenerator on the registry's shared AsyncOpenAI client
+
+and reports requests per second, latency and the peak thread count.
+
+Usage:
+    python scripts/load_test_llm_client.py --requests 500 --concurrency 100 --latency 200
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openai  # noqa: E402
+
+from agent.LLM.client_registry import configure_llm_registry, close_llm_registry  # noqa: E402
+from agent.LLM.openai import GPTGenerator  # noqa: E402
+
+
+MODEL = "gpt-4o-mini"
+MESSAGES = [{"role": "user", "content": "Reply with ok."}]
+
+
+def completion_body() -> bytes:
+    return json.dumps({
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": MODEL,
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": "ok"}}],
+        "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6}
+    }).encode()
+
+
+async def handle_connection(reader, writer, latency: float) -> None:
+    """Minimal keep-alive HTTP/1.1: every request gets a chat completion"""
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            content_length = 0
+            for line in head.split(b"\r\n"):
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-length":
+                    content_length = int(value)
+            await reader.readexactly(content_length)
+            await asyncio.sleep(latency)
+            body = completion_body()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def serve_stub(port, latency: float) -> None:
+    async def serve():
+        server = await asyncio.start_server(
+            lambda reader, writer: handle_connection(reader, writer, latency), "127.0.0.1", 0, backlog=1024)
+        port.value = server.sockets[0].getsockname()[1]
+        await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def start_stub(latency: float):
+    port = multiprocessing.Value("i", 0)
+    process = multiprocessing.Process(target=serve_stub, args=(port, latency), daemon=True)
+    process.start()
+    while port.value == 0:
+        time.sleep(0.01)
+    return process, f"http://127.0.0.1:{port.value}/v1"
+
+
+def threaded_request_factory(base_url: str):
+    client = openai.OpenAI(api_key="stub", base_url=base_url)
+
+    async def chat():
+        loop = asyncio.get_event_loop()
+        func = partial(client.chat.completions.create, model=MODEL, messages=MESSAGES,
+                       max_tokens=500, temperature=0.7)
+        return await loop.run_in_executor(None, func)
+
+    async def request():
+        with ThreadPoolExecutor(max_workers=multiprocessing.cpu_count() * 2) as pool:
+            future_answer = pool.submit(chat)
+            return (await future_answer.result()).choices[0].message.content
+
+    return request, client.close
+
+
+def async_request_factory(base_url: str, max_connections: int):
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    configure_llm_registry({"openai_base_url": base_url, "max_connections": max_connections,
+                            "max_keepalive_connections": max_connections})
+    generator = GPTGenerator(MODEL)
+
+    async def request():
+        response, error_message = await generator.request(MESSAGES)
+        if error_message:
+            raise RuntimeError(error_message)
+        return response
+
+    return request, None
+
+
+async def run_mode(request, total: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    peak_threads = threading.active_count()
+    done = asyncio.Event()
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while not done.is_set():
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.01)
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            start_time = time.perf_counter()
+            try:
+                await request()
+                latencies.append(time.perf_counter() - start_time)
+            except Exception:
+                errors += 1
+
+    sampler = asyncio.create_task(sample_threads())
+    start_time = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start_time
+    done.set()
+    await sampler
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) * 1000 if latencies else 0,
+        "p95": statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else 0,
+        "errors": errors,
+        "peak_threads": peak_threads
+    }
+
+
+async def run(args) -> None:
+    process, base_url = start_stub(args.latency / 1000)
+    print(f"{args.requests} requests, concurrency {args.concurrency}, stub latency {args.latency} ms")
+    print(f"{'mode':<10}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}{'threads':>9}")
+    try:
+        for mode in args.modes:
+            if mode == "threaded":
+                request, close = threaded_request_factory(base_url)
+            else:
+                request, close = async_request_factory(base_url, args.concurrency)
+            result = await run_mode(request, args.requests, args.concurrency)
+            if close is not None:
+                close()
+            else:
+                await close_llm_registry()
+            print(f"{mode:<10}{result['rps']:>9.1f}{result['p50']:>9.0f}{result['p95']:>9.0f}"
+                  f"{result['errors']:>8}{result['peak_threads']:>9}")
+    finally:
+        process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the LLM request path against a stub server.")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=int, default=200,
+                        help="Stub response latency in ms.")
+    parser.add_argument("--modes", nargs="+", default=["threaded", "async"],
+                        choices=["threaded", "async"])
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
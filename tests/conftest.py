@@ -0,0 +1,45 @@
+import itertools
+from unittest import mock
+
+import pytest
+import tiktoken
+from tiktoken_ext import openai_public
+
+from agent.LLM import tokenizer
+
+
+def offline_encoding(name: str) -> tiktoken.Encoding:
+    """`name`'s pre-tokenizer with made-up merges, for when the real ranks
+    can not be downloaded. Segment sums only depend on where pre-tokens
+    start, and the merges make counts differ when a split is wrong."""
+    with mock.patch.object(openai_public, "load_tiktoken_bpe", return_value={}):
+        pat_str = getattr(openai_public, name)()["pat_str"]
+    ranks = {bytes([i]): i for i in range(256)}
+    chars = [b"\n", b"\r", b" ", b"\t", b"/", b"'", b"[", b"]", b"1", b"a", b"x", b"."]
+    for size in (2, 3):
+        for combination in itertools.product(chars, repeat=size):
+            ranks.setdefault(b"".join(combination), len(ranks))
+    return tiktoken.Encoding(name=name, pat_str=pat_str, mergeable_ranks=ranks, special_tokens={})
+
+
+def use_encoding(name: str, monkeypatch) -> tiktoken.Encoding:
+    """Make every model count with `name`, the real encoding when it loads"""
+    try:
+        encoding = tiktoken.get_encoding(name)
+    except Exception:
+        encoding = offline_encoding(name)
+    monkeypatch.setattr(tokenizer, "load_encoding", lambda model: encoding)
+    tokenizer.get_tokenizer.cache_clear()
+    return encoding
+
+
+@pytest.fixture(params=["cl100k_base", "o200k_base"])
+def encoding(request, monkeypatch):
+    yield use_encoding(request.param, monkeypatch)
+    tokenizer.get_tokenizer.cache_clear()
+
+
+@pytest.fixture
+def cl100k(monkeypatch):
+    yield use_encoding("cl100k_base", monkeypatch)
+    tokenizer.get_tokenizer.cache_clear()
@@ -0,0 +1,77 @@
+import json
+import os
+
+import pytest
+
+from agent.Environment.html_env.build_tree import HTMLTree
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+PAGES = ["flight_booking", "forum_question", "shop_search"]
+
+
+def load_page(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, "pages", name + ".html"), encoding="utf-8") as f:
+        return f.read()
+
+
+def load_expected(name: str) -> dict:
+    """Observation of the page by the dict-based HTMLTree the node store
+    replaced: the dom tree lines and, per element, its number, node id,
+    value, selector and xpath"""
+    with open(os.path.join(FIXTURES_DIR, "observations", name + ".json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("name", PAGES)
+@pytest.mark.parametrize("incremental", [False, True])
+def test_observation_matches_the_baseline(name, incremental):
+    expected = load_expected(name)
+    tree = HTMLTree(incremental=incremental)
+    tree.fetch_html_content(load_page(name))
+    assert tree.build_dom_tree().splitlines() == expected["dom_tree"]
+    assert tree.nodeDict == {num: idx for num, idx, _, _, _ in expected["elements"]}
+    assert tree.element_value == {str(idx): value for _, idx, value, _, _ in expected["elements"]}
+
+
+@pytest.mark.parametrize("name", PAGES)
+def test_locators_match_the_baseline(name):
+    tree = HTMLTree()
+    tree.fetch_html_content(load_page(name))
+    tree.build_dom_tree()
+    for num, idx, _, selector, xpath in load_expected(name)["elements"]:
+        assert tree.get_selector_and_xpath(idx) == (selector, xpath), num
+
+
+@pytest.mark.parametrize("name", PAGES)
+def test_locators_resolve_in_the_parsed_document(name):
+    tree = HTMLTree()
+    tree.fetch_html_content(load_page(name))
+    tree.build_dom_tree()
+    root = tree.tree.getroot()
+    for idx in tree.nodeDict.values():
+        _, xpath = tree.get_selector_and_xpath(idx)
+        assert root.xpath(xpath) == [tree.elementNodes.raw_nodes[idx]], xpath
+
+
+def test_root_xpath():
+    tree = HTMLTree()
+    tree.fetch_html_content(load_page("flight_booking"))
+    assert tree.get_xpath(0) == "/html"
+    assert tree.tree.getroot().xpath(tree.get_xpath(0)) == [tree.tree.getroot()]
+
+
+def test_tree_can_be_reused():
+    tree = HTMLTree()
+    tree.fetch_html_content(load_page("shop_search"))
+    tree.build_dom_tree()
+    tree.fetch_html_content(load_page("flight_booking"))
+    assert tree.build_dom_tree().splitlines() == load_expected("flight_booking")["dom_tree"]
+
+
+def test_observation_elements_follow_the_lines():
+    tree = HTMLTree()
+    tree.fetch_html_content(load_page("forum_question"))
+    lines = tree.build_dom_tree().splitlines(keepends=True)
+    assert [element["line"] for element in tree.dom_elements] == lines
+    assert [element["num"] for element in tree.dom_elements] == list(tree.nodeDict)
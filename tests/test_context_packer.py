@@ -0,0 +1,134 @@
+import base64
+import struct
+
+import pytest
+
+from agent.LLM import context_packer, tokenizer
+from agent.LLM.context_packer import (
+    ContextPacker, ELISION_MARKER, IMAGE_PLACEHOLDER, image_tokens, pack_messages)
+
+
+MODEL = "gpt-4"
+SYSTEM_PROMPT = "You are a web agent. Answer with one action.\n" * 20
+TASK = "TASK: find the cheapest flight from JFK to LAX.\n"
+LATEST_OBSERVATION = "LATEST OBSERVATION: [1] button 'Search flights'\n"
+
+
+def trace(steps: int) -> str:
+    return "".join(f"Step {step}: clicked [{step}] link 'Result {step}' and read the page.\n"
+                   for step in range(steps))
+
+
+def png_url(width: int, height: int) -> str:
+    header = b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">II", width, height)
+    return "data:image/png;base64," + base64.b64encode(header + b"\x00" * 8).decode()
+
+
+def fits(packer: ContextPacker, messages: list, max_output_tokens: int) -> bool:
+    return packer.messages_tokens(messages) <= packer.context_size - max_output_tokens
+
+
+def test_messages_that_fit_are_returned_as_they_are(cl100k):
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": TASK}]
+    assert ContextPacker(MODEL).pack(messages) is messages
+
+
+def test_older_turns_are_dropped_first(cl100k):
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": trace(40)},
+        {"role": "assistant", "content": trace(40)},
+        {"role": "user", "content": TASK + LATEST_OBSERVATION},
+    ]
+    packer = ContextPacker(MODEL)
+    packer.context_size = packer.messages_tokens([messages[0], messages[-1]]) + 600
+    packed = packer.pack(messages, max_output_tokens=500)
+    assert packed == [messages[0], messages[-1]]
+    assert fits(packer, packed, 500)
+
+
+def test_latest_message_loses_its_middle(cl100k):
+    latest = TASK + trace(400) + LATEST_OBSERVATION
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": latest}]
+    packer = ContextPacker(MODEL, context_size=2500)
+    packed = packer.pack(messages, max_output_tokens=500)
+    assert packed[0] == messages[0]
+    text = packed[1]["content"]
+    assert text.startswith(TASK)
+    assert text.endswith(LATEST_OBSERVATION)
+    assert ELISION_MARKER.split("{}")[0] in text
+    assert fits(packer, packed, 500)
+
+
+def test_text_parts_are_shrunk_longest_first(cl100k):
+    latest = {"role": "user", "content": [
+        {"type": "text", "text": TASK},
+        {"type": "text", "text": trace(400) + LATEST_OBSERVATION},
+    ]}
+    packer = ContextPacker(MODEL, context_size=2000)
+    packed = packer.pack([latest], max_output_tokens=500)
+    task_part, trace_part = packed[0]["content"]
+    assert task_part["text"] == TASK
+    assert trace_part["text"].endswith(LATEST_OBSERVATION)
+    assert fits(packer, packed, 500)
+    # The input messages are not modified
+    assert latest["content"][1]["text"] == trace(400) + LATEST_OBSERVATION
+
+
+def test_images_are_replaced_when_text_is_not_enough(cl100k):
+    image = {"type": "image_url", "image_url": {"url": png_url(1024, 1024)}}
+    messages = [{"role": "user", "content": [{"type": "text", "text": TASK}, image]}]
+    packer = ContextPacker(MODEL)
+    packer.context_size = packer.messages_tokens(messages) - 200 + 500
+    packed = packer.pack(messages, max_output_tokens=500)
+    assert {"type": "text", "text": IMAGE_PLACEHOLDER} in packed[0]["content"]
+    assert image not in packed[0]["content"]
+    assert fits(packer, packed, 500)
+
+
+def test_system_prompt_is_elided_when_the_rest_is_not_enough(cl100k):
+    messages = [{"role": "system", "content": SYSTEM_PROMPT * 20}, {"role": "user", "content": TASK}]
+    packer = ContextPacker(MODEL, context_size=1500)
+    packed = packer.pack(messages, max_output_tokens=500)
+    assert [message["role"] for message in packed] == ["system", "user"]
+    assert ELISION_MARKER.split("{}")[0] in packed[0]["content"]
+    assert fits(packer, packed, 500)
+
+
+@pytest.mark.parametrize("width, height, detail, tokens", [
+    (1024, 1024, None, 765),
+    (512, 512, None, 255),
+    (4096, 2048, None, 1105),
+    (1024, 1024, "low", 85),
+])
+def test_openai_image_tokens(width, height, detail, tokens):
+    image_url = {"url": png_url(width, height)}
+    if detail:
+        image_url["detail"] = detail
+    assert image_tokens({"type": "image_url", "image_url": image_url}, MODEL) == tokens
+
+
+def test_unknown_models_are_not_packed(cl100k):
+    messages = [{"role": "user", "content": trace(5000)}]
+    assert pack_messages(messages, "some-local-model") is messages
+
+
+def test_packing_errors_send_the_messages_unpacked(monkeypatch):
+    def fail(model):
+        raise ValueError("encoding can not be loaded")
+
+    monkeypatch.setattr(tokenizer, "load_encoding", fail)
+    tokenizer.get_tokenizer.cache_clear()
+    messages = [{"role": "user", "content": trace(5000)}]
+    try:
+        assert pack_messages(messages, MODEL) is messages
+    finally:
+        tokenizer.get_tokenizer.cache_clear()
+
+
+def test_configured_context_sizes(monkeypatch):
+    monkeypatch.setattr(context_packer, "ModelContextSizeDict", dict(context_packer.ModelContextSizeDict))
+    context_packer.configure_context_sizes({"my-llm": "4096", "gpt-4": 9000})
+    assert context_packer.model_context_size("my-llm-7b") == 4096
+    assert context_packer.model_context_size("gpt-4-0613") == 9000
+    assert context_packer.model_context_size("gpt-4o-mini") == 128000
@@ -0,0 +1,83 @@
+import pytest
+
+from evaluate.document_cache import get_parsed_document
+from evaluate.step_score import ElementEvaluator
+
+
+# Unclosed li, p and td, misnested b and i, a stray end tag and a form whose
+# div ends early. The expected elements are those Chromium's querySelector
+# returns for the same page.
+MALFORMED_PAGE = """<!DOCTYPE html>
+<html><head><title>Shop</title></head>
+<body>
+<div id="main">
+  <ul class="Nav">
+    <li>Home
+    <li class="Active">Products
+    <li>Contact
+  </ul>
+  <p>Intro text
+  <p>Second paragraph <b>bold <i>both</b> italic</i>
+  <table class="Prices">
+    <tr><td>Apple<td>1.00
+    <tr><td>Pear<td>2.00
+  </table>
+  <form id="Search"><input type="checkbox" name="in_stock" checked><input type="text" name="q" disabled>
+  <select name="sort"><option>Price<option selected>Name</select>
+  </div>
+  <div class="Results">
+    <a href="/a">First</a>
+    <span>stray</span></span>
+    <a href="/b">Second</a>
+  </div>
+</div>
+</body></html>
+"""
+
+
+def element_text(element) -> str:
+    return " ".join(element.text_content().split())
+
+
+@pytest.mark.parametrize("selector, tag, text", [
+    ("#main > ul > li:nth-child(2)", "li", "Products"),
+    ("ul.Nav > li.Active", "li", "Products"),
+    ("UL.Nav > LI:nth-child(3)", "li", "Contact"),
+    ("#main > p:nth-child(3)", "p", "Second paragraph bold both italic"),
+    ("#main > table tr:nth-child(2) > td:nth-child(1)", "td", "Pear"),
+    ("table.Prices td:nth-child(2)", "td", "1.00"),
+    ("#Search > input:nth-child(2)", "input", ""),
+    ("input:checked", "input", ""),
+    ("input:disabled", "input", ""),
+    ("option:checked", "option", "Name"),
+    ("a:link", "a", "First"),
+    ("div.Results > a:nth-child(3)", "a", "Second"),
+    ("div.Results > a:nth-of-type(2)", "a", "Second"),
+    ("div.Results > span", "span", "stray"),
+])
+def test_selectors_resolve_like_the_browser(selector, tag, text):
+    element = get_parsed_document(MALFORMED_PAGE).select_one(selector)
+    assert element is not None
+    assert element.tag == tag
+    assert element_text(element).startswith(text)
+
+
+def test_pseudo_classes_read_attributes():
+    document = get_parsed_document(MALFORMED_PAGE)
+    assert document.select_one("input:checked").get("name") == "in_stock"
+    assert document.select_one("input:disabled").get("name") == "q"
+
+
+def test_parse_is_shared():
+    assert get_parsed_document(MALFORMED_PAGE) is get_parsed_document(MALFORMED_PAGE)
+
+
+@pytest.mark.parametrize("input_answer, reference_answer, score", [
+    ("ul.Nav > li.Active", "#main > ul > li:nth-child(2)", 1),
+    ("#main > table tr:nth-child(2) > td:nth-child(1)", "table.Prices tr:nth-child(2) > td:first-child", 1),
+    ("input:checked", "#Search > input:nth-child(1)", 1),
+    ("#main > ul > li:nth-child(3)", "ul.Nav > li.Active", 0),
+])
+def test_selector_path_match(input_answer, reference_answer, score):
+    assert ElementEvaluator.path_exact_match(
+        input_answer, reference_answer, "selector", MALFORMED_PAGE, "shop", "shop") == score
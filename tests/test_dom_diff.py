@@ -0,0 +1,74 @@
+from agent.Environment.html_env.build_tree import HTMLTree
+
+
+def page(body: str) -> str:
+    return f"<html><body>{body}</body></html>"
+
+
+def observe(tree: HTMLTree, body: str) -> str:
+    tree.fetch_html_content(page(body))
+    return tree.build_dom_tree()
+
+
+def numbers(tree: HTMLTree) -> dict:
+    return {element["text"]: element["num"] for element in tree.dom_elements}
+
+
+def test_unchanged_page_has_no_changed_lines():
+    tree = HTMLTree(incremental=True)
+    body = '<div><a href="/1">one</a><button>Go</button></div>'
+    first = observe(tree, body)
+    assert tree.build_changed_dom_tree() == first
+    assert observe(tree, body) == first
+    assert tree.build_changed_dom_tree() == ""
+
+
+def test_inserted_sibling_gets_a_new_number():
+    tree = HTMLTree(incremental=True)
+    observe(tree, '<ul><li><a href="/1">one</a></li><li><a href="/2">two</a></li></ul>')
+    before = numbers(tree)
+    observe(tree, '<ul><li><a href="/0">zero</a></li><li><a href="/1">one</a></li>'
+                  '<li><a href="/2">two</a></li></ul>')
+    after = numbers(tree)
+    assert after["one"] == before["one"]
+    assert after["two"] == before["two"]
+    assert after["zero"] == 3
+    assert tree.build_changed_dom_tree().strip() == "[3] link 'zero'"
+
+
+def test_inserted_sibling_does_not_take_the_key_of_a_changed_one():
+    tree = HTMLTree(incremental=True)
+    observe(tree, '<div><a href="/1">one</a><a href="/2">two</a></div>')
+    before = numbers(tree)
+    observe(tree, '<div><a href="/0">zero</a><a href="/1">one</a><a href="/2">two!</a></div>')
+    after = numbers(tree)
+    assert after["one"] == before["one"]
+    assert after["two!"] == before["two"]
+    assert after["zero"] == 3
+    changed = [line.strip() for line in tree.build_changed_dom_tree().splitlines()]
+    assert changed == ["[3] link 'zero'", "[2] link 'two!'"]
+
+
+def test_removed_sibling_keeps_the_others_numbered():
+    tree = HTMLTree(incremental=True)
+    observe(tree, '<div><button>a</button><button>b</button><button>c</button></div>')
+    before = numbers(tree)
+    observe(tree, '<div><button>a</button><button>c</button></div>')
+    after = numbers(tree)
+    assert after == {"a": before["a"], "c": before["c"]}
+    assert tree.build_changed_dom_tree() == ""
+
+
+def test_changed_elements_follow_the_text():
+    tree = HTMLTree(incremental=True)
+    observe(tree, '<div id="cart"><button>0 items</button></div><button>Add</button>')
+    observe(tree, '<div id="cart"><button>1 items</button></div><button>Add</button>')
+    assert [element["text"] for element in tree.changed_dom_elements()] == ["1 items"]
+
+
+def test_reset_identities_renumbers_from_one():
+    tree = HTMLTree(incremental=True)
+    observe(tree, '<a href="/1">one</a><a href="/2">two</a>')
+    tree.reset_identities()
+    observe(tree, '<a href="/2">two</a>')
+    assert numbers(tree) == {"two": 1}
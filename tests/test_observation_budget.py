@@ -0,0 +1,60 @@
+from agent.Environment.html_env.observation_budget import (
+    in_viewport, select_in_viewport, select_within_budget)
+from agent.Environment.html_env.utils import ObservationElement
+
+
+def element(num: int, tag_name: str, text: str, depth: int = 2) -> ObservationElement:
+    line = f"{'  ' * (depth - 1)}[{num}] {tag_name} '{text}'\n"
+    return ObservationElement(nodeId=num, num=num, depth=depth, tagName=tag_name, text=text, line=line)
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+ELEMENTS = [
+    element(1, "link", "Home"),
+    element(2, "link", "Deals"),
+    element(3, "input", "Search products"),
+    element(4, "link", "Red running shoes"),
+    element(5, "button", "Add to cart"),
+    element(6, "option", "Price: low to high"),
+]
+
+
+def test_everything_fits():
+    dom_tree, elided = select_within_budget(ELEMENTS, 1000, count_words)
+    assert dom_tree == "".join(element["line"] for element in ELEMENTS)
+    assert elided == 0
+
+
+def test_form_controls_and_request_matches_are_kept_in_document_order():
+    budget = count_words("(9 less relevant elements were elided to fit the token budget)\n") + 9
+    dom_tree, elided = select_within_budget(ELEMENTS, budget, count_words, "buy running shoes")
+    lines = dom_tree.splitlines()
+    assert lines[:-1] == ["  [3] input 'Search products'", "  [4] link 'Red running shoes'"]
+    assert lines[-1] == "(4 less relevant elements were elided to fit the token budget)"
+    assert elided == 4
+    assert count_words(dom_tree) <= budget
+
+
+def test_elements_near_the_viewport_rank_higher():
+    elements = [element(1, "link", "Top"), element(2, "link", "Bottom")]
+    boxes = [[0, -3000, 100, 20], [0, 100, 100, 20]]
+    budget = count_words("(9 less relevant elements were elided to fit the token budget)\n") + 3
+    dom_tree, elided = select_within_budget(elements, budget, count_words, boxes=boxes)
+    assert dom_tree.splitlines()[0] == "  [2] link 'Bottom'"
+    assert elided == 1
+
+
+def test_viewport_selection():
+    viewport = {"width": 1280, "height": 720}
+    boxes = [[0, 10, 100, 20], [0, 800, 100, 20], None, [0, -50, 100, 40], [1300, 10, 50, 20]]
+    elements = [element(num, "link", str(num)) for num in range(1, 6)]
+    kept, kept_boxes, hidden = select_in_viewport(elements, boxes, viewport)
+    assert [element["num"] for element in kept] == [1]
+    assert kept_boxes == [boxes[0]]
+    assert hidden == 4
+    assert in_viewport(boxes[1], viewport, margin=100)
+    assert in_viewport(boxes[3], viewport, margin=10)
+    assert not in_viewport(boxes[4], viewport, margin=10)
@@ -0,0 +1,159 @@
+import asyncio
+import copy
+import itertools
+
+import pytest
+
+from evaluate.rubric_plan import StepInputs, compile_evaluation_plan, get_netloc
+from evaluate.step_score import ElementEvaluator, MatchFunction, TextEvaluator, URLEvaluator
+
+
+PAGE = """<html><body>
+<div id="search">
+  <form><input name="q" value="red shoes"><select name="size"><option>8<option selected>9</select>
+  <button type="submit">Search</button></form>
+</div>
+<ul class="Results">
+  <li><a href="/p/1">Red running shoes</a></li>
+  <li><a href="/p/2">Blue running shoes</a></li>
+</ul>
+</body></html>"""
+
+RUBRIC = [
+    {"match_function": "url_exactly_match", "key": "q", "reference_answer": "red shoes"},
+    {"match_function": "url_exactly_match", "key": "", "reference_answer": "https://shop.com/cart"},
+    {"match_function": "url_included_match", "key": "", "reference_answer": "shop.com/search#results"},
+    {"match_function": "url_included_match", "key": "page", "reference_answer": "2"},
+    {"match_function": "url_semantic_match", "key": "q", "reference_answer": "a search for shoes"},
+    {"match_function": "element_path_exactly_match", "method": "selector", "netloc": "shop",
+     "reference_answer": "ul.Results > li:nth-child(1) > a"},
+    {"match_function": "element_path_exactly_match", "method": "xpath", "netloc": "shop",
+     "reference_answer": "/html/body/ul/li[2]/a"},
+    {"match_function": "element_path_included_match", "method": "selector", "netloc": "shop",
+     "reference_answer": "ul.Results"},
+    {"match_function": "element_value_exactly_match", "netloc": "shop", "reference_answer": "red shoes",
+     "path": "#search input"},
+    {"match_function": "element_value_included_match", "netloc": "shop", "reference_answer": "shoes"},
+    {"match_function": "element_value_semantic_match", "netloc": "shop", "reference_answer": "size nine",
+     "path": "#search select"},
+    {"match_function": "cache_data_exact_match", "reference_answer": "Red Running Shoes"},
+    {"match_function": "cache_data_included_match", "reference_answer": "RUNNING"},
+    {"match_function": "final_answer_semantic_match", "reference_answer": "the red pair"},
+]
+for evaluate in RUBRIC:
+    evaluate["score"] = 0
+
+URLS = ["https://www.shop.com/search?q=red%20shoes&page=2#results", "https://shop.com/cart",
+        "https://www.other.org/search?q=red%20shoes"]
+PATHS = [(None, None), ("ul.Results > li:first-child > a", "Red running shoes"),
+         ("/html/body/ul/li[2]/a", "Blue running shoes"), ("#search > form > input", "red shoes"),
+         ("#search select", "9"), ("#search input", "")]
+TEXTS = [None, "", "red running shoes", "I found the red running shoes"]
+
+
+async def fake_semantic_match(input_answer, reference_answer):
+    return 0.5 if input_answer else 0
+
+
+async def baseline_step_evaluate(url, html_content, evaluate_steps, input_path=None, element_value=None,
+                                 text_content=None):
+    """step_evaluate before the rubric was compiled into matchers, with the
+    text semantic matches awaited"""
+    for evaluate in evaluate_steps:
+        score = 0
+        if evaluate["score"] != 1:
+            match_function = evaluate["match_function"]
+            reference_answer = evaluate["reference_answer"]
+            input_netloc = get_netloc(url)
+            if match_function == "url_exactly_match":
+                score = URLEvaluator.url_exact_match(url, reference_answer, evaluate["key"])
+            elif match_function == "url_included_match":
+                score = URLEvaluator.url_include_match(url, reference_answer, evaluate["key"])
+            elif match_function == "url_semantic_match":
+                score = await URLEvaluator.url_semantic_match(url, reference_answer, evaluate["key"])
+            elif match_function == "element_path_exactly_match":
+                score = ElementEvaluator.path_exact_match(
+                    input_path, reference_answer, evaluate["method"], html_content, input_netloc,
+                    evaluate["netloc"])
+            elif match_function.startswith("element_value") and input_path is not None \
+                    and element_value is not None:
+                if match_function.endswith("semantic_match") and len(element_value) == 0:
+                    score = 0
+                elif "path" in evaluate and ElementEvaluator.path_exact_match(
+                        input_path, evaluate["path"], "selector", html_content, input_netloc,
+                        evaluate["netloc"]) == 0:
+                    score = 0
+                elif match_function == "element_value_exactly_match":
+                    score = ElementEvaluator.element_value_exact_match(
+                        element_value, reference_answer, input_netloc, evaluate["netloc"])
+                elif match_function == "element_value_included_match":
+                    score = ElementEvaluator.element_value_include_match(
+                        element_value, reference_answer, input_netloc, evaluate["netloc"])
+                elif match_function == "element_value_semantic_match":
+                    score = await ElementEvaluator.element_value_semantic_match(
+                        element_value, reference_answer, input_netloc, evaluate["netloc"])
+            elif match_function.startswith(("cache_data", "final_answer")) \
+                    and text_content is not None and text_content != "":
+                if match_function.endswith("exact_match"):
+                    score = TextEvaluator.text_exact_match(text_content, reference_answer)
+                elif match_function.endswith("included_match"):
+                    score = TextEvaluator.text_included_match(text_content, reference_answer)
+                else:
+                    score = await MatchFunction.semantic_match(text_content, reference_answer)
+            evaluate["score"] = max(evaluate["score"], score)
+    return [evaluate["score"] for evaluate in evaluate_steps]
+
+
+async def plan_step_evaluate(plan, url, html_content, input_path=None, element_value=None, text_content=None):
+    async def get_html_content():
+        return html_content
+
+    await plan.evaluate(StepInputs(url, input_path, element_value, text_content, get_html_content))
+    return [evaluate["score"] for evaluate in plan.evaluate_steps]
+
+
+@pytest.fixture(autouse=True)
+def semantic_match(monkeypatch):
+    monkeypatch.setattr(MatchFunction, "semantic_match", staticmethod(fake_semantic_match))
+
+
+@pytest.mark.parametrize("url", URLS)
+@pytest.mark.parametrize("path", PATHS)
+@pytest.mark.parametrize("text_content", TEXTS)
+def test_step_scores_match_the_baseline(url, path, text_content):
+    input_path, element_value = path
+    expected = asyncio.run(baseline_step_evaluate(
+        url, PAGE, copy.deepcopy(RUBRIC), input_path, element_value, text_content))
+    plan = compile_evaluation_plan(copy.deepcopy(RUBRIC))
+    assert asyncio.run(plan_step_evaluate(
+        plan, url, PAGE, input_path, element_value, text_content)) == expected
+
+
+def test_scores_accumulate_over_steps_like_the_baseline():
+    baseline_rubric = copy.deepcopy(RUBRIC)
+    plan = compile_evaluation_plan(copy.deepcopy(RUBRIC))
+    for url, (input_path, element_value), text_content in itertools.islice(
+            itertools.product(URLS, PATHS, TEXTS), 0, None, 7):
+        expected = asyncio.run(baseline_step_evaluate(
+            url, PAGE, baseline_rubric, input_path, element_value, text_content))
+        assert asyncio.run(plan_step_evaluate(
+            plan, url, PAGE, input_path, element_value, text_content)) == expected
+
+
+def test_page_html_is_fetched_once_and_only_when_needed():
+    calls = []
+
+    async def get_html_content():
+        calls.append(1)
+        return PAGE
+
+    async def step(plan, input_path):
+        await plan.evaluate(StepInputs(URLS[0], input_path, "red shoes", None, get_html_content))
+
+    url_plan = compile_evaluation_plan(copy.deepcopy(RUBRIC[:4]))
+    asyncio.run(step(url_plan, "#search input"))
+    assert calls == []
+    asyncio.run(step(compile_evaluation_plan(copy.deepcopy(RUBRIC)), None))
+    assert calls == []
+    asyncio.run(step(compile_evaluation_plan(copy.deepcopy(RUBRIC)), "#search input"))
+    assert calls == [1]
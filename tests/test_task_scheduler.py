@@ -0,0 +1,71 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from evaluate import task_scheduler
+from evaluate.task_scheduler import (
+    OrderedResultWriter, TaskScheduler, completed_task_indices, write_json_atomic)
+
+
+@pytest.fixture
+def written(monkeypatch):
+    """Paths in the order OrderedResultWriter writes them"""
+    paths = []
+    monkeypatch.setattr(task_scheduler, "write_json_atomic", lambda path, result: paths.append(path))
+    return paths
+
+
+def test_results_are_written_in_task_order(written):
+    writer = OrderedResultWriter([3, 4, 5, 6])
+    writer.write(5, "5.json", {})
+    writer.write(4, "4.json", {})
+    assert written == []
+    writer.write(3, "3.json", {})
+    assert written == ["3.json", "4.json", "5.json"]
+    writer.write(6, "6.json", {})
+    assert written == ["3.json", "4.json", "5.json", "6.json"]
+
+
+def test_finished_task_without_result_releases_later_ones(written):
+    writer = OrderedResultWriter([0, 1, 2])
+    writer.write(2, "2.json", {})
+    writer.write(0, "0.json", {})
+    assert written == ["0.json"]
+    writer.finish(1)
+    assert written == ["0.json", "2.json"]
+
+
+def test_scheduler_writes_in_order_when_tasks_finish_out_of_order(written):
+    durations = {0: 0.05, 1: 0.0, 2: 0.03, 3: 0.01, 4: 0.02}
+    finished = []
+    running = []
+    peak = []
+
+    async def run_one(task_index):
+        running.append(task_index)
+        peak.append(len(running))
+        await asyncio.sleep(durations[task_index])
+        running.remove(task_index)
+        finished.append(task_index)
+        if task_index == 3:
+            raise RuntimeError("task failed")
+        writer.write(task_index, f"{task_index}.json", {})
+
+    writer = OrderedResultWriter(durations)
+    asyncio.run(TaskScheduler(max_concurrent_tasks=3).run(list(durations), run_one, writer))
+    assert finished != sorted(finished)
+    assert max(peak) == 3
+    assert written == ["0.json", "1.json", "2.json", "4.json"]
+
+
+def test_atomic_write_and_resume(tmp_path):
+    folder = tmp_path / "results"
+    write_json_atomic(str(folder / "7_abc.json"), {"score": 1})
+    write_json_atomic(str(folder / "12_def.json"), {"score": 0})
+    (folder / "notes.txt").write_text("")
+    assert json.loads((folder / "7_abc.json").read_text()) == {"score": 1}
+    assert not [name for name in os.listdir(folder) if name.endswith(".tmp")]
+    assert completed_task_indices(str(folder)) == {7, 12}
+    assert completed_task_indices(str(tmp_path / "missing")) == set()
@@ -0,0 +1,47 @@
+import random
+
+from agent.LLM.tokenizer import SEGMENT_PATTERN, Tokenizer
+
+
+OBSERVATION = "".join(
+    f"{'  ' * (i % 6)}[{i}] {('link', 'button', 'option')[i % 3]} 'Result {i} for \"shoes\"'\n"
+    for i in range(200))
+
+PROMPT_PIECES = ["\n", "\n\n", "\r\n", " ", "  ", "\t", "  \n", "\n/", "/", "[12]", " link", "'Go'",
+                 "abc", "Abc", "123", "x", "'", ".", "'s", "été", "=>"]
+
+
+def random_texts(count: int = 2000):
+    rng = random.Random(0)
+    for _ in range(count):
+        yield "".join(rng.choice(PROMPT_PIECES) for _ in range(rng.randint(0, 60)))
+
+
+def test_segment_sums_equal_whole_counts(encoding):
+    for text in random_texts():
+        segments = SEGMENT_PATTERN.split(text)
+        assert sum(len(encoding.encode(segment)) for segment in segments) == \
+            len(encoding.encode(text)), repr(text)
+
+
+def test_count_equals_encode(encoding):
+    counter = Tokenizer("model")
+    assert counter.segmented
+    for text in [OBSERVATION, OBSERVATION + "\n/next step\r\n  done  \n", *random_texts(200)]:
+        assert counter.count(text) == len(encoding.encode(text)), repr(text)
+
+
+def test_unchanged_segments_come_from_the_cache(encoding):
+    counter = Tokenizer("model")
+    counter.count(OBSERVATION)
+    misses = counter.stats["misses"]
+    changed = OBSERVATION.replace("[7] button", "[7] link") + "[200] link 'new'\n"
+    assert counter.count(changed) == len(encoding.encode(changed))
+    assert counter.stats["misses"] - misses == 1
+    assert counter.stats["hits"] > 100
+
+
+def test_cache_is_bounded(encoding):
+    counter = Tokenizer("model", cache_size=10)
+    counter.count(OBSERVATION)
+    assert len(counter.segment_counts) == 10